@@ -1,6 +1,8 @@
 # __init__.py
 # Initialize the Flask application
 
+import os
+
 from flask import Flask
 
 def create_app():
@@ -17,15 +19,96 @@ def create_app():
     app.config['SECRET_KEY'] = 'your_secret_key'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quiz_master.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_READ_URI'] = None  # Replica for read-only routes; None reads the primary file
+    app.config['EXPORT_FOLDER'] = os.path.join(app.instance_path, 'exports')
+    app.config['JOB_WORKERS'] = 2  # Background job threads per process
+    app.config['JOB_POLL_INTERVAL'] = 5  # Seconds between checks for jobs queued elsewhere
+    app.config['JOB_LEASE_SECONDS'] = 120  # A running job with no heartbeat for this long is requeued
+    app.config['SCORE_ARCHIVE_AFTER_DAYS'] = 365  # Age at which archive-scores moves scores out of the score table
+    app.config['TENANT_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'tenants', '{tenant}.db')  # New tenant databases
+    app.config['TENANT_HOST_SUFFIX'] = None  # e.g. '.quizmaster.example.com' to serve tenants from subdomains
+    app.config['TENANT_PATH_PREFIX'] = '/t'  # Tenants are also served under /t/<slug>/
+    app.config['TENANT_ENGINE_CACHE_SIZE'] = 32  # Tenant databases each worker keeps engines open for
+    app.config['RATE_LIMITS'] = {  # Per-user burst and refill rate, and concurrent requests per worker
+        'login': {'burst': 10, 'per_second': 0.2, 'concurrency': 8, 'methods': ['POST']},
+        'start_quiz': {'burst': 10, 'per_second': 1, 'concurrency': 16},
+        'quiz_questions': {'burst': 10, 'per_second': 1, 'concurrency': 32},
+        'submit_quiz': {'burst': 5, 'per_second': 0.5, 'concurrency': 16},
+        'save_answers': {'burst': 10, 'per_second': 0.5, 'concurrency': 32},
+    }
+    app.config['RATE_LIMIT_QUEUE_SECONDS'] = 0.5  # Longest wait for a token or a free slot before 429/503
+    app.config['RATE_LIMIT_STORAGE_URI'] = None  # SQLite URI to share rate limits between workers
+    app.config['QUIZ_SUBMIT_GRACE_SECONDS'] = 60  # How late an attempt's answers are still counted
+    app.config['TEMPLATE_CACHE_FOLDER'] = os.path.join(app.instance_path, 'jinja_cache')  # Compiled templates shared by workers; None to disable
+    app.config['TEMPLATE_WARMUP'] = False  # Load every template at startup instead of on first use
+    app.config['PREWARM_LEAD_MINUTES'] = 10  # Load each quiz's caches this long before it opens; 0 to turn off
+    app.config['PREWARM_CHECK_SECONDS'] = 30  # Seconds between looks for quizzes coming up
+    app.config['BACKUP_FOLDER'] = os.path.join(app.instance_path, 'backups')  # Online backups of the database
+    app.config['BACKUP_INTERVAL_HOURS'] = 24  # Back up this often in the background; 0 to turn off
+    app.config['BACKUP_KEEP'] = 7  # Newest backups kept; older ones are deleted
+    app.config['BACKUP_PAGES_PER_STEP'] = 1000  # Pages copied per step of a backup
+    app.config['BACKUP_STEP_SLEEP'] = 0.01  # Pause between steps, in seconds
+    app.config['PROVISION_FOLDER'] = os.path.join(app.instance_path, 'provisioning')  # Uploaded user files waiting for their job
+    app.config['PROVISION_WORKERS'] = None  # Processes hashing passwords during bulk provisioning; None for one per CPU, 0 for none
+    app.config['CACHE_CHECK_INTERVAL'] = 0  # Seconds between checks for cache changes made by other workers; 0 checks every request
+    app.config['AUTOSAVE_INTERVAL_SECONDS'] = 10  # Seconds between answer saves from the quiz page
+    app.config['AUTOSAVE_FLUSH_SECONDS'] = 2  # Seconds saved answers wait in memory before they are written; under QUIZ_SUBMIT_GRACE_SECONDS
+    app.config['AUTOSAVE_BATCH_SIZE'] = 500  # Attempts with answers waiting that trigger an early write
     
-    # Initialize the database with the app
+    # Initialize the database with the app, with a separate engine for read-only routes
+    # and a database per tenant
+    import db_routing
+    import tenants
     from extensions import db
+    db_routing.configure(app)
+    tenants.configure(app)
     db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    
+    # Drop cached entries other workers changed, before each request
+    import coherence
+    coherence.init_app(app)
+    
+    # Let db.create_all() add new model columns, build the search index and backfill
+    # rollups and quiz durations
+    import schema  # noqa: F401
+    import search  # noqa: F401
+    import rollups  # noqa: F401
+    import schedule  # noqa: F401
+    
+    # Rate limits for the login and quiz routes
+    import ratelimit
+    ratelimit.init_app(app)
     
     # Import and register routes within app context
     from routes import register_routes
     register_routes(app)
     
+    # Compiled template cache and startup warm-up, once the routes exist
+    import warmup
+    warmup.init_app(app)
+    
+    # Caches of upcoming quizzes, loaded before they open
+    import prewarm
+    prewarm.init_app(app)
+    
+    # Background job runner (threads start with the first request)
+    import jobs
+    jobs.init_app(app)
+    
+    # Autosaved answers, written in batches
+    import autosave
+    autosave.init_app(app)
+    
+    # Scheduled backups
+    import backup
+    backup.init_app(app)
+    
+    # Register CLI commands (flask <command>)
+    import commands
+    commands.init_app(app)
+    
     return app
 
 # Create the app instance
@@ -0,0 +1,215 @@
+# analytics.py
+# Score distribution analytics for the admin summary
+# Each quiz's score percentages are loaded once into contiguous NumPy arrays
+# and every statistic is computed in vectorized form. Results are cached per
+# quiz and dropped when a new score is submitted for that quiz.
+
+import itertools
+import threading
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+
+from extensions import db
+from models import Subject, Chapter, Quiz
+import archive
+import coherence
+import tenants
+
+# Percentage needed to pass a quiz
+PASS_MARK = 40.0
+
+# Histogram buckets: 0-10%, 10-20%, ..., 90-100% (the last bucket includes 100%)
+HISTOGRAM_BINS = np.linspace(0.0, 100.0, 11)
+
+QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+
+# (tenant slug, quiz_id) -> QuizScores
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class QuizScores:
+    """Score percentages and attempt times of one quiz, as NumPy arrays"""
+
+    __slots__ = ('quiz_id', 'percentages', 'timestamps', '_stats')
+
+    def __init__(self, quiz_id, percentages, timestamps):
+        self.quiz_id = quiz_id
+        self.percentages = percentages  # float64 array of score percentages
+        self.timestamps = timestamps  # datetime64[s] array of attempt times
+        self._stats = None
+
+    @property
+    def stats(self):
+        """Distribution statistics, computed on first use"""
+        if self._stats is None:
+            self._stats = describe(self.percentages, self.timestamps)
+        return self._stats
+
+
+def load_quiz_scores(quiz_id):
+    """
+    Read a quiz's scores straight into NumPy arrays.
+
+    Args:
+        quiz_id: ID of the quiz
+
+    Returns:
+        QuizScores with one entry per attempt
+    """
+    # Archived scores still count towards the distribution
+    scores = archive.all_scores('quiz_id', 'score', 'total_questions', 'timestamp')
+    stmt = (select(scores.c.score, scores.c.total_questions,
+                   cast(func.strftime('%s', scores.c.timestamp), Integer))
+            .where(scores.c.quiz_id == quiz_id))
+    # np.fromiter over the flattened rows avoids building a list of Row objects,
+    # which np.array converts one element at a time
+    rows = db.session.execute(stmt)
+    data = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64).reshape(-1, 3)
+    scores, totals, seconds = data[:, 0], data[:, 1], data[:, 2]
+    percentages = np.divide(scores * 100.0, totals, out=np.zeros(len(data)), where=totals > 0)
+    return QuizScores(quiz_id, percentages, seconds.astype('datetime64[s]'))
+
+
+def get_quiz_scores(quiz_id):
+    """Return the cached QuizScores for a quiz, loading it on first use"""
+    key = (tenants.current(), quiz_id)
+    entry = _cache.get(key)
+    if entry is None:
+        with coherence.loading(coherence.SCORES, quiz_id) as load:
+            entry = load_quiz_scores(quiz_id)
+            with _cache_lock:
+                if load.current:
+                    _cache[key] = entry
+    return entry
+
+
+def invalidate_quiz(quiz_id=None):
+    """
+    Drop cached analytics for a quiz, e.g. after a new submission. Called by
+    coherence.py in every worker.
+
+    Args:
+        quiz_id: ID of the quiz, or None to clear the tenant's whole cache
+    """
+    tenant = tenants.current()
+    with _cache_lock:
+        if quiz_id is None:
+            for key in [key for key in _cache if key[0] == tenant]:
+                del _cache[key]
+        else:
+            _cache.pop((tenant, quiz_id), None)
+
+
+coherence.register(coherence.SCORES, invalidate_quiz)
+
+
+def describe(percentages, timestamps):
+    """
+    Compute the distribution statistics for an array of score percentages.
+
+    Args:
+        percentages: float64 array of score percentages
+        timestamps: datetime64 array of attempt times, aligned with percentages
+
+    Returns:
+        Dict with count, mean, median, std, min, max, quantiles, pass_rate,
+        histogram and a monthly trend
+    """
+    count = int(percentages.size)
+    if count == 0:
+        return {
+            'count': 0, 'mean': 0.0, 'median': 0.0, 'std': 0.0, 'min': 0.0, 'max': 0.0,
+            'quantiles': {q: 0.0 for q in QUANTILES}, 'pass_rate': 0.0,
+            'histogram': [0] * (len(HISTOGRAM_BINS) - 1), 'trend': {'labels': [], 'counts': [], 'means': []},
+        }
+
+    quantile_values = np.quantile(percentages, QUANTILES)
+    histogram, _ = np.histogram(percentages, bins=HISTOGRAM_BINS)
+
+    return {
+        'count': count,
+        'mean': float(percentages.mean()),
+        'median': float(quantile_values[QUANTILES.index(0.50)]),
+        'std': float(percentages.std()),
+        'min': float(percentages.min()),
+        'max': float(percentages.max()),
+        'quantiles': dict(zip(QUANTILES, quantile_values.tolist())),
+        'pass_rate': float(np.count_nonzero(percentages >= PASS_MARK) * 100.0 / count),
+        'histogram': histogram.tolist(),
+        'trend': monthly_trend(percentages, timestamps),
+    }
+
+
+def monthly_trend(percentages, timestamps):
+    """
+    Attempts and mean percentage per calendar month, in date order.
+
+    Returns:
+        Dict with labels ("Jan 2024"), counts and means lists
+    """
+    if percentages.size == 0:
+        return {'labels': [], 'counts': [], 'means': []}
+
+    months, month_index = np.unique(timestamps.astype('datetime64[M]'), return_inverse=True)
+    counts = np.bincount(month_index)
+    sums = np.bincount(month_index, weights=percentages)
+    labels = [month.item().strftime('%b %Y') for month in months]
+    return {'labels': labels, 'counts': counts.tolist(), 'means': np.round(sums / counts, 1).tolist()}
+
+
+def subject_quiz_ids():
+    """
+    Map each subject to its quiz ids with one query.
+
+    Returns:
+        Dict of subject name -> list of quiz ids, in subject order
+    """
+    rows = db.session.execute(
+        select(Subject.id, Subject.name, Quiz.id)
+        .select_from(Subject)
+        .outerjoin(Chapter, Chapter.subject_id == Subject.id)
+        .outerjoin(Quiz, Quiz.chapter_id == Chapter.id)
+        .order_by(Subject.id, Quiz.id)
+    ).all()
+
+    subjects = {}
+    for _, subject_name, quiz_id in rows:
+        quiz_ids = subjects.setdefault(subject_name, [])
+        if quiz_id is not None:
+            quiz_ids.append(quiz_id)
+    return subjects
+
+
+def _combine(quiz_ids):
+    """Concatenate the cached arrays of several quizzes"""
+    entries = [get_quiz_scores(quiz_id) for quiz_id in quiz_ids]
+    if not entries:
+        return np.zeros(0), np.zeros(0, dtype='datetime64[s]')
+    return (np.concatenate([entry.percentages for entry in entries]),
+            np.concatenate([entry.timestamps for entry in entries]))
+
+
+def admin_summary():
+    """
+    Build everything the admin summary page shows.
+
+    Returns:
+        Dict with per-subject stats (subjects), overall stats (overall) and
+        per-quiz stats (quizzes, only quizzes that have attempts)
+    """
+    subjects = {}
+    quizzes = []
+    all_quiz_ids = []
+    for subject_name, quiz_ids in subject_quiz_ids().items():
+        percentages, timestamps = _combine(quiz_ids)
+        subjects[subject_name] = describe(percentages, timestamps)
+        all_quiz_ids.extend(quiz_ids)
+        for quiz_id in quiz_ids:
+            stats = get_quiz_scores(quiz_id).stats
+            if stats['count']:
+                quizzes.append({'quiz_id': quiz_id, 'subject': subject_name, **stats})
+
+    percentages, timestamps = _combine(all_quiz_ids)
+    return {'subjects': subjects, 'overall': describe(percentages, timestamps), 'quizzes': quizzes}
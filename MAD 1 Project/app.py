@@ -39,15 +39,174 @@ def create_app():
     # This turns off a feature we don't need that would slow down our app
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  
     
+    # Folder where background exports of quiz results are written
+    app.config['EXPORT_FOLDER'] = os.path.join(app.instance_path, 'exports')
+    
+    # Background jobs (exports, rebuilds) run on this many threads per process,
+    # and each process checks for jobs queued by other processes this often (seconds)
+    app.config['JOB_WORKERS'] = 2
+    app.config['JOB_POLL_INTERVAL'] = 5
+    
+    # A running job's process records a heartbeat every quarter of this many
+    # seconds; a job whose heartbeat is older was lost with its process (killed
+    # or restarted mid-run) and is requeued, or failed once out of attempts
+    app.config['JOB_LEASE_SECONDS'] = 120
+    
+    # Scores older than this many days are moved to the archive table by
+    # "archive-scores" so the score table and its indexes stay small
+    app.config['SCORE_ARCHIVE_AFTER_DAYS'] = 365
+    
+    # Read-only routes (summaries, listings, exports) use a separate engine so
+    # they don't compete with quiz submissions. Leave this as None to read the
+    # same SQLite file through read-only connections, or set a replica URL
+    app.config['SQLALCHEMY_READ_URI'] = None
+    
+    # Each tenant (institution) can have its own database, listed in the tenant
+    # table. Tenants are reached through a subdomain ending in TENANT_HOST_SUFFIX
+    # (e.g. acme.quizmaster.example.com) or a path prefix (/t/acme/). Requests
+    # without a tenant use the default database above. Each worker keeps engines
+    # open for at most TENANT_ENGINE_CACHE_SIZE tenants
+    app.config['TENANT_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'tenants', '{tenant}.db')
+    app.config['TENANT_HOST_SUFFIX'] = None
+    app.config['TENANT_PATH_PREFIX'] = '/t'
+    app.config['TENANT_ENGINE_CACHE_SIZE'] = 32
+    
+    # Rate limits for login and quiz taking. Each user (or client IP before
+    # login) can make "burst" requests back to back, then "per_second" more
+    # per second; "concurrency" caps requests running at once per worker.
+    # Requests wait up to RATE_LIMIT_QUEUE_SECONDS before getting a 429 (too
+    # fast) or 503 (too busy) with a Retry-After header. Limits are kept in
+    # each worker's memory unless RATE_LIMIT_STORAGE_URI names a SQLite
+    # database to share them, e.g. 'sqlite:///' + os.path.join(app.instance_path, 'ratelimit.db')
+    app.config['RATE_LIMITS'] = {
+        'login': {'burst': 10, 'per_second': 0.2, 'concurrency': 8, 'methods': ['POST']},
+        'start_quiz': {'burst': 10, 'per_second': 1, 'concurrency': 16},
+        'quiz_questions': {'burst': 10, 'per_second': 1, 'concurrency': 32},
+        'submit_quiz': {'burst': 5, 'per_second': 0.5, 'concurrency': 16},
+        'save_answers': {'burst': 10, 'per_second': 0.5, 'concurrency': 32},
+    }
+    app.config['RATE_LIMIT_QUEUE_SECONDS'] = 0.5
+    app.config['RATE_LIMIT_STORAGE_URI'] = None
+    
+    # Quiz attempts end when their duration runs out or the quiz closes. The
+    # browser submits automatically at that point; answers arriving more than
+    # QUIZ_SUBMIT_GRACE_SECONDS later are not counted
+    app.config['QUIZ_SUBMIT_GRACE_SECONDS'] = 60
+    
+    # Jinja compiles each template the first time it is rendered. The compiled
+    # bytecode is saved in TEMPLATE_CACHE_FOLDER so new workers load it instead
+    # of compiling again (None turns the cache off). TEMPLATE_WARMUP makes each
+    # worker load every template at startup, so no request pays for it
+    app.config['TEMPLATE_CACHE_FOLDER'] = os.path.join(app.instance_path, 'jinja_cache')
+    app.config['TEMPLATE_WARMUP'] = False
+    
+    # Each worker loads the caches a quiz needs (its questions, answer key and
+    # payload, the catalog and the quiz pages) PREWARM_LEAD_MINUTES before the
+    # quiz opens, so the first students don't wait on cold caches (0 turns it
+    # off). It looks for quizzes coming up every PREWARM_CHECK_SECONDS
+    app.config['PREWARM_LEAD_MINUTES'] = 10
+    app.config['PREWARM_CHECK_SECONDS'] = 30
+    
+    # Online backups of the database go in BACKUP_FOLDER. A background job
+    # makes one every BACKUP_INTERVAL_HOURS (0 turns it off) and keeps the
+    # newest BACKUP_KEEP. The copy is made BACKUP_PAGES_PER_STEP pages at a
+    # time with a pause of BACKUP_STEP_SLEEP seconds in between, so it doesn't
+    # slow down quiz submissions while it runs
+    app.config['BACKUP_FOLDER'] = os.path.join(app.instance_path, 'backups')
+    app.config['BACKUP_INTERVAL_HOURS'] = 24
+    app.config['BACKUP_KEEP'] = 7
+    app.config['BACKUP_PAGES_PER_STEP'] = 1000
+    app.config['BACKUP_STEP_SLEEP'] = 0.01
+    
+    # Bulk provisioning creates users from an uploaded CSV or JSON file. The
+    # file waits in PROVISION_FOLDER until its background job runs, and the
+    # passwords are hashed on PROVISION_WORKERS processes (None for one per
+    # CPU, 0 to hash them in the job's own thread)
+    app.config['PROVISION_FOLDER'] = os.path.join(app.instance_path, 'provisioning')
+    app.config['PROVISION_WORKERS'] = None
+    
+    # Each worker caches the quiz catalog, question pools, analytics and
+    # recommendations in memory. Changes are recorded in the cache_version
+    # table, and a worker looks for changes made by other workers before each
+    # request, or at most every CACHE_CHECK_INTERVAL seconds if it is set. A
+    # worker never serves a cached entry that changed longer ago than that
+    app.config['CACHE_CHECK_INTERVAL'] = 0
+    
+    # The quiz page saves changed answers every AUTOSAVE_INTERVAL_SECONDS.
+    # Each worker keeps them in memory and writes them all in one transaction
+    # every AUTOSAVE_FLUSH_SECONDS, or as soon as AUTOSAVE_BATCH_SIZE attempts
+    # have changes waiting, so saves don't cost a write each. The flush interval
+    # must be shorter than QUIZ_SUBMIT_GRACE_SECONDS, so a late submission to
+    # any worker finds every answer saved in time already written
+    app.config['AUTOSAVE_INTERVAL_SECONDS'] = 10
+    app.config['AUTOSAVE_FLUSH_SECONDS'] = 2
+    app.config['AUTOSAVE_BATCH_SIZE'] = 500
+    
     # Initialize the database with the app
     # This connects our SQLAlchemy instance to this specific Flask app
+    # db_routing adds the read engine and switches SQLite to WAL mode, and
+    # tenants adds the tenant registry and picks each request's tenant database
+    import db_routing
+    import tenants
+    db_routing.configure(app)
+    tenants.configure(app)
     db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    
+    # Keep this worker's caches in step with the other workers
+    # (this goes after tenants, so each request checks its own tenant's database)
+    import coherence
+    coherence.init_app(app)
+    
+    # Let db.create_all() add columns that were added to the models since the
+    # database was created, and create the full-text search index along with
+    # the triggers that keep it in sync with the tables, and fill the daily
+    # rollups from existing scores the first time their tables are created, and
+    # fill in quiz durations in seconds from their HH:MM text
+    import schema  # noqa: F401
+    import search  # noqa: F401
+    import rollups  # noqa: F401
+    import schedule  # noqa: F401
+    
+    # Set up rate limiting for the login and quiz routes
+    import ratelimit
+    ratelimit.init_app(app)
     
     # Import and register routes
     # Routes define what happens when a user visits different URLs in our app
     from routes import register_routes
     register_routes(app)
     
+    # Set up the compiled template cache and warm-up
+    # This goes after the routes, as the warm-up also builds the URL map
+    import warmup
+    warmup.init_app(app)
+    
+    # Warm up the caches of each quiz before it opens
+    # (the thread starts with the worker's first request)
+    import prewarm
+    prewarm.init_app(app)
+    
+    # Set up the background job runner
+    # Its threads only start with the first request, so CLI commands don't start them
+    import jobs
+    jobs.init_app(app)
+    
+    # Write autosaved answers in batches
+    # (the flusher thread also starts with the first request)
+    import autosave
+    autosave.init_app(app)
+    
+    # Schedule regular backups of the database
+    # (they run as background jobs, so they start along with the job runner)
+    import backup
+    backup.init_app(app)
+    
+    # Register CLI commands so they can be run with "flask <command>"
+    import commands
+    commands.init_app(app)
+    
     # Return the fully configured app
     return app
 
@@ -0,0 +1,166 @@
+# archive.py
+# Score archival
+# Scores older than a cutoff are moved from the hot score table into
+# score_archive, so the score table and its indexes only hold recent terms.
+# Archived scores still count everywhere totals are shown: the daily rollups
+# keep their contribution, analytics and exports read both tables, and a
+# user's score history pages into the archive after their recent scores.
+#
+# A user can take a quiz once, so whether they have done so is checked against
+# both tables (see attempted()).
+#
+# Archival always takes the oldest scores and restore brings back the newest
+# archived ones, so every archived score is older than every hot score.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, func, insert, literal, or_, select, union, union_all
+
+from extensions import db
+from models import Score, ArchivedScore
+import listings
+
+# Default age at which scores are archived
+ARCHIVE_AFTER_DAYS = 365
+
+# Scores moved per transaction, so submissions are never blocked for long
+BATCH_SIZE = 5000
+
+# Scores shown per page in a user's history
+PER_PAGE = 20
+
+_SCORE_FIELDS = ('quiz_id', 'user_id', 'score', 'total_questions', 'timestamp')
+
+
+def default_cutoff(days=ARCHIVE_AFTER_DAYS):
+    """Start of the day `days` ago; scores before it are archived"""
+    return (datetime.now() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_scores(cutoff, batch_size=BATCH_SIZE):
+    """
+    Move scores taken before the cutoff into the archive, oldest first.
+    Each batch is copied and deleted in one transaction.
+
+    Args:
+        cutoff: datetime; scores with an earlier timestamp are archived
+
+    Returns:
+        Number of scores archived
+    """
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            select(Score.id).where(Score.timestamp < cutoff).order_by(Score.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return moved
+        now = datetime.now()
+        db.session.execute(insert(ArchivedScore).from_select(
+            ['score_id', *_SCORE_FIELDS, 'archived_at'],
+            select(Score.id, *(getattr(Score, field) for field in _SCORE_FIELDS), literal(now))
+            .where(Score.id.in_(ids))
+        ))
+        db.session.execute(delete(Score).where(Score.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+
+
+def restore_scores(since, batch_size=BATCH_SIZE):
+    """
+    Move archived scores taken on or after `since` back into the score table.
+    Restored scores get new ids in the score table.
+
+    Returns:
+        Number of scores restored
+    """
+    restored = 0
+    while True:
+        ids = db.session.execute(
+            select(ArchivedScore.id).where(ArchivedScore.timestamp >= since)
+            .order_by(ArchivedScore.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return restored
+        db.session.execute(insert(Score).from_select(
+            list(_SCORE_FIELDS),
+            select(*(getattr(ArchivedScore, field) for field in _SCORE_FIELDS))
+            .where(ArchivedScore.id.in_(ids)).order_by(ArchivedScore.timestamp)
+        ))
+        db.session.execute(delete(ArchivedScore).where(ArchivedScore.id.in_(ids)))
+        db.session.commit()
+        restored += len(ids)
+
+
+def all_scores(*columns):
+    """
+    Select the given field names from the score and archive tables together.
+
+    Returns:
+        Subquery with those columns over every score, hot or archived
+    """
+    return union_all(
+        select(*(getattr(Score, column) for column in columns)),
+        select(*(getattr(ArchivedScore, column) for column in columns)),
+    ).subquery()
+
+
+def delete_quiz_scores(quiz_ids):
+    """Delete the archived scores of quizzes that are being deleted"""
+    ArchivedScore.query.filter(ArchivedScore.quiz_id.in_(quiz_ids)).delete(synchronize_session=False)
+
+
+def attempted(user_id, quiz_id):
+    """
+    SQL condition: the user has a score for the quiz, in the score table or the
+    archive. quiz_id is a quiz id or a column, e.g. Quiz.id to filter quizzes.
+    """
+    return or_(exists().where(Score.user_id == user_id, Score.quiz_id == quiz_id),
+               exists().where(ArchivedScore.user_id == user_id, ArchivedScore.quiz_id == quiz_id))
+
+
+def has_attempted(user_id, quiz_id):
+    """Whether the user already has a score, hot or archived, for the quiz"""
+    return db.session.execute(select(attempted(user_id, quiz_id))).scalar()
+
+
+def attempted_quiz_ids(user_id, quiz_ids):
+    """Which of the given quizzes the user has a score for, hot or archived"""
+    if not quiz_ids:
+        return set()
+    return set(db.session.execute(union(
+        select(Score.quiz_id).where(Score.user_id == user_id, Score.quiz_id.in_(quiz_ids)),
+        select(ArchivedScore.quiz_id).where(ArchivedScore.user_id == user_id, ArchivedScore.quiz_id.in_(quiz_ids)),
+    )).scalars())
+
+
+def user_score_page(user_id, page=1, per_page=PER_PAGE):
+    """
+    One page of a user's score history, newest first.
+    Recent scores come from the score table; the archive is only queried
+    once the page reaches past them.
+
+    Returns:
+        Tuple of (scores, total) where scores are listings.ScoreRow
+    """
+    hot_total = db.session.execute(
+        select(func.count()).select_from(Score).where(Score.user_id == user_id)).scalar()
+    archived_total = db.session.execute(
+        select(func.count()).select_from(ArchivedScore).where(ArchivedScore.user_id == user_id)).scalar()
+
+    offset = (page - 1) * per_page
+    scores = []
+    if offset < hot_total:
+        scores = listings.score_rows(Score, user_id, offset, per_page)
+    remaining = per_page - len(scores)
+    if remaining > 0 and archived_total:
+        scores += listings.score_rows(ArchivedScore, user_id, max(0, offset - hot_total), remaining)
+    return scores, hot_total + archived_total
+
+
+def archive_counts():
+    """Number of hot and archived scores"""
+    return {
+        'hot': db.session.execute(select(func.count()).select_from(Score)).scalar(),
+        'archived': db.session.execute(select(func.count()).select_from(ArchivedScore)).scalar(),
+    }
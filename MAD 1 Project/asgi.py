@@ -0,0 +1,180 @@
+# asgi.py
+# ASGI entry point for serving exams with many concurrent connections
+#
+#     uvicorn --factory asgi:create_application --workers 4
+#
+# The quiz-taking endpoints (ASYNC_ENDPOINTS) are served on the event loop.
+# Their request body is read without holding a thread, so a slow mobile upload
+# or a client waiting on a response costs a coroutine instead of a worker
+# thread. The same Flask view then runs through async_db.run(), with its
+# queries on async engines (aiosqlite), so the loop serves other requests while
+# one waits on the database. Every other route runs on a thread pool through
+# asgiref's WSGI adapter, as under a WSGI server. Sessions, flashes, tenants
+# and rate limits behave the same either way, since the Flask app handles both.
+#
+# Needs: pip install -r requirements-asgi.txt (at the repository root)
+
+import io
+import sys
+
+from werkzeug.exceptions import HTTPException
+
+import async_db
+import tenants
+
+# Endpoints served on the event loop
+ASYNC_ENDPOINTS = frozenset({'start_quiz', 'submit_quiz', 'save_answers', 'quiz_questions', 'get_chapters'})
+
+
+class ClientDisconnected(Exception):
+    """The client went away before sending its whole request"""
+
+
+class QuizMasterASGI:
+    """ASGI application serving a Flask app, with ASYNC_ENDPOINTS on the event loop"""
+
+    def __init__(self, app, async_endpoints=ASYNC_ENDPOINTS):
+        from asgiref.wsgi import WsgiToAsgi
+
+        self.app = app
+        self.async_endpoints = frozenset(async_endpoints)
+        self.wsgi = WsgiToAsgi(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and self.endpoint(scope) in self.async_endpoints:
+            await self._serve_async(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    def endpoint(self, scope):
+        """Name of the Flask endpoint a request goes to, or None"""
+        environ = build_environ(scope, io.BytesIO())
+        if isinstance(self.app.wsgi_app, tenants.TenantMiddleware):
+            # Strip the tenant path prefix, as the middleware will
+            self.app.wsgi_app.resolve(environ)
+        adapter = self.app.url_map.bind_to_environ(environ, server_name=self.app.config.get('SERVER_NAME'))
+        try:
+            return adapter.match()[0]
+        except HTTPException:
+            return None
+
+    async def _serve_async(self, scope, receive, send):
+        try:
+            body = await read_body(receive, self.app.config.get('MAX_CONTENT_LENGTH'))
+        except ClientDisconnected:
+            return
+        if body is None:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Request body too large'})
+            return
+
+        status, headers, content = await async_db.run(self._call_app, build_environ(scope, body))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                                for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def _call_app(self, environ):
+        """Run the WSGI app for one request (inside async_db.run) and collect its response"""
+        response = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+            return chunks.append
+
+        # The request runs in this app context, so it gets the async db.session
+        with self.app.app_context():
+            async_db.use_async_session()
+            result = self.app(environ, start_response)
+            try:
+                chunks.extend(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+async def read_body(receive, limit=None):
+    """
+    Read a whole request body from the client.
+
+    Returns:
+        BytesIO with the body, or None if it is larger than limit
+
+    Raises:
+        ClientDisconnected: If the client went away first
+    """
+    body = io.BytesIO()
+    more = True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        body.write(message.get('body', b''))
+        if limit is not None and body.tell() > limit:
+            return None
+        more = message.get('more_body', False)
+    body.seek(0)
+    return body
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP request"""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', ()):
+        name = raw_name.decode('latin1').upper().replace('-', '_')
+        value = raw_value.decode('latin1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        if name in environ:
+            value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+        environ[name] = value
+    return environ
+
+
+def create_application(app=None):
+    """
+    Build the ASGI application, for uvicorn --factory asgi:create_application.
+
+    Args:
+        app: Flask app to serve; the default app from __init__.py if None
+    """
+    if app is None:
+        from __init__ import app
+    return QuizMasterASGI(app)
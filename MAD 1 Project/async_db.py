@@ -0,0 +1,199 @@
+# async_db.py
+# Async database access for the ASGI entry point (asgi.py)
+# Views are written once, against db.session. When asgi.py serves a request on
+# the event loop, it runs the view through run(), in a greenlet, with an
+# AsyncRoutingSession as the request's db.session (see use_async_session()):
+# it picks an engine the way db_routing.RoutingSession does and hands the
+# async twin of it (aiosqlite for SQLite) to the session, so each query waits
+# on the event loop instead of holding a thread, and other requests run
+# meanwhile. Nothing else uses that session class, so the WSGI app and CLI
+# commands keep their ordinary sessions and engines.
+#
+# Code that waits (rate limit queues) uses sleep() and acquire() below, which
+# yield to the event loop in async requests, and blocking calls that aren't
+# queries on the session (the shared rate limit store) go through off_loop().
+# Locks must never be held across a query: a request waiting on the database
+# lets the next request run on the same thread, and that request would block
+# on the lock forever.
+#
+# SQLite has a single writer, and a transaction that holds its lock keeps it
+# while other requests run on the loop between its queries. Async requests
+# therefore take turns: a session takes its database's writer slot (waiting on
+# the loop, not in the driver) before its first write, and gives it back when
+# the transaction ends, so they never pile up on SQLite's busy timeout.
+#
+# Needs the packages in requirements-asgi.txt; they are only imported once a
+# request runs on the event loop.
+
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.util import await_only, greenlet_spawn
+
+import db_routing
+
+# Async drivers used in place of the sync ones
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+# How often a queued async request checks for a free slot
+POLL_SECONDS = 0.005
+
+# Longest an async request waits for its turn to write to a SQLite database
+WRITE_WAIT_SECONDS = 30
+
+# (database URL, reader) -> AsyncEngine
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Database URL -> writer slot of async requests on SQLite
+_writer_slots = {}
+
+# Whether the current request is running inside run()
+_active = ContextVar('async_db_active', default=False)
+
+
+def is_active():
+    """Whether the current code runs inside run(), on the event loop"""
+    return _active.get()
+
+
+async def run(function, *args):
+    """
+    Call a sync function (e.g. a whole WSGI request) with its queries going
+    through the async engines. Returns what the function returns.
+    """
+    token = _active.set(True)
+    try:
+        return await greenlet_spawn(function, *args)
+    finally:
+        _active.reset(token)
+
+
+def twin(engine, reader=False):
+    """
+    The engine to run a query on in place of engine: the sync side of its
+    async twin inside run(), or engine itself otherwise.
+
+    Args:
+        engine: Engine db_routing picked for the query
+        reader: Whether it is a read-only engine (see db_routing.setup_reader)
+    """
+    if not _active.get():
+        return engine
+    key = (engine.url.render_as_string(hide_password=False), reader)
+    async_engine = _engines.get(key)
+    if async_engine is None:
+        async_engine = _create_twin(engine, reader)
+        with _engines_lock:
+            async_engine = _engines.setdefault(key, async_engine)
+    return async_engine.sync_engine
+
+
+def _create_twin(engine, reader):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    backend = engine.url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend} databases')
+    async_engine = create_async_engine(engine.url.set(drivername=ASYNC_DRIVERS[backend]))
+    if reader:
+        db_routing.setup_reader(async_engine.sync_engine)
+    else:
+        db_routing.setup_primary(async_engine.sync_engine)
+    return async_engine
+
+
+def writer_slot(engine):
+    """The slot async requests take turns on to write to a SQLite engine's database, or None"""
+    if engine.url.get_backend_name() != 'sqlite':
+        return None
+    key = engine.url.render_as_string(hide_password=False)
+    slot = _writer_slots.get(key)
+    if slot is None:
+        with _engines_lock:
+            slot = _writer_slots.setdefault(key, threading.BoundedSemaphore(1))
+    return slot
+
+
+class AsyncRoutingSession(db_routing.RoutingSession):
+    """RoutingSession for requests inside run(): queries go to the async twin of the engine it picks"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        # Models on other binds (the tenant registry) keep their engine
+        if engine is db_routing.primary_engine():
+            if self._flushing or (clause is not None and getattr(clause, 'is_dml', False)):
+                self._take_writer_slot(engine)
+            return twin(engine)
+        if engine is db_routing.read_engine():
+            return twin(engine, reader=True)
+        return engine
+
+    def _take_writer_slot(self, engine):
+        slot = writer_slot(engine)
+        if slot is None or 'writer_slot' in self.info:
+            return
+        if not acquire(slot, WRITE_WAIT_SECONDS):
+            raise TimeoutError('Timed out waiting to write to the database')
+        self.info['writer_slot'] = slot
+
+
+@event.listens_for(AsyncRoutingSession, 'after_transaction_end')
+def _release_writer_slot(db_session, transaction):
+    # Committed, rolled back or closed: the next request may write
+    if transaction.parent is None:
+        slot = db_session.info.pop('writer_slot', None)
+        if slot is not None:
+            slot.release()
+
+
+def use_async_session():
+    """
+    Make db.session an AsyncRoutingSession for the current app context. Call
+    before anything in the context uses db.session.
+    """
+    from extensions import db
+    db.session.registry.set(AsyncRoutingSession(**db.session.session_factory.kw))
+
+
+async def dispose():
+    """Close every async engine, e.g. when the ASGI server shuts down"""
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for async_engine in engines:
+        await async_engine.dispose()
+
+
+def sleep(seconds):
+    """time.sleep() that lets other requests run in async requests"""
+    if _active.get():
+        await_only(asyncio.sleep(seconds))
+    else:
+        time.sleep(seconds)
+
+
+def off_loop(function, *args):
+    """Call a blocking function; in async requests it runs on a thread while the loop serves others"""
+    if not _active.get():
+        return function(*args)
+    return await_only(asyncio.get_running_loop().run_in_executor(None, function, *args))
+
+
+def acquire(semaphore, timeout):
+    """semaphore.acquire(timeout=timeout) that lets other requests run in async requests"""
+    if not _active.get():
+        return semaphore.acquire(timeout=timeout)
+    deadline = time.monotonic() + timeout
+    while not semaphore.acquire(blocking=False):
+        if time.monotonic() >= deadline:
+            return False
+        await_only(asyncio.sleep(POLL_SECONDS))
+    return True
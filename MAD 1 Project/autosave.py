@@ -0,0 +1,260 @@
+# autosave.py
+# Answers saved while a quiz is being taken
+# The quiz page sends the answers that changed since its last save every
+# AUTOSAVE_INTERVAL_SECONDS. Each worker merges them into an in-memory buffer
+# per attempt, so a student who changes an answer five times between flushes
+# costs one write, and a flusher thread writes every buffered attempt in one
+# transaction every AUTOSAVE_FLUSH_SECONDS, or as soon as AUTOSAVE_BATCH_SIZE
+# attempts are waiting. Changes are merged into QuizAttempt.answers with
+# SQLite's json_patch, so a flush doesn't read the rows it writes, and never
+# touches an attempt that has been submitted.
+#
+# Reopening the quiz shows the saved answers, and the attempt is graded from
+# them: the page's final answers are merged in on submit, and if they arrive
+# too late, the answers saved before the deadline still count. If a worker
+# dies, at most the last AUTOSAVE_FLUSH_SECONDS of its buffered changes are
+# lost; on a normal shutdown the buffer is written out first.
+#
+# Saves and the submission may reach different workers, and a worker can only
+# flush its own buffer. Grading doesn't depend on which worker buffered what:
+# - An on-time submission carries every answer, and those replace the saved
+#   ones. A flush arriving after it doesn't touch the submitted attempt.
+# - A submission is late once QUIZ_SUBMIT_GRACE_SECONDS have passed after the
+#   deadline. Saves from before the deadline are written within
+#   AUTOSAVE_FLUSH_SECONDS, which init_app() requires to be shorter than the
+#   grace period. Saves during the grace period are written at once (see
+#   save()). So by then every save that counts is in the database.
+# Reopening the quiz on another worker may miss the last AUTOSAVE_FLUSH_SECONDS
+# of changes, as when a worker dies; no sticky sessions are needed.
+
+import atexit
+import json
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, func, update
+
+from extensions import db
+from models import QuizAttempt
+import question_pool
+import schedule
+import tenants
+
+# Option numbers a saved answer can take (None clears the answer)
+OPTIONS = (1, 2, 3, 4)
+
+
+class AnswerBuffer:
+    """Changed answers waiting to be written, per tenant and attempt; later changes replace earlier ones"""
+
+    def __init__(self):
+        self._pending = {}  # (tenant slug, attempt id) -> {question id (str): option or None}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, tenant, attempt_id, changes):
+        """Merge changes for an attempt. Returns the number of attempts waiting."""
+        with self._lock:
+            self._pending.setdefault((tenant, attempt_id), {}).update(changes)
+            return len(self._pending)
+
+    def take(self, tenant, attempt_ids=None):
+        """Remove and return {attempt id: changes} for a tenant's attempts (all of them if attempt_ids is None)"""
+        with self._lock:
+            keys = [key for key in self._pending
+                    if key[0] == tenant and (attempt_ids is None or key[1] in attempt_ids)]
+            return {key[1]: self._pending.pop(key) for key in keys}
+
+    def put_back(self, tenant, taken):
+        """Return changes that couldn't be written, under any made since they were taken"""
+        with self._lock:
+            for attempt_id, changes in taken.items():
+                merged = dict(changes)
+                merged.update(self._pending.get((tenant, attempt_id), {}))
+                self._pending[(tenant, attempt_id)] = merged
+
+    def tenants(self):
+        """Tenants with changes waiting"""
+        with self._lock:
+            return {key[0] for key in self._pending}
+
+
+# One buffer per worker process
+_buffer = AnswerBuffer()
+
+
+def parse_changes(attempt, data):
+    """
+    Check answer changes sent by the quiz page.
+
+    Args:
+        attempt: QuizAttempt the changes are for
+        data: Mapping of question id to option number, or None to clear it
+
+    Returns:
+        Dict of question id (str) -> option or None
+
+    Raises:
+        ValueError: If a question isn't in the attempt or an option is invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected an object of question id -> option')
+    question_ids = {str(question_id) for question_id in json.loads(attempt.question_ids)}
+    changes = {}
+    for question_id, option in data.items():
+        if str(question_id) not in question_ids:
+            raise ValueError(f'Question {question_id} is not part of this attempt')
+        # bool is an int subclass, so rule out true/false from JSON explicitly
+        if option is not None and (type(option) is not int or option not in OPTIONS):
+            raise ValueError(f'Invalid option for question {question_id}')
+        changes[str(question_id)] = option
+    return changes
+
+
+def submitted_answers(attempt, answers):
+    """
+    The answers of a final submission, in either form question_pool.selected_options()
+    takes, as changes covering every question (unanswered ones clear the saved answer).
+
+    Raises:
+        ValueError: If an answer list doesn't match the attempt's questions
+    """
+    selected = question_pool.selected_options(attempt, answers)
+    return {str(question_id): option if type(option) is int and option in OPTIONS else None
+            for question_id, option in zip(json.loads(attempt.question_ids), selected)}
+
+
+def save(quiz, attempt, changes):
+    """
+    Buffer changed answers for an attempt; they are written by the next flush.
+    Changes sent after the attempt's deadline, during the grace period, are
+    written at once, so a late submission to any worker grades them.
+    """
+    waiting = _buffer.add(tenants.current(), attempt.id, changes)
+    deadline = schedule.attempt_deadline(quiz, attempt)
+    if deadline is not None and datetime.now() > deadline:
+        flush([attempt.id])
+        return
+    if waiting >= current_app.config['AUTOSAVE_BATCH_SIZE']:
+        flusher = current_app.extensions.get('autosave')
+        if flusher is not None:
+            flusher.wake()
+
+
+def flush(attempt_ids=None):
+    """
+    Write this worker's buffered answers for the active tenant in one transaction.
+
+    Args:
+        attempt_ids: Only write these attempts (default: every buffered attempt)
+
+    Returns:
+        Number of attempts written
+    """
+    tenant = tenants.current()
+    taken = _buffer.take(tenant, attempt_ids)
+    if not taken:
+        return 0
+    table = QuizAttempt.__table__
+    statement = (update(table)
+                 .where(table.c.id == bindparam('attempt_id'), table.c.submitted_at.is_(None))
+                 .values(answers=func.json_patch(table.c.answers, bindparam('changes')),
+                         saved_at=bindparam('saved')))
+    now = datetime.now()
+    try:
+        db.session.execute(statement, [{'attempt_id': attempt_id, 'changes': json.dumps(changes), 'saved': now}
+                                       for attempt_id, changes in taken.items()])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _buffer.put_back(tenant, taken)
+        raise
+    return len(taken)
+
+
+def stored_answers(attempt):
+    """The answers saved for an attempt, as a dict of question id (str) -> option"""
+    return json.loads(attempt.answers or '{}')
+
+
+def merge(answers, changes):
+    """Apply changes to saved answers the way json_patch does: None removes an answer"""
+    merged = dict(answers)
+    for question_id, option in changes.items():
+        if option is None:
+            merged.pop(question_id, None)
+        else:
+            merged[question_id] = option
+    return merged
+
+
+def answer_list(attempt, answers):
+    """Saved answers as a list in the attempt's question order (None for unanswered), for grading"""
+    return [answers.get(str(question_id)) for question_id in json.loads(attempt.question_ids)]
+
+
+class Flusher:
+    """
+    Thread that writes each tenant's buffered answers every
+    AUTOSAVE_FLUSH_SECONDS, or sooner when AUTOSAVE_BATCH_SIZE attempts are waiting.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['AUTOSAVE_FLUSH_SECONDS']
+        self._wake_event = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Start the flusher thread if it isn't running yet"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._run, name='autosave-flusher', daemon=True).start()
+            # Write out what is left when the worker shuts down normally
+            atexit.register(self.flush_all)
+
+    def wake(self):
+        """Flush now rather than at the end of the interval"""
+        self._wake_event.set()
+
+    def _run(self):
+        while True:
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+            self.flush_all()
+
+    def flush_all(self):
+        """Write the buffered answers of every tenant"""
+        for tenant in _buffer.tenants():
+            try:
+                with self.app.app_context():
+                    tenants.activate(tenant)
+                    flush()
+            except Exception:
+                self.app.logger.exception(f"Could not save buffered answers ({tenant or 'default'})")
+
+
+def init_app(app):
+    """
+    Attach a Flusher to the app. Its thread starts with the first request, so
+    CLI commands and scripts don't start it.
+    """
+    app.config.setdefault('AUTOSAVE_INTERVAL_SECONDS', 10)
+    app.config.setdefault('AUTOSAVE_FLUSH_SECONDS', 2)
+    app.config.setdefault('AUTOSAVE_BATCH_SIZE', 500)
+    grace = app.config.get('QUIZ_SUBMIT_GRACE_SECONDS', schedule.DEFAULT_SUBMIT_GRACE_SECONDS)
+    if app.config['AUTOSAVE_FLUSH_SECONDS'] >= grace:
+        # Otherwise a late submission could miss answers still buffered on another worker
+        raise ValueError('AUTOSAVE_FLUSH_SECONDS must be shorter than QUIZ_SUBMIT_GRACE_SECONDS')
+    flusher = Flusher(app)
+    app.extensions['autosave'] = flusher
+    app.before_request(flusher.start)
+    return flusher
@@ -0,0 +1,251 @@
+# backup.py
+# Online backups of the SQLite database
+# A backup copies the live database with SQLite's backup API,
+# BACKUP_PAGES_PER_STEP pages at a time, pausing BACKUP_STEP_SLEEP seconds
+# between steps so the copy doesn't hog the disk while quizzes are submitted.
+# The copying connection keeps one read transaction open for the whole copy.
+# In WAL mode that pins a single snapshot: writers carry on as usual (they only
+# append to the WAL, which can't be checkpointed past the snapshot until the
+# copy ends), and the copy doesn't restart from the first page every time a
+# score is committed, which a stepped backup otherwise does and so never
+# finishes under steady writes. Without WAL a held read lock would block
+# writers, so the copy is made in one step instead.
+#
+# Each copy is written to a temporary file and checked with PRAGMA
+# integrity_check before it is moved into BACKUP_FOLDER, so a listed backup is
+# always complete. Backups run from the CLI or as a background job, which also
+# runs every BACKUP_INTERVAL_HOURS; the newest BACKUP_KEEP are kept. Each
+# tenant's backups go in its own subfolder.
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from extensions import db
+import coherence
+import db_routing
+import jobs
+import tenants
+
+
+class BackupError(Exception):
+    """A backup could not be made, or a backup file failed verification"""
+
+
+def init_app(app):
+    """Set the backup defaults and schedule regular backups if enabled"""
+    app.config.setdefault('BACKUP_FOLDER', os.path.join(app.instance_path, 'backups'))
+    app.config.setdefault('BACKUP_KEEP', 7)
+    app.config.setdefault('BACKUP_INTERVAL_HOURS', 24)
+    app.config.setdefault('BACKUP_PAGES_PER_STEP', 1000)
+    app.config.setdefault('BACKUP_STEP_SLEEP', 0.01)
+
+    if app.config['BACKUP_INTERVAL_HOURS']:
+        jobs.schedule('backup_database', app.config['BACKUP_INTERVAL_HOURS'] * 3600)
+
+
+def backup_folder():
+    """Folder backups are written to; each tenant has its own"""
+    folder = current_app.config['BACKUP_FOLDER']
+    tenant = tenants.current()
+    return os.path.join(folder, tenant) if tenant else folder
+
+
+def database_path():
+    """Path of the active database file (the tenant's, if one is active)"""
+    url = db_routing.primary_engine().url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise BackupError(f'Only SQLite database files can be backed up, not {url.render_as_string()}')
+    return os.path.abspath(url.database)
+
+
+def copy_database(source_path, target_path, pages=-1, step_sleep=0.0, progress=None):
+    """
+    Copy a live SQLite database into a new file with the backup API.
+
+    Args:
+        source_path: Database to copy
+        target_path: File to write; must not exist yet
+        pages: Pages per step (-1 copies everything in one step)
+        step_sleep: Seconds to pause between steps
+        progress: Optional callback(remaining, total) after each step; raising
+            in it stops the copy
+
+    Returns:
+        Number of pages copied
+    """
+    if not os.path.exists(source_path):
+        raise BackupError(f'Database not found: {source_path}')
+    if os.path.exists(target_path):
+        raise BackupError(f'Backup target already exists: {target_path}')
+
+    copied = {'total': 0}
+
+    def on_step(status, remaining, total):
+        copied['total'] = total
+        if progress is not None:
+            progress(remaining, total)
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            # Pin one snapshot for the whole copy (see the top of this file)
+            source.execute('BEGIN')
+            source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        else:
+            pages = -1
+        source.backup(target, pages=pages, progress=on_step)
+        # Keep the backup a single self-contained file
+        target.execute('PRAGMA journal_mode=DELETE').fetchone()
+    finally:
+        target.close()
+        source.close()
+    return copied['total']
+
+
+def verify_backup(path):
+    """
+    Check a backup file with PRAGMA integrity_check.
+
+    Returns:
+        List of problems found; empty if the file is sound
+    """
+    if not os.path.isfile(path):
+        return [f'File not found: {path}']
+    try:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            rows = connection.execute('PRAGMA integrity_check').fetchall()
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    problems = [row[0] for row in rows]
+    return [] if problems == ['ok'] else problems
+
+
+def create_backup(progress=None):
+    """
+    Back up the active database into the backup folder, verify the copy and
+    drop backups beyond BACKUP_KEEP.
+
+    Args:
+        progress: Optional callback(remaining, total) after each step of the copy
+
+    Returns:
+        Dict with filename, size, pages, seconds and the backups removed
+    """
+    config = current_app.config
+    source = database_path()
+    folder = backup_folder()
+    os.makedirs(folder, exist_ok=True)
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    filename = f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db"
+    path = os.path.join(folder, filename)
+    temp_path = os.path.join(folder, f'.{filename}.tmp')
+
+    start = time.perf_counter()
+    try:
+        pages = copy_database(source, temp_path, config['BACKUP_PAGES_PER_STEP'],
+                              config['BACKUP_STEP_SLEEP'], progress)
+        problems = verify_backup(temp_path)
+        if problems:
+            raise BackupError(f"Backup failed verification: {'; '.join(problems[:5])}")
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    seconds = time.perf_counter() - start
+
+    removed = prune_backups(config['BACKUP_KEEP'])
+    return {'filename': filename, 'size': os.path.getsize(path), 'pages': pages,
+            'seconds': round(seconds, 3), 'removed': removed}
+
+
+def list_backups():
+    """Backups in the backup folder, newest first, as dicts with filename, path, size and created"""
+    folder = backup_folder()
+    if not os.path.isdir(folder):
+        return []
+    backups = []
+    for filename in os.listdir(folder):
+        path = os.path.join(folder, filename)
+        if filename.startswith('.') or not filename.endswith('.db') or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        backups.append({'filename': filename, 'path': path, 'size': stat.st_size,
+                        'created': datetime.fromtimestamp(stat.st_mtime)})
+    backups.sort(key=lambda backup: backup['created'], reverse=True)
+    return backups
+
+
+def prune_backups(keep):
+    """
+    Delete all but the newest keep backups.
+
+    Returns:
+        File names of the deleted backups
+    """
+    removed = []
+    for backup in list_backups()[keep:]:
+        os.remove(backup['path'])
+        removed.append(backup['filename'])
+    return removed
+
+
+def find_backup(name):
+    """Path of a backup, given its file name in the backup folder or a path to any file"""
+    path = os.path.join(backup_folder(), name)
+    if os.sep not in name and os.path.isfile(path):
+        return path
+    return os.path.abspath(name)
+
+
+def restore_backup(path):
+    """
+    Replace the contents of the active database with a backup, after checking
+    the backup and backing up the current database first.
+
+    The restore is written in one step, so other connections wait for it
+    rather than seeing a half-restored database. Every worker drops its
+    in-memory caches at its next request.
+
+    Returns:
+        Result of the safety backup taken before restoring (see create_backup)
+    """
+    problems = verify_backup(path)
+    if problems:
+        raise BackupError(f"Not restoring {path}: {'; '.join(problems[:5])}")
+    target_path = database_path()
+    if os.path.abspath(path) == target_path:
+        raise BackupError('A database cannot be restored from itself')
+
+    safety = create_backup()
+    with db_routing.primary_engine().connect() as connection:
+        version = coherence.latest_version(connection)
+
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    target = sqlite3.connect(target_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+    # Pooled connections may have cached the old schema
+    db_routing.primary_engine().dispose()
+    db_routing.read_engine().dispose()
+
+    # A backup made before a schema change lacks the newer tables and columns
+    tenants.create_all()
+    # The backup's cache versions are older than the ones the workers have seen
+    coherence.bump(coherence.EVERYTHING, floor=version)
+    db.session.commit()
+    return safety
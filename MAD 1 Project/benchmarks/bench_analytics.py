@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the NumPy score analytics.
+Computes the same statistics (mean, median, std, quantiles, histogram, pass
+rate and monthly trend) over 1M scores with analytics.describe and with plain
+Python loops, then times loading a quiz's scores from SQLite into arrays.
+
+Usage: python benchmarks/bench_analytics.py [number_of_scores]
+"""
+
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+import analytics
+
+
+def describe_python(percentages, timestamps):
+    """The same statistics as analytics.describe, with plain Python loops"""
+    count = len(percentages)
+    ordered = sorted(percentages)
+
+    def quantile(q):
+        position = (count - 1) * q
+        lower = math.floor(position)
+        upper = min(lower + 1, count - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    mean = sum(percentages) / count
+    std = math.sqrt(sum((value - mean) ** 2 for value in percentages) / count)
+    histogram = [0] * 10
+    passed = 0
+    months = {}
+    for value, timestamp in zip(percentages, timestamps):
+        histogram[min(int(value // 10), 9)] += 1
+        if value >= analytics.PASS_MARK:
+            passed += 1
+        key = (timestamp.year, timestamp.month)
+        bucket = months.setdefault(key, [0, 0.0])
+        bucket[0] += 1
+        bucket[1] += value
+    trend = sorted(months.items())
+    return {
+        'count': count, 'mean': mean, 'median': quantile(0.5), 'std': std,
+        'min': ordered[0], 'max': ordered[-1],
+        'quantiles': {q: quantile(q) for q in analytics.QUANTILES},
+        'pass_rate': passed * 100.0 / count, 'histogram': histogram,
+        'trend': {'labels': [datetime(year, month, 1).strftime('%b %Y') for (year, month), _ in trend],
+                  'counts': [bucket[0] for _, bucket in trend],
+                  'means': [round(bucket[1] / bucket[0], 1) for _, bucket in trend]},
+    }
+
+
+def best_of(function, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    score_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+
+    totals = [10] * score_count
+    scores = [min(10, max(0, int(rng.gauss(6, 2)))) for _ in range(score_count)]
+    base = datetime(2022, 1, 1).timestamp()
+    seconds = [int(base + rng.random() * 3 * 365 * 86400) for _ in range(score_count)]
+
+    percentages_list = [score * 100.0 / total for score, total in zip(scores, totals)]
+    timestamps_list = [datetime.fromtimestamp(value) for value in seconds]
+    percentages = np.array(percentages_list)
+    timestamps = np.array(seconds, dtype='datetime64[s]')
+
+    python_time, python_stats = best_of(lambda: describe_python(percentages_list, timestamps_list))
+    numpy_time, numpy_stats = best_of(lambda: analytics.describe(percentages, timestamps))
+    assert python_stats['histogram'] == numpy_stats['histogram']
+    assert abs(python_stats['mean'] - numpy_stats['mean']) < 1e-6
+
+    print(f"{score_count} scores")
+    print(f"Pure Python loops: {python_time * 1000:8.1f} ms")
+    print(f"NumPy vectorized:  {numpy_time * 1000:8.1f} ms  ({python_time / numpy_time:.0f}x faster)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all(bind_key=None)
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+            db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration) VALUES (1, 1, '2024-01-01', '01:00')"))
+            db.session.execute(text(
+                "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                "VALUES (1, 1, :score, :total, :timestamp)"
+            ), [{'score': s, 'total': t, 'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S.%f')}
+                for s, t, ts in zip(scores, totals, timestamps_list)])
+            db.session.commit()
+
+            load_time, _ = best_of(lambda: analytics.load_quiz_scores(1), repeat=1)
+            analytics.invalidate_quiz()
+            analytics.get_quiz_scores(1).stats
+            cached_time, _ = best_of(lambda: analytics.get_quiz_scores(1).stats)
+            print(f"Load from SQLite into arrays: {load_time * 1000:8.1f} ms (once per submission)")
+            print(f"Cached stats lookup:          {cached_time * 1000:8.4f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Benchmark for serving quiz traffic with many slow connections.
+Students on slow mobile links submit their answers a few bytes at a time while
+another student keeps loading the quiz questions. Compares a threaded WSGI
+server with a fixed thread pool (like gunicorn --threads) against the ASGI
+entry point (asgi.py under uvicorn), both with one process, and reports how
+many question loads were served during the uploads and their latency. The
+thread pool falls behind whenever all its threads wait on uploads, which shows
+in the p99 and max rather than the median.
+
+Needs: pip install -r requirements-asgi.txt (at the repository root)
+
+Usage: python benchmarks/bench_async.py [slow_clients] [upload_seconds]
+"""
+
+import asyncio
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+# Worker threads of the WSGI deployment
+WSGI_THREADS = 8
+
+QUESTIONS = 10
+SECRET_KEY = 'bench'
+
+
+def make_app(database):
+    from flask import Flask
+
+    from extensions import db
+    import autosave
+    import db_routing
+    import ratelimit
+    import tenants
+    from routes import register_routes
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    app.config['RATE_LIMIT_ENABLED'] = False
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    ratelimit.init_app(app)
+    register_routes(app)
+    autosave.init_app(app)
+    return app
+
+
+def serve(kind, database, port):
+    """Runs in the child process: serve the app until killed"""
+    app = make_app(database)
+    if kind == 'asgi':
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.create_application(app), host='127.0.0.1', port=int(port), log_level='warning')
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+        # Each connection holds one of a fixed number of threads until its request is done
+        pool = ThreadPoolExecutor(WSGI_THREADS)
+        request_queue_size = 2048
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.process_request_thread, request, client_address)
+
+    make_server('127.0.0.1', int(port), app, server_class=PooledWSGIServer,
+                handler_class=QuietHandler).serve_forever()
+
+
+def prepare(database, users):
+    """Create a quiz and open an attempt on it for every user. Returns their session cookies."""
+    from datetime import datetime
+    from sqlalchemy import text
+    from extensions import db
+
+    app = make_app(database)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+        db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) "
+                                "VALUES (1, 1, '2024-01-01', '23:59', 86340)"))
+        db.session.execute(text(
+            "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+            "VALUES (1, :text, 'a', 'b', 'c', 'd', 1)"), [{'text': f'Question {i}'} for i in range(QUESTIONS)])
+        db.session.execute(text(
+            "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+            "VALUES (:id, :email, 'x', 'Student', 'q', :dob, 0)"),
+            [{'id': i, 'email': f'student{i}@example.com', 'dob': datetime(2000, 1, 1)} for i in range(1, users + 1)])
+        db.session.commit()
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    sessions = [serializer.dumps({'user_id': user_id}) for user_id in range(1, users + 1)]
+    client = app.test_client()
+    for value in sessions:
+        client.set_cookie('session', value)
+        assert client.get('/user/quiz/1').status_code == 200
+    cookies = [f'session={value}' for value in sessions]
+    return cookies
+
+
+async def http(port, method, path, cookie, body=b'', upload_seconds=0.0, delay=0.0):
+    """One request on its own connection after delay; the body is sent in small pieces over upload_seconds"""
+    await asyncio.sleep(delay)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\nConnection: close\r\n'
+    if body:
+        head += f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n'
+    writer.write(head.encode('latin1') + b'\r\n')
+    await writer.drain()
+    if body:
+        pieces = max(1, int(upload_seconds * 10))
+        size = -(-len(body) // pieces)
+        for start in range(0, len(body), size):
+            writer.write(body[start:start + size])
+            await writer.drain()
+            await asyncio.sleep(upload_seconds / pieces)
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    writer.close()
+    return status
+
+
+async def run_load(port, cookies, upload_seconds, window):
+    answers = '&'.join(f'question_{i}=1' for i in range(1, QUESTIONS + 1))
+    # About 2 KiB, like a form with free-text answers
+    body = f"{answers}&notes={'x' * 2000}".encode()
+    # Students start uploading at a steady rate over the window
+    students = cookies[1:]
+    uploads = [asyncio.create_task(http(port, 'POST', '/user/submit_quiz/1', cookie, body, upload_seconds,
+                                        delay=window * index / len(students)))
+               for index, cookie in enumerate(students)]
+
+    latencies = []
+    started = time.perf_counter()
+    while not all(upload.done() for upload in uploads):
+        start = time.perf_counter()
+        status = await http(port, 'GET', '/api/quizzes/1/questions', cookies[0])
+        if status == 200:
+            latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    statuses = await asyncio.gather(*uploads)
+    return latencies, elapsed, statuses
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(server, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def main():
+    slow_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    upload_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    window = 10.0
+
+    print(f"{slow_clients} students starting over {window:.0f} s, each uploading answers for "
+          f"{upload_seconds:.0f} s (about {slow_clients * upload_seconds / window:.0f} at once); "
+          f"one more loading questions meanwhile")
+    for kind, label in (('wsgi', f'WSGI, {WSGI_THREADS} threads'), ('asgi', 'ASGI (asgi.py)')):
+        with tempfile.TemporaryDirectory() as tmp:
+            database = os.path.join(tmp, 'bench.db')
+            cookies = prepare(database, slow_clients + 1)
+            port = free_port()
+            server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', kind, database, str(port)])
+            try:
+                wait_for(server, port)
+                latencies, elapsed, statuses = asyncio.run(run_load(port, cookies, upload_seconds, window))
+            finally:
+                server.terminate()
+                server.wait()
+            # A failed submission redirects too, so count the scores that were saved
+            with sqlite3.connect(database) as connection:
+                submitted = connection.execute('SELECT count(*) FROM score').fetchone()[0]
+
+        ordered = sorted(latencies) or [float('nan')]
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        print(f"{label:20}  {len(latencies):5d} question loads in {elapsed:5.1f} s   "
+              f"p50 {statistics.median(ordered) * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms   "
+              f"max {ordered[-1] * 1000:7.1f} ms   {submitted}/{len(statuses)} submissions saved")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(*sys.argv[2:5])
+    else:
+        main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Benchmark for autosaving answers during a quiz.
+Many students change answers at once, each change posted to the save route
+from its own thread, with the answers written:
+  - at the end of every save request (a write per save)
+  - by the flusher, one transaction every AUTOSAVE_FLUSH_SECONDS
+and reports database commits, saves per second and save latency. It then
+checks that every attempt ended up with its last answers.
+
+Usage: python benchmarks/bench_autosave.py [students] [changes] [threads]
+"""
+
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+QUESTIONS = 20
+SECRET_KEY = 'bench'
+
+
+def make_app(database, write_each):
+    from flask import Flask
+    from sqlalchemy import event
+
+    from extensions import db
+    import autosave
+    import db_routing
+    import ratelimit
+    import tenants
+    from routes import register_routes
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    app.config['RATE_LIMIT_ENABLED'] = False
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    ratelimit.init_app(app)
+    register_routes(app)
+    autosave.init_app(app)
+    if write_each:
+        # What saving without the buffer costs: the save request writes its answers itself
+        @app.after_request
+        def write_now(response):
+            autosave.flush()
+            return response
+
+    commits = [0]
+    with app.app_context():
+        @event.listens_for(db.engine, 'commit')
+        def count_commit(connection):
+            commits[0] += 1
+    return app, commits
+
+
+def prepare(app, students):
+    """Create a quiz and students with an open attempt each. Returns their question ids."""
+    from datetime import datetime
+    from sqlalchemy import text
+    from extensions import db
+
+    question_ids = list(range(1, QUESTIONS + 1))
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+        db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) "
+                                "VALUES (1, 1, '2024-01-01', '23:59', 86340)"))
+        db.session.execute(text(
+            "INSERT INTO question (id, quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+            "VALUES (:id, 1, 'Question', 'a', 'b', 'c', 'd', 1)"), [{'id': i} for i in question_ids])
+        db.session.execute(text(
+            "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+            "VALUES (:id, :email, 'x', 'Student', 'q', :dob, 0)"),
+            [{'id': user_id, 'email': f's{user_id}@example.com', 'dob': datetime(2000, 1, 1)}
+             for user_id in range(1, students + 1)])
+        db.session.execute(text(
+            "INSERT INTO quiz_attempt (id, quiz_id, user_id, question_ids, option_orders, answer_key, started_at, answers) "
+            "VALUES (:id, 1, :id, :question_ids, :option_orders, :answer_key, :now, '{}')"),
+            [{'id': user_id, 'question_ids': json.dumps(question_ids), 'option_orders': json.dumps([[1, 2, 3, 4]] * QUESTIONS),
+              'answer_key': json.dumps([1] * QUESTIONS), 'now': datetime.now()}
+             for user_id in range(1, students + 1)])
+        db.session.commit()
+    return question_ids
+
+
+def run(database, students, changes, threads, write_each):
+    """Returns (commits, elapsed seconds, save latencies, attempts with the wrong answers)"""
+    from sqlalchemy import text
+    from extensions import db
+
+    app, commits = make_app(database, write_each)
+    question_ids = prepare(app, students)
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    # Each student changes random answers; the last option per question is what should be stored
+    rng = random.Random(1)
+    saves = [(user_id, {str(rng.choice(question_ids)): rng.randint(1, 4)})
+             for user_id in range(1, students + 1) for _ in range(changes)]
+    rng.shuffle(saves)
+    expected = {}
+    for user_id, change in saves:
+        expected.setdefault(user_id, {}).update(change)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(part):
+        client = app.test_client()
+        timings = []
+        for user_id, change in part:
+            client.set_cookie('session', serializer.dumps({'user_id': user_id}))
+            start = time.perf_counter()
+            response = client.post('/api/quizzes/1/answers', json={'answers': change})
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.data
+        with lock:
+            latencies.extend(timings)
+
+    commits[0] = 0
+    start = time.perf_counter()
+    # A student's saves stay on one thread, so they arrive in order
+    workers = [threading.Thread(target=worker, args=([save for save in saves if save[0] % threads == number],))
+               for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    # Whatever the flusher hasn't written yet
+    app.extensions['autosave'].flush_all()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        stored = dict(db.session.execute(text("SELECT id, answers FROM quiz_attempt")).all())
+    wrong = sum(1 for user_id, answers in expected.items() if json.loads(stored[user_id]) != answers)
+    return commits[0], elapsed, latencies, wrong
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        # Each setup runs in its own process, so the flusher threads of the two don't meet
+        students, changes, threads, write_each = (int(arg) for arg in sys.argv[2:6])
+        with tempfile.TemporaryDirectory() as tmp:
+            print(json.dumps(run(os.path.join(tmp, 'bench.db'), students, changes, threads, bool(write_each))))
+        return
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    print(f"{students} students changing {changes} answers each ({students * changes} saves) from {threads} threads")
+    print(f"{'writes':34}  {'commits':>7}  {'time':>8}  {'saves/s':>8}  {'p50':>8}  {'p99':>8}  {'wrong':>5}")
+    for label, write_each in (('A write per save', True), ('Buffered, flushed in batches', False)):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', str(students), str(changes),
+                                 str(threads), str(int(write_each))], check=True, capture_output=True, text=True).stdout
+        commits, elapsed, latencies, wrong = json.loads(output.splitlines()[-1])
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{label:34}  {commits:7d}  {elapsed:6.2f} s  {len(latencies) / elapsed:8.0f}  "
+              f"{statistics.median(latencies) * 1000:5.2f} ms  {p99 * 1000:5.2f} ms  {wrong:5d}")
+
+
+if __name__ == '__main__':
+    main()
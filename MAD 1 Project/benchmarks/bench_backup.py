@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Benchmark for online backups while quizzes are being submitted.
+Fills a WAL-mode database with scores, then inserts a score every few
+milliseconds from a writer thread (as submissions do) while it is backed up:
+  - no backup (the writer's baseline latency)
+  - the whole database in one backup step
+  - in steps, without holding a snapshot (restarts whenever a score is written)
+  - in steps, as backup.copy_database does it (one pinned snapshot)
+Reports each backup's time and throughput, and the writer's commit latency.
+
+Usage: python benchmarks/bench_backup.py [scores]
+"""
+
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+import backup  # noqa: E402
+
+# Seconds between the writer's inserts
+WRITE_INTERVAL = 0.005
+
+# Backup settings, as in the app's config
+PAGES_PER_STEP = 1000
+STEP_SLEEP = 0.01
+
+# Give up on a backup that hasn't finished after this long
+TIME_LIMIT = 30
+
+
+class TimeLimitReached(Exception):
+    pass
+
+
+def make_app(database):
+    from flask import Flask
+
+    from extensions import db
+    import db_routing
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    db_routing.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    return app
+
+
+def fill(database, scores):
+    from sqlalchemy import text
+    from extensions import db
+
+    app = make_app(database)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+        db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration) VALUES (1, 1, '2024-01-01', '01:00')"))
+        db.session.execute(text(
+            "INSERT INTO user (id, email, password, full_name, qualification, dob) "
+            "VALUES (1, 'student@example.com', 'x', 'Student', 'q', '2000-01-01')"))
+        db.session.commit()
+        db.engine.dispose()
+
+    connection = sqlite3.connect(database)
+    # Bypass the rollup triggers and search index; only the size matters here
+    connection.executemany(
+        "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) VALUES (1, 1, ?, 10, ?)",
+        ((i % 11, f'2024-01-01 00:00:{i % 60:02d}') for i in range(scores)))
+    connection.commit()
+    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    connection.close()
+
+
+class Writer(threading.Thread):
+    """Inserts a score every WRITE_INTERVAL seconds and records when each commit started and its latency"""
+
+    def __init__(self, database):
+        super().__init__(daemon=True)
+        self.database = database
+        self.latencies = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        connection = sqlite3.connect(self.database, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            connection.execute("INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                               "VALUES (1, 1, 5, 10, '2024-06-01 00:00:00')")
+            connection.commit()
+            self.latencies.append((start, time.perf_counter() - start))
+            time.sleep(WRITE_INTERVAL)
+        connection.close()
+
+
+def stepped_without_snapshot(source_path, target_path):
+    """A stepped copy the usual way: each step takes its own read lock"""
+    started = time.perf_counter()
+    restarts = {'count': 0, 'last': None}
+
+    def on_step(status, remaining, total):
+        if restarts['last'] is not None and remaining > restarts['last']:
+            restarts['count'] += 1
+        restarts['last'] = remaining
+        if time.perf_counter() - started > TIME_LIMIT:
+            raise TimeLimitReached(f"restarted {restarts['count']} times")
+        if remaining:
+            time.sleep(STEP_SLEEP)
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=PAGES_PER_STEP, progress=on_step)
+    finally:
+        target.close()
+        source.close()
+
+
+def run(database, label, copy):
+    target = f'{database}.{label.split()[0].lower()}.bak'
+    writer = Writer(database)
+    writer.start()
+    time.sleep(0.5)
+    start = time.perf_counter()
+    outcome = None
+    try:
+        if copy is None:
+            time.sleep(3)
+        else:
+            copy(database, target)
+    except TimeLimitReached as e:
+        outcome = f'did not finish in {TIME_LIMIT} s ({e})'
+    elapsed = time.perf_counter() - start
+    time.sleep(0.5)
+    writer.stopped.set()
+    writer.join()
+
+    if copy is None:
+        outcome = '-'
+    elif outcome is None:
+        size = os.path.getsize(target) / 1024 / 1024
+        outcome = f'{elapsed:6.2f} s  {size / elapsed:7.1f} MB/s'
+    # Only the writes made while the backup ran
+    latencies = sorted(latency for started, latency in writer.latencies if start <= started <= start + elapsed)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{label:28}  {outcome:36}  {statistics.median(latencies) * 1000:6.2f} ms  "
+          f"{p99 * 1000:7.2f} ms  {latencies[-1] * 1000:7.2f} ms")
+    if os.path.exists(target):
+        os.remove(target)
+
+
+def main():
+    scores = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'bench.db')
+        fill(database, scores)
+        size = os.path.getsize(database) / 1024 / 1024
+        print(f"{scores} scores, {size:.1f} MB; a score is inserted every {WRITE_INTERVAL * 1000:.0f} ms")
+        print(f"{'backup':28}  {'time / throughput':36}  {'write p50':>9}  {'write p99':>10}  {'write max':>10}")
+
+        run(database, 'None (baseline)', None)
+        run(database, 'One step', lambda source, target: backup.copy_database(source, target))
+        run(database, 'Steps, no snapshot', stepped_without_snapshot)
+        run(database, 'Steps, pinned snapshot', lambda source, target: backup.copy_database(
+            source, target, PAGES_PER_STEP, STEP_SLEEP))
+
+
+if __name__ == '__main__':
+    main()
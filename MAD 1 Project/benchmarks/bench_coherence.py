@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Benchmark for cache coherence between worker processes.
+Starts several worker processes on one database, each caching the quiz's
+question payload in memory, and has students load the questions from every
+worker while an admin edits a question through the first one. For each edit it
+measures how long every other worker kept serving the old text:
+  - without version checks (each worker only drops its own cache)
+  - checking the cache versions before every request (CACHE_CHECK_INTERVAL 0)
+  - checking at most every CACHE_CHECK_INTERVAL seconds
+and reports the staleness, and the latency of question loads served from the
+cache when nothing is being edited.
+
+Usage: python benchmarks/bench_coherence.py [workers] [edits] [interval]
+"""
+
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+QUESTIONS = 10
+SECRET_KEY = 'bench'
+
+# Seconds between edits, and how long to wait for a worker to serve an edit
+EDIT_INTERVAL = 0.2
+STALE_LIMIT = 3.0
+
+# Question loads timed once the edits are done
+STEADY_LOADS = 400
+
+
+def make_app(database, interval=None):
+    """The quiz routes; interval None leaves out the version checks"""
+    from flask import Flask
+
+    from extensions import db
+    import autosave
+    import coherence
+    import db_routing
+    import ratelimit
+    import tenants
+    from routes import register_routes
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    app.config['RATE_LIMIT_ENABLED'] = False
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    if interval is not None:
+        app.config['CACHE_CHECK_INTERVAL'] = interval
+        coherence.init_app(app)
+    ratelimit.init_app(app)
+    register_routes(app)
+    autosave.init_app(app)
+    return app
+
+
+def serve(database, port, interval):
+    """Runs in the child process: serve the app until killed"""
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    class ThreadedWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 256
+
+    app = make_app(database, None if interval == 'off' else float(interval))
+    make_server('127.0.0.1', int(port), app, server_class=ThreadedWSGIServer,
+                handler_class=QuietHandler).serve_forever()
+
+
+def prepare(database):
+    """Create a quiz, an admin and a student. Returns their session cookies."""
+    from datetime import datetime
+    from sqlalchemy import text
+    from extensions import db
+
+    app = make_app(database)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+        db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) "
+                                "VALUES (1, 1, '2024-01-01', '23:59', 86340)"))
+        db.session.execute(text(
+            "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+            "VALUES (1, :text, 'a', 'b', 'c', 'd', 1)"), [{'text': f'Question {i}'} for i in range(QUESTIONS)])
+        db.session.execute(text(
+            "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+            "VALUES (:id, :email, 'x', :name, 'q', :dob, :admin)"),
+            [{'id': 1, 'email': 'admin@example.com', 'name': 'Admin', 'dob': datetime(2000, 1, 1), 'admin': True},
+             {'id': 2, 'email': 'student@example.com', 'name': 'Student', 'dob': datetime(2000, 1, 1), 'admin': False}])
+        db.session.commit()
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    admin = serializer.dumps({'user_id': 1, 'is_admin': True})
+    student = serializer.dumps({'user_id': 2})
+    # The questions are only served to a student who has started the quiz
+    client = app.test_client()
+    client.set_cookie('session', student)
+    assert client.get('/user/quiz/1').status_code == 200
+    return f'session={admin}', f'session={student}'
+
+
+def request(port, method, path, cookie, form=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    headers = {'Cookie': cookie}
+    body = None
+    if form is not None:
+        body = urlencode(form)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    content = response.read()
+    connection.close()
+    return response.status, content
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(server, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def run(database, workers, edits, interval):
+    """
+    Edit through the first worker and poll the others, then load the questions
+    with no edits going on. Returns (staleness per edit and worker, latencies).
+    """
+    admin, student = prepare(database)
+    ports = [free_port() for _ in range(workers)]
+    servers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', database, str(port),
+                                 str(interval)]) for port in ports]
+    try:
+        for server, port in zip(servers, ports):
+            wait_for(server, port)
+        # Every worker caches the payload
+        for port in ports:
+            assert request(port, 'GET', '/api/quizzes/1/questions', student)[0] == 200
+
+        staleness = []
+        for edit in range(edits):
+            text = f'Revision {edit}'.encode()
+            status, _ = request(ports[0], 'POST', '/admin/question/1/edit', admin,
+                                {'question_text': text.decode(), 'option1': 'a', 'option2': 'b', 'option3': 'c',
+                                 'option4': 'd', 'correct_option': '1'})
+            assert status == 302, status
+            committed = time.perf_counter()
+            pending = set(ports[1:])
+            while pending and time.perf_counter() - committed < STALE_LIMIT:
+                for port in list(pending):
+                    status, content = request(port, 'GET', '/api/quizzes/1/questions', student)
+                    if text in content:
+                        staleness.append(time.perf_counter() - committed)
+                        pending.discard(port)
+            staleness.extend([None] * len(pending))
+            time.sleep(EDIT_INTERVAL)
+
+        # What the version checks cost a request served from the cache
+        latencies = []
+        for load in range(STEADY_LOADS):
+            start = time.perf_counter()
+            request(ports[load % workers], 'GET', '/api/quizzes/1/questions', student)
+            latencies.append(time.perf_counter() - start)
+        return staleness, latencies
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(*sys.argv[2:5])
+        return
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    edits = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+    print(f"{workers} workers, {edits} question edits through the first; staleness is how long each "
+          f"other worker kept serving the old text (given up after {STALE_LIMIT:.0f} s)")
+    print(f"{'version checks':30}  {'stale p50':>9}  {'stale max':>9}  {'never seen':>10}  {'load p50':>9}")
+    for label, setting in (('None (per-worker caches only)', 'off'), ('Every request', 0),
+                           (f'At most every {interval:g} s', interval)):
+        with tempfile.TemporaryDirectory() as tmp:
+            staleness, latencies = run(os.path.join(tmp, 'bench.db'), workers, edits, setting)
+        seen = sorted(seconds for seconds in staleness if seconds is not None)
+        never = len(staleness) - len(seen)
+        p50 = f'{statistics.median(seen) * 1000:6.1f} ms' if seen else '-'
+        worst = f'{seen[-1] * 1000:6.1f} ms' if seen else '-'
+        print(f"{label:30}  {p50:>9}  {worst:>9}  {never:>4} / {len(staleness):<3}  "
+              f"{statistics.median(latencies) * 1000:6.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the user dashboard's quiz list.
+Builds a database where most quizzes closed long ago and a few are open or
+upcoming, then compares the old dashboard (every quiz in the catalog, plus all
+of the user's scores) with the new one (the open and upcoming quizzes from the
+ix_quiz_window index, plus the user's scores for just those quizzes).
+
+Usage: python benchmarks/bench_dashboard_window.py [closed_quizzes] [current_quizzes]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import select, text
+
+from extensions import db
+from models import Score
+import catalog
+import schedule
+
+# The quiz rows of the user dashboard table
+ROWS = """
+{% for quiz in quizzes %}
+<tr>
+    <td>{{ quiz.chapter.subject.name }}</td>
+    <td>{{ quiz.chapter.name }}</td>
+    <td>{{ quiz.date.strftime('%d %b, %Y %H:%M') }}</td>
+    <td>{{ quiz.duration }}</td>
+    <td>{% if quiz.id in attempted_quiz_ids %}Completed{% else %}Available{% endif %}</td>
+</tr>
+{% endfor %}
+"""
+
+RUNS = 200
+USER_ID = 1
+
+
+def old_dashboard(rows):
+    quizzes = catalog.get_catalog().quizzes
+    attempted_quiz_ids = [score.quiz_id for score in Score.query.filter_by(user_id=USER_ID).all()]
+    return rows.render(quizzes=quizzes, attempted_quiz_ids=attempted_quiz_ids)
+
+
+def new_dashboard(rows):
+    quizzes_by_id = catalog.get_catalog().quizzes_by_id
+    quizzes = [quizzes_by_id[quiz_id] for quiz_id in schedule.current_quiz_ids() if quiz_id in quizzes_by_id]
+    attempted_quiz_ids = set(db.session.execute(
+        select(Score.quiz_id).where(Score.user_id == USER_ID,
+                                    Score.quiz_id.in_([quiz.id for quiz in quizzes]))).scalars())
+    return rows.render(quizzes=quizzes, attempted_quiz_ids=attempted_quiz_ids)
+
+
+def timed(function, rows):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        size = len(function(rows))
+    return (time.perf_counter() - start) / RUNS * 1000, size
+
+
+def main():
+    closed = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    current = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        rows = app.jinja_env.from_string(ROWS)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            now = datetime.now()
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+            quiz = text("INSERT INTO quiz (id, chapter_id, date, closes_at, duration, duration_seconds) "
+                        "VALUES (:id, 1, :opens, :closes, '00:30', 1800)")
+            db.session.execute(quiz, [{'id': i, 'opens': now - timedelta(days=closed - i + 2),
+                                       'closes': now - timedelta(days=closed - i + 1)}
+                                      for i in range(1, closed + 1)])
+            db.session.execute(quiz, [{'id': closed + i, 'opens': now + timedelta(days=i - current // 2),
+                                       'closes': now + timedelta(days=i + 1)}
+                                      for i in range(1, current + 1)])
+            # The user took most of the old quizzes
+            db.session.execute(text(
+                "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                "VALUES (:quiz, :user, 5, 10, :timestamp)"),
+                [{'quiz': i, 'user': USER_ID, 'timestamp': now} for i in range(1, closed + 1, 2)])
+            db.session.commit()
+            catalog.get_catalog()
+
+            old_ms, old_size = timed(old_dashboard, rows)
+            new_ms, new_size = timed(new_dashboard, rows)
+
+            print(f"{closed} closed quizzes, {current} open or upcoming")
+            print(f"Every quiz:               {old_ms:7.2f} ms and {old_size / 1024:7.1f} KiB per dashboard")
+            print(f"Open and upcoming only:   {new_ms:7.2f} ms and {new_size / 1024:7.1f} KiB per dashboard")
+
+
+if __name__ == '__main__':
+    main()
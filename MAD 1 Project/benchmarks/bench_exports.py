@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for streaming score exports.
+Fills a throwaway database with scores, streams CSV and XLSX exports through
+the same generators the routes use, and reports throughput, peak Python
+memory and how long a concurrent writer waits while an export is running.
+
+Usage: python benchmarks/bench_exports.py [number_of_scores]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+import exports
+
+
+def populate(score_count):
+    db.session.execute(text(
+        "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+        "VALUES (1, 'student@example.com', 'x', 'Student', 'None', '2000-01-01', 0)"))
+    db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+    db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+    db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration) VALUES (1, 1, '2024-01-01', '01:00')"))
+    batch = 50_000
+    for offset in range(0, score_count, batch):
+        db.session.execute(text(
+            "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+            "VALUES (1, 1, :score, 10, '2024-03-01 10:00:00')"
+        ), [{'score': i % 11} for i in range(offset, min(offset + batch, score_count))])
+    db.session.commit()
+
+
+def measure_writer(app, stop):
+    """Insert scores one transaction at a time and record the slowest commit"""
+    worst = 0.0
+    with app.app_context():
+        while not stop.is_set():
+            start = time.perf_counter()
+            with db.engine.begin() as connection:
+                connection.execute(text(
+                    "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                    "VALUES (1, 1, 5, 10, '2030-01-01 00:00:00')"))
+            worst = max(worst, time.perf_counter() - start)
+            time.sleep(0.01)
+    return worst
+
+
+def main():
+    score_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            populate(score_count)
+            print(f"{score_count} scores")
+
+            # Only export the seeded rows, not the ones the writer adds
+            filters = exports.parse_filters({'end': '2024-12-31'})
+            for fmt in ('csv', 'xlsx'):
+                # Throughput on its own, without tracing or a competing writer
+                start = time.perf_counter()
+                size = sum(len(data) for data in exports.generate_export(fmt, filters))
+                elapsed = time.perf_counter() - start
+
+                # Peak memory and write latency while another thread keeps committing
+                stop = threading.Event()
+                result = {}
+                writer = threading.Thread(target=lambda: result.update(worst=measure_writer(app, stop)))
+                writer.start()
+                tracemalloc.start()
+                for _ in exports.generate_export(fmt, filters):
+                    pass
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                stop.set()
+                writer.join()
+
+                print(f"{fmt:5} {size / 1e6:8.1f} MB in {elapsed:6.2f}s "
+                      f"({score_count / elapsed:,.0f} rows/s), peak Python memory {peak / 1e6:.1f} MB, "
+                      f"slowest concurrent write {result['worst'] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
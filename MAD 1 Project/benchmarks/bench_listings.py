@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the listing pages' read path.
+Fills the chapter, question, quiz and score tables with 100k rows each, then
+compares loading each listing as ORM objects (reading the same fields the
+template prints, relationships included) with the column selects and
+__slots__ rows of listings.py. Reports the time per call and the peak memory
+allocated while building the rows.
+
+Usage: python benchmarks/bench_listings.py [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Chapter, Quiz, Question, Score
+import listings
+
+RUNS = 3
+USER_ID = 1
+SCORES_PER_PAGE = 20
+
+
+def orm_chapters():
+    return [(chapter.id, chapter.name, chapter.description)
+            for chapter in Chapter.query.filter_by(subject_id=1).all()]
+
+
+def orm_questions():
+    return [(question.id, question.question_text, question.option1, question.option2,
+             question.option3, question.option4, question.correct_option)
+            for question in Question.query.filter_by(quiz_id=1).all()]
+
+
+def orm_quizzes():
+    return [(quiz.id, quiz.chapter.name, quiz.chapter.subject.name, quiz.date, quiz.closes_at,
+             quiz.duration, quiz.pool_size)
+            for quiz in Quiz.query.all()]
+
+
+def orm_score_page():
+    scores = Score.query.filter_by(user_id=USER_ID).order_by(Score.timestamp.desc(), Score.id.desc()) \
+        .limit(SCORES_PER_PAGE).all()
+    return [(score.id, score.quiz.chapter.subject.name, score.quiz.chapter.name, score.timestamp,
+             score.score, score.total_questions) for score in scores]
+
+
+CASES = [
+    ('admin_chapters (100k chapters)', orm_chapters, lambda: listings.subject_chapters(1)),
+    ('admin_questions (100k questions)', orm_questions, lambda: listings.quiz_questions(1)),
+    ('all_quizzes, every row', orm_quizzes, lambda: listings.quiz_page(1, per_page=10 ** 9)[0]),
+    ('all_quizzes, one page', orm_quizzes, lambda: listings.quiz_page(1)[0]),
+    ('user_scores, one page', orm_score_page,
+     lambda: listings.score_rows(Score, USER_ID, 0, SCORES_PER_PAGE)),
+]
+
+
+def measure(function):
+    """Milliseconds per call and peak KiB allocated, each with a fresh session"""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        function()
+        db.session.remove()
+    elapsed = (time.perf_counter() - start) / RUNS * 1000
+
+    tracemalloc.start()
+    rows = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    return elapsed, peak / 1024, len(rows)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    chapters_for_quizzes = 100
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            now = datetime.now()
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench'), (2, 'Other')"))
+            # Subject 1 holds the 100k chapters; subject 2 a few chapters for the quizzes
+            db.session.execute(text(
+                "INSERT INTO chapter (id, name, description, subject_id) VALUES (:id, :name, 'About it', :subject)"),
+                [{'id': i, 'name': f'Chapter {i}', 'subject': 1 if i <= rows else 2}
+                 for i in range(1, rows + chapters_for_quizzes + 1)])
+            db.session.execute(text(
+                "INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) "
+                "VALUES (:id, :chapter, :opens, '00:30', 1800)"),
+                [{'id': i, 'chapter': rows + 1 + i % chapters_for_quizzes, 'opens': now}
+                 for i in range(1, rows + 1)])
+            db.session.execute(text(
+                "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+                "VALUES (1, :text, 'a', 'b', 'c', 'd', 1)"),
+                [{'text': f'Question {i}'} for i in range(rows)])
+            db.session.execute(text(
+                "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+                "VALUES (:id, 'bench@example.com', 'x', 'Bench', 'q', '2000-01-01', 0)"), {'id': USER_ID})
+            db.session.execute(text(
+                "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                "VALUES (:quiz, :user, 5, 10, :timestamp)"),
+                [{'quiz': 1 + i, 'user': USER_ID, 'timestamp': now - timedelta(minutes=i)} for i in range(rows)])
+            db.session.commit()
+            db.session.remove()
+
+            print(f"{'listing':34}  {'rows':>6}  {'ORM':>20}  {'listings.py':>20}")
+            for name, orm_path, listing_path in CASES:
+                orm_ms, orm_kib, _ = measure(orm_path)
+                new_ms, new_kib, count = measure(listing_path)
+                print(f"{name:34}  {count:6d}  {orm_ms:8.1f} ms {orm_kib:7.0f} KiB  "
+                      f"{new_ms:8.1f} ms {new_kib:7.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
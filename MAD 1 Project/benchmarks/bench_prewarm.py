@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Benchmark for warming up the caches before a quiz opens.
+A fresh worker process serves the first wave of an exam: every student loads
+the dashboard, opens the quiz and loads its questions at the moment it opens,
+from several threads. It runs:
+  - cold, as a worker that hasn't served the quiz yet
+  - after prewarm.warm_due() ran before the opening, as the prewarmer does
+and reports the latency of the first request each thread makes to every page
+(the ones that find the caches cold), of all requests, and how many queries
+on the question table the students' requests ran.
+
+Usage: python benchmarks/bench_prewarm.py [students] [questions] [threads]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+SECRET_KEY = 'bench'
+
+# Seconds from preparing the quiz to its opening
+OPENS_IN = 5
+
+
+def make_app(database):
+    from flask import Flask
+
+    from extensions import db
+    import autosave
+    import coherence
+    import db_routing
+    import prewarm
+    import ratelimit
+    import tenants
+    from routes import register_routes
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    app.config['RATE_LIMIT_ENABLED'] = False
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    coherence.init_app(app)
+    ratelimit.init_app(app)
+    register_routes(app)
+    autosave.init_app(app)
+    # The thread isn't started; the benchmark warms up at a set time instead
+    prewarm.init_app(app)
+    app.config['PREWARM_LEAD_MINUTES'] = 10
+    return app
+
+
+def prepare(database, students, questions, opens_at):
+    """Create the quiz and students in a separate process's database"""
+    from sqlalchemy import text
+    from extensions import db
+
+    app = make_app(database)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+        db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) "
+                                "VALUES (1, 1, :opens_at, '01:00', 3600)"), {'opens_at': opens_at})
+        db.session.execute(text(
+            "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+            "VALUES (1, :text, 'a', 'b', 'c', 'd', 1)"), [{'text': f'Question {i}'} for i in range(questions)])
+        db.session.execute(text(
+            "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+            "VALUES (:id, :email, 'x', 'Student', 'q', :dob, 0)"),
+            [{'id': user_id, 'email': f's{user_id}@example.com', 'dob': datetime(2000, 1, 1)}
+             for user_id in range(1, students + 1)])
+        db.session.commit()
+
+
+def run(database, students, threads, prewarmed, opens_at):
+    """Returns ({page: [(started, seconds), ...]}, queries on the question table during the wave)"""
+    from sqlalchemy import event
+    from extensions import db
+    import prewarm
+
+    app = make_app(database)
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    question_queries = [0]
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(connection, cursor, statement, parameters, context, executemany):
+            if 'FROM question' in statement:
+                question_queries[0] += 1
+
+        if prewarmed:
+            # As the prewarmer does before the quiz opens
+            prewarm.warm_due(app)
+    question_queries[0] = 0
+
+    time.sleep(max(0.0, (opens_at - datetime.now()).total_seconds()))
+    latencies = {'dashboard': [], 'quiz page': [], 'questions': []}
+    lock = threading.Lock()
+    pages = (('dashboard', '/user/dashboard'), ('quiz page', '/user/quiz/1'), ('questions', '/api/quizzes/1/questions'))
+
+    def student(user_ids):
+        client = app.test_client()
+        timings = []
+        for user_id in user_ids:
+            client.set_cookie('session', serializer.dumps({'user_id': user_id}))
+            for label, path in pages:
+                start = time.perf_counter()
+                response = client.get(path)
+                timings.append((label, start, time.perf_counter() - start))
+                assert response.status_code == 200, (path, response.status_code)
+        with lock:
+            for label, start, seconds in timings:
+                latencies[label].append((start, seconds))
+
+    workers = [threading.Thread(target=student, args=(range(number + 1, students + 1, threads),))
+               for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, question_queries[0]
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        # Each setup runs in a fresh process, so it starts with cold caches
+        database, students, threads, prewarmed, opens_at = sys.argv[2:7]
+        print(json.dumps(run(database, int(students), int(threads), bool(int(prewarmed)),
+                             datetime.fromisoformat(opens_at))))
+        return
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    questions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    print(f"{students} students opening a {questions}-question quiz the moment it opens, from {threads} threads")
+    print(f"{'caches':10}  {'page':10}  {'first p50':>9}  {'first max':>9}  {'all p50':>9}  {'all p99':>9}  "
+          f"{'question queries':>16}")
+    for label, prewarmed in (('Cold', False), ('Prewarmed', True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            database = os.path.join(tmp, 'bench.db')
+            opens_at = datetime.now() + timedelta(seconds=OPENS_IN)
+            prepare(database, students, questions, opens_at)
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', database, str(students),
+                                     str(threads), str(int(prewarmed)), opens_at.isoformat()],
+                                    check=True, capture_output=True, text=True).stdout
+        latencies, question_queries = json.loads(output.splitlines()[-1])
+        for number, (page, timings) in enumerate(latencies.items()):
+            # The first request from each thread, in the order they started
+            first = sorted(seconds for _, seconds in sorted(timings)[:threads])
+            every = sorted(seconds for _, seconds in timings)
+            p99 = every[int(len(every) * 0.99) - 1]
+            queries = str(question_queries) if number == 0 else ''
+            print(f"{label if number == 0 else '':10}  {page:10}  {statistics.median(first) * 1000:6.1f} ms  "
+                  f"{first[-1] * 1000:6.1f} ms  {statistics.median(every) * 1000:6.1f} ms  {p99 * 1000:6.1f} ms  "
+                  f"{queries:>16}")
+
+
+if __name__ == '__main__':
+    main()
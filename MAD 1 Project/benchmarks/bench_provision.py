@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark for bulk user provisioning.
+Creates the same students:
+  - one at a time, as the registration form does (lookup, hash, insert, commit)
+  - with provisioning.provision_users hashing in the same process
+  - with provisioning.provision_users on a pool of hashing processes
+and reports users per second and the projected time for 50,000 users. Almost
+all of the time is password hashing, so the pool scales with the CPU cores.
+
+Usage: python benchmarks/bench_provision.py [users] [workers ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+PROJECTED_USERS = 50_000
+
+
+def make_app(database):
+    from flask import Flask
+
+    from extensions import db
+    import db_routing
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    db_routing.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    return app
+
+
+def students(count, prefix):
+    return [(line, {'email': f'{prefix}{line}@school.example.com', 'full_name': f'Student {line}',
+                    'password': f'initial-{line}'}) for line in range(2, count + 2)]
+
+
+def one_at_a_time(rows):
+    from werkzeug.security import generate_password_hash
+    from extensions import db
+    from models import User
+
+    for line, row in rows:
+        if User.query.filter_by(email=row['email']).first():
+            continue
+        db.session.add(User(email=row['email'], password=generate_password_hash(row['password']),
+                            full_name=row['full_name'], qualification='Not specified',
+                            dob=datetime(2000, 1, 1), is_admin=False))
+        db.session.commit()
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    cpus = os.cpu_count() or 1
+    pools = [int(workers) for workers in sys.argv[2:]] or sorted({1, cpus})
+
+    import provisioning
+    from extensions import db
+
+    start = time.perf_counter()
+    provisioning.hash_passwords(['initial-password'] * 20)
+    per_hash = (time.perf_counter() - start) / 20
+    print(f"{users} users, {cpus} CPU(s), {per_hash * 1000:.0f} ms to hash one password")
+    print(f"{'method':34}  {'time':>9}  {'users/s':>8}  {f'{PROJECTED_USERS:,} users':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all(bind_key=None)
+            setups = [('One at a time (registration form)', lambda rows: one_at_a_time(rows)),
+                      ('Bulk, hashing in process', lambda rows: provisioning.provision_users(rows, workers=0))]
+            setups += [(f'Bulk, {workers} hashing process(es)',
+                        lambda rows, workers=workers: provisioning.provision_users(rows, workers=workers))
+                       for workers in pools]
+            for number, (label, provision) in enumerate(setups):
+                rows = students(users, f's{number}_')
+                start = time.perf_counter()
+                provision(rows)
+                elapsed = time.perf_counter() - start
+                rate = users / elapsed
+                print(f"{label:34}  {elapsed:7.2f} s  {rate:8.1f}  {PROJECTED_USERS / rate / 60:10.1f} min")
+
+
+if __name__ == '__main__':
+    main()
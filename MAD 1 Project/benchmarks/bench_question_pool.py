@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark for drawing a random question set from a large pool.
+Compares ORDER BY RANDOM() over the quiz's questions with sampling from the
+cached id array used by question_pool.
+
+Usage: python benchmarks/bench_question_pool.py [pool_size] [questions_per_attempt]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Quiz
+import question_pool
+
+
+def main():
+    pool_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    draw_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+            db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration, pool_size, shuffle_options) "
+                                    "VALUES (1, 1, '2024-01-01', '01:00', :k, 1)"), {'k': draw_size})
+            db.session.execute(text(
+                "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+                "VALUES (1, :text, 'a', 'b', 'c', 'd', 1)"
+            ), [{'text': f'Question {i}'} for i in range(pool_size)])
+            db.session.commit()
+            quiz = db.session.get(Quiz, 1)
+
+            repeat = 200
+            start = time.perf_counter()
+            for _ in range(repeat):
+                db.session.execute(text(
+                    "SELECT id FROM question WHERE quiz_id = 1 ORDER BY RANDOM() LIMIT :k"
+                ), {'k': draw_size}).fetchall()
+            random_ms = (time.perf_counter() - start) / repeat * 1000
+
+            start = time.perf_counter()
+            question_pool.get_pool(quiz.id)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                question_pool.draw_questions(quiz, rng=rng)
+            sample_ms = (time.perf_counter() - start) / repeat * 1000
+
+            print(f"Pool of {pool_size} questions, {draw_size} per attempt")
+            print(f"ORDER BY RANDOM():      {random_ms:8.3f} ms per draw")
+            print(f"Cached id array sample: {sample_ms:8.3f} ms per draw "
+                  f"(one-off pool load {load_ms:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
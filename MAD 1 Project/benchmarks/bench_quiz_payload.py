@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the client-rendered quiz page.
+Compares the server work and bytes sent per attempt when every question and
+option is rendered into HTML (the old quiz page) with the new page, which only
+carries the attempt's layout plus the shared JSON payload of the questions.
+The payload is encoded once per quiz; a browser that already has it only gets
+a 304 back.
+
+Usage: python benchmarks/bench_quiz_payload.py [questions] [attempts]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Quiz, Question
+import question_pool
+
+# The question loop of the old server-rendered quiz page
+OLD_PAGE = """
+{% for question in questions %}
+<div class="card question-card">
+    <div class="card-header">
+        <h5>Question {{ loop.index }}/{{ questions|length }}</h5>
+    </div>
+    <div class="card-body">
+        <p class="card-text">{{ question.text }}</p>
+        {% for number, option_text in question.options %}
+        <div class="form-check mb-2">
+            <input class="form-check-input" type="radio" name="question_{{ question.id }}" id="option{{ number }}_{{ question.id }}" value="{{ number }}" {% if loop.first %}required{% endif %}>
+            <label class="form-check-label" for="option{{ number }}_{{ question.id }}">
+                {{ option_text }}
+            </label>
+        </div>
+        {% endfor %}
+    </div>
+</div>
+{% endfor %}
+"""
+
+NEW_PAGE = """<script type="application/json" id="quiz-layout">{{ layout|tojson }}</script>"""
+
+
+def load_attempt_questions(attempt):
+    """What the old quiz page loaded per attempt: every drawn question, options reordered"""
+    question_ids = json.loads(attempt.question_ids)
+    option_orders = json.loads(attempt.option_orders)
+    questions = {question.id: question
+                 for question in Question.query.filter(Question.id.in_(question_ids))}
+    return [{'id': question_id, 'text': questions[question_id].question_text,
+             'options': [(number, getattr(questions[question_id], f'option{number}')) for number in order]}
+            for question_id, order in zip(question_ids, option_orders)]
+
+
+def main():
+    question_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    attempts = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        old_page = app.jinja_env.from_string(OLD_PAGE)
+        new_page = app.jinja_env.from_string(NEW_PAGE)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+            db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration, shuffle_options) "
+                                    "VALUES (1, 1, '2024-01-01', '01:00', 1)"))
+            db.session.execute(text(
+                "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+                "VALUES (1, :text, :a, :b, :c, :d, 1)"
+            ), [{'text': f'Question {i}: which of the following statements about topic {i} is correct?',
+                 'a': f'The first answer for topic {i}', 'b': f'The second answer for topic {i}',
+                 'c': f'The third answer for topic {i}', 'd': f'None of the above for topic {i}'}
+                for i in range(question_count)])
+            db.session.commit()
+            quiz = db.session.get(Quiz, 1)
+            attempt_list = [question_pool.start_attempt(quiz, user_id) for user_id in range(1, attempts + 1)]
+
+            start = time.perf_counter()
+            old_bytes = 0
+            for attempt in attempt_list:
+                old_bytes += len(old_page.render(questions=load_attempt_questions(attempt)).encode())
+            old_ms = (time.perf_counter() - start) / attempts * 1000
+
+            start = time.perf_counter()
+            body, etag = question_pool.quiz_payload(quiz)
+            payload_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            new_bytes = 0
+            for attempt in attempt_list:
+                new_bytes += len(new_page.render(layout=question_pool.attempt_layout(attempt)).encode())
+                # Every later student's payload request is a cache hit on the server
+                question_pool.quiz_payload(quiz)
+            new_ms = (time.perf_counter() - start) / attempts * 1000
+
+            print(f"{question_count} questions, {attempts} attempts")
+            print(f"Server-rendered questions: {old_ms:7.2f} ms and {old_bytes / attempts / 1024:6.1f} KiB per attempt")
+            print(f"Layout + cached payload:   {new_ms:7.2f} ms and {new_bytes / attempts / 1024:6.1f} KiB per attempt, "
+                  f"plus the {len(body) / 1024:.1f} KiB payload once per browser "
+                  f"(encoded once in {payload_ms:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
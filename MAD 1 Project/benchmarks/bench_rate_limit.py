@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark for admission control under overload.
+Many clients hit an endpoint whose work is serialized (like SQLite's single
+writer) faster than it can serve them. Without a limit every request queues
+behind all the others; with ratelimit's concurrency gate, requests beyond a
+short queue are shed with 503 and the latency of the ones served stays bounded.
+
+Usage: python benchmarks/bench_rate_limit.py [clients] [requests_per_client]
+"""
+
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+
+import ratelimit
+
+# Time each request holds the simulated write lock (seconds)
+WORK_SECONDS = 0.005
+
+
+def make_app(enabled):
+    app = Flask(__name__)
+    app.config['RATE_LIMIT_ENABLED'] = enabled
+    app.config['RATE_LIMIT_QUEUE_SECONDS'] = 0.25
+    # Only the concurrency gate matters here; the bucket never runs dry
+    app.config['RATE_LIMITS'] = {'submit': {'burst': 10 ** 9, 'per_second': 10 ** 9, 'concurrency': 4}}
+    ratelimit.init_app(app)
+    write_lock = threading.Lock()
+
+    @app.route('/submit', methods=['POST'])
+    @ratelimit.limited
+    def submit():
+        with write_lock:
+            time.sleep(WORK_SECONDS)
+        return 'ok'
+
+    return app
+
+
+def run(app, clients, requests_per_client):
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+
+    def client_loop(number):
+        client = app.test_client()
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            # JSON, like the quiz page's submissions, so rejections are JSON too
+            status = client.post('/submit', json={'answers': []},
+                                 environ_base={'REMOTE_ADDR': f'10.0.0.{number % 250}'}).status_code
+            with lock:
+                statuses.append(status)
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client_loop, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def report(label, latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    print(f"{label}")
+    print(f"  served {len(ordered):5d}   p50 {statistics.median(ordered) * 1000:7.1f} ms   "
+          f"p99 {p99 * 1000:7.1f} ms   max {ordered[-1] * 1000:7.1f} ms")
+    print(f"  shed   {statuses.count(503):5d} with 503   {len(ordered) / elapsed:6.1f} served/s")
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    requests_per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    capacity = 1 / WORK_SECONDS
+    print(f"{clients} clients x {requests_per_client} requests, endpoint capacity {capacity:.0f} requests/s")
+
+    report('No admission control', *run(make_app(enabled=False), clients, requests_per_client))
+    report('Concurrency gate (4 running, 0.25 s queue)', *run(make_app(enabled=True), clients, requests_per_client))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the read/write engine split.
+Measures quiz submission latency (insert a score and commit) while several
+threads run summary-style aggregate queries over the score table, first with
+one shared engine on a rollback-journal database (the old setup), then with
+db_routing: WAL mode plus a separate read-only engine for the analytics.
+
+Usage: python benchmarks/bench_read_split.py [number_of_scores] [reader_threads]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+from models import Score
+import db_routing
+
+SUBMISSIONS = 300
+QUIZZES = 50
+
+# Pause between submissions, like students submitting over a few seconds
+SUBMIT_INTERVAL = 0.01
+
+ANALYTICS_QUERY = text(
+    "SELECT quiz_id, count(*), avg(score * 100.0 / total_questions), max(score) "
+    "FROM score GROUP BY quiz_id"
+)
+
+
+def make_app(path, split):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    if split:
+        db_routing.configure(app)
+    db.init_app(app)
+    if split:
+        db_routing.init_app(app)
+    else:
+        with app.app_context():
+            @event.listens_for(db.engine, 'connect')
+            def _rollback_journal(dbapi_connection, connection_record):
+                dbapi_connection.execute('PRAGMA journal_mode=DELETE')
+    return app
+
+
+def fill(app, score_count, rng):
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+        for quiz_id in range(1, QUIZZES + 1):
+            db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration) "
+                                    "VALUES (:id, 1, '2024-01-01', '01:00')"), {'id': quiz_id})
+        db.session.execute(text(
+            "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+            "VALUES (:quiz, :user, :score, 10, '2024-01-01 10:00:00.000000')"
+        ), [{'quiz': rng.randint(1, QUIZZES), 'user': rng.randint(1, 1000), 'score': rng.randint(0, 10)}
+            for _ in range(score_count)])
+        db.session.commit()
+        if db.session.execute(text("PRAGMA journal_mode")).scalar() == 'wal':
+            db.session.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+
+def run(app, engine_for_reads, readers):
+    """Submit scores one by one while reader threads loop over the analytics query"""
+    stop = threading.Event()
+    read_counts = []
+    read_errors = []
+
+    def analytics_loop():
+        count = errors = 0
+        with app.app_context():
+            engine = engine_for_reads()
+            while not stop.is_set():
+                try:
+                    with engine.connect() as connection:
+                        connection.execute(ANALYTICS_QUERY).all()
+                    count += 1
+                except OperationalError:
+                    errors += 1  # "database is locked"
+        read_counts.append(count)
+        read_errors.append(errors)
+
+    threads = [threading.Thread(target=analytics_loop) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    with app.app_context():
+        for i in range(SUBMISSIONS):
+            start = time.perf_counter()
+            try:
+                db.session.add(Score(quiz_id=1 + i % QUIZZES, user_id=5000 + i, score=5,
+                                     total_questions=10, timestamp=datetime.now()))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+            time.sleep(SUBMIT_INTERVAL)
+        db.session.remove()
+
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, sum(read_counts) / elapsed, sum(read_errors)
+
+
+def report(label, latencies, errors, reads, read_errors):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{label}")
+    print(f"  submit  p50 {statistics.median(ordered) * 1000:7.1f} ms   p95 {p95 * 1000:7.1f} ms   "
+          f"max {ordered[-1] * 1000:7.1f} ms   failed {errors}")
+    print(f"  analytics {reads:5.1f} queries/s, {read_errors} failed with 'database is locked'")
+
+
+def main():
+    score_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{score_count} scores, {readers} analytics threads, {SUBMISSIONS} submissions")
+
+        shared = make_app(os.path.join(tmp, 'shared.db'), split=False)
+        fill(shared, score_count, random.Random(42))
+        report('Shared engine, rollback', *run(shared, lambda: db.engine, readers))
+
+        split = make_app(os.path.join(tmp, 'split.db'), split=True)
+        fill(split, score_count, random.Random(42))
+        report('Read engine + WAL', *run(split, db_routing.read_engine, readers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the dashboard's quiz recommendation.
+Compares the old Jinja loop (every quiz checked against the list of the
+user's attempted quiz ids, first unattempted one wins) with the
+recommendations module, both freshly built from the indexed "unattempted
+quizzes" query and the precomputed averages, and served from its cache.
+
+Usage: python benchmarks/bench_recommendations.py [open_quizzes] [attempted_quizzes]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Score
+import catalog
+import recommendations
+import rollups
+
+# The recommendation panel of the old user dashboard
+OLD_PANEL = """
+{% set available_quizzes = [] %}
+{% for quiz in quizzes %}
+    {% if quiz.id not in attempted_quiz_ids and quiz.question_count > 0 %}
+        {% set available_quizzes = available_quizzes + [quiz] %}
+    {% endif %}
+{% endfor %}
+{% if available_quizzes %}{{ (available_quizzes|first).chapter.name }}{% endif %}
+"""
+
+RUNS = 50
+USER_ID = 1
+CHAPTERS = 50
+
+
+def old_recommendation(panel):
+    quizzes = catalog.get_catalog().quizzes
+    attempted_quiz_ids = [score.quiz_id for score in Score.query.filter_by(user_id=USER_ID).all()]
+    return panel.render(quizzes=quizzes, attempted_quiz_ids=attempted_quiz_ids)
+
+
+def timed(function):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        function()
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+def main():
+    quiz_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    attempted = int(sys.argv[2]) if len(sys.argv) > 2 else 1500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        panel = app.jinja_env.from_string(OLD_PANEL)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            now = datetime.now()
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (:id, :name, 1)"),
+                               [{'id': i, 'name': f'Chapter {i}'} for i in range(1, CHAPTERS + 1)])
+            db.session.execute(text(
+                "INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) "
+                "VALUES (:id, :chapter, :opens, '00:30', 1800)"),
+                [{'id': i, 'chapter': 1 + i % CHAPTERS, 'opens': now - timedelta(days=1)}
+                 for i in range(1, quiz_count + 1)])
+            db.session.execute(text(
+                "INSERT INTO question (quiz_id, question_text, option1, option2, option3, option4, correct_option) "
+                "VALUES (:quiz, 'Q', 'a', 'b', 'c', 'd', 1)"),
+                [{'quiz': i} for i in range(1, quiz_count + 1)])
+            db.session.execute(text(
+                "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                "VALUES (:quiz, :user, :score, 10, :timestamp)"),
+                [{'quiz': i, 'user': USER_ID, 'score': i % 11, 'timestamp': now - timedelta(hours=i)}
+                 for i in range(1, attempted + 1)])
+            db.session.commit()
+            with db.engine.begin() as connection:
+                rollups.rebuild_rollups(connection)
+            catalog.get_catalog()
+
+            old_ms = timed(lambda: old_recommendation(panel))
+            built_ms = timed(lambda: recommendations.build_recommendations(USER_ID))
+            recommendations.get_recommendations(USER_ID)
+            cached_ms = timed(lambda: recommendations.get_recommendations(USER_ID))
+
+            print(f"{quiz_count} open quizzes, {attempted} attempted by the user")
+            print(f"Jinja loop over every quiz:  {old_ms:8.2f} ms")
+            print(f"Scored recommendations:      {built_ms:8.2f} ms")
+            print(f"Cached until next submit:    {cached_ms:8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the daily attempt rollups.
+Fills a throwaway database with one user's scores spread over three years,
+then times building the user summary charts by scanning every score (the old
+approach) against reading the per-day rollups, plus a full rebuild.
+
+Usage: python benchmarks/bench_rollups.py [number_of_scores]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Subject, Chapter, Quiz, Score
+import rollups
+
+SUBJECTS = 5
+QUIZZES_PER_SUBJECT = 20
+
+
+def summary_from_scores(user_id):
+    """The user summary charts computed from every score row"""
+    subject_of_quiz = dict(db.session.query(Quiz.id, Subject.name)
+                           .join(Chapter, Chapter.id == Quiz.chapter_id)
+                           .join(Subject, Subject.id == Chapter.subject_id))
+    subjects = {}
+    months = {}
+    for score in Score.query.filter_by(user_id=user_id).order_by(Score.timestamp):
+        bucket = subjects.setdefault(subject_of_quiz[score.quiz_id], [0.0, 0])
+        if score.total_questions > 0:
+            bucket[0] += score.score / score.total_questions * 100
+        bucket[1] += 1
+        month = score.timestamp.strftime('%b %Y')
+        months[month] = months.get(month, 0) + 1
+    return ({name: round(total / count, 1) for name, (total, count) in sorted(subjects.items())},
+            list(months.values()))
+
+
+def summary_from_rollups(user_id):
+    """The user summary charts read from the rollup tables"""
+    averages = {row['subject']: row['average'] for row in rollups.user_subject_averages(user_id)}
+    return averages, rollups.user_monthly_attempts(user_id)['counts']
+
+
+def best_of(function, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    score_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(42)
+    base = datetime(2022, 1, 1).timestamp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all(bind_key=None)
+            quiz_id = 0
+            for subject_id in range(1, SUBJECTS + 1):
+                db.session.execute(text("INSERT INTO subject (id, name) VALUES (:id, :name)"),
+                                   {'id': subject_id, 'name': f'Subject {subject_id}'})
+                db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (:id, 'Bench', :id)"),
+                                   {'id': subject_id})
+                for _ in range(QUIZZES_PER_SUBJECT):
+                    quiz_id += 1
+                    db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration) "
+                                            "VALUES (:id, :chapter, '2024-01-01', '01:00')"),
+                                       {'id': quiz_id, 'chapter': subject_id})
+            db.session.execute(text(
+                "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                "VALUES (:quiz, 1, :score, 10, :timestamp)"
+            ), [{'quiz': rng.randint(1, quiz_id), 'score': rng.randint(0, 10),
+                 'timestamp': datetime.fromtimestamp(base + rng.random() * 3 * 365 * 86400)
+                 .strftime('%Y-%m-%d %H:%M:%S.%f')}
+                for _ in range(score_count)])
+            db.session.commit()
+
+            rebuild_time, (user_days, _, _) = best_of(lambda: _rebuild(), repeat=1)
+            scan_time, scanned = best_of(lambda: summary_from_scores(1))
+            rollup_time, rolled = best_of(lambda: summary_from_rollups(1))
+            assert scanned[0] == rolled[0] and scanned[1] == rolled[1]
+
+            print(f"{score_count} scores, {user_days} user/subject days")
+            print(f"Summary from scores:  {scan_time * 1000:8.1f} ms")
+            print(f"Summary from rollups: {rollup_time * 1000:8.1f} ms  ({scan_time / rollup_time:.0f}x faster)")
+            print(f"Full rebuild:         {rebuild_time * 1000:8.1f} ms")
+
+
+def _rebuild():
+    with db.engine.begin() as connection:
+        return rollups.rebuild_rollups(connection)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for a new worker's first responses.
+Starts fresh Python processes that build the app and serve the login page and
+then the admin dashboard, and reports the time from process start until the
+app is ready, the latency of each page's first request, and the time from
+process start to the second response:
+  - without a bytecode cache (every template compiled on first use)
+  - with an empty cache (the first worker after a deploy)
+  - with a filled cache
+  - with a filled cache and TEMPLATE_WARMUP (templates loaded before serving)
+
+Usage: python benchmarks/bench_startup.py [workers_per_setup]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, PROJECT_DIR)
+
+ADMIN = {'email': 'admin@quizmaster.com', 'password': 'admin123'}
+
+
+def make_app(database, cache_folder=None, warm=False):
+    from flask import Flask
+
+    from extensions import db
+    import db_routing
+    import ratelimit
+    import tenants
+    import warmup
+    from routes import register_routes
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    app.config['TEMPLATE_CACHE_FOLDER'] = cache_folder
+    app.config['TEMPLATE_WARMUP'] = warm
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    ratelimit.init_app(app)
+    register_routes(app)
+    warmup.init_app(app)
+    return app
+
+
+def worker(database, cache_folder, warm):
+    """Runs in the child process: build the app, serve two pages, print the times"""
+    app = make_app(database, cache_folder or None, warm == '1')
+    ready = time.time()
+    client = app.test_client()
+    assert client.get('/login').status_code == 200
+    login = time.time()
+    # Log in through the session, so password hashing isn't timed
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['is_admin'] = True
+    dashboard_start = time.time()
+    assert client.get('/admin/dashboard').status_code == 200
+    dashboard = time.time()
+    print(json.dumps({'ready': ready, 'login': login, 'dashboard_start': dashboard_start, 'dashboard': dashboard}))
+
+
+def start_worker(database, cache_folder, warm):
+    started = time.time()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', database, cache_folder or '', '1' if warm else '0'],
+        check=True, capture_output=True, text=True).stdout
+    times = json.loads(output.strip().splitlines()[-1])
+    return {key: (value - started) * 1000 for key, value in times.items()}
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'bench.db')
+        app = make_app(database)
+        with app.app_context():
+            from extensions import db
+            import commands
+            db.create_all(bind_key=None)
+            commands.create_admin(**ADMIN)
+
+        cache_folder = os.path.join(tmp, 'jinja_cache')
+        setups = [('No bytecode cache', None, False, False),
+                  ('Empty cache', cache_folder, False, True),
+                  ('Filled cache', cache_folder, False, False),
+                  ('Filled cache + warm-up', cache_folder, True, False)]
+
+        print(f"{'setup':24}  {'app ready':>10}  {'first /login':>13}  {'first dashboard':>16}  {'total':>12}")
+        for label, folder, warm, empty_each_time in setups:
+            results = []
+            for _ in range(workers):
+                if empty_each_time:
+                    for name in os.listdir(folder) if os.path.isdir(folder) else ():
+                        os.remove(os.path.join(folder, name))
+                results.append(start_worker(database, folder, warm))
+            ready = statistics.median(result['ready'] for result in results)
+            login = statistics.median(result['login'] - result['ready'] for result in results)
+            dashboard = statistics.median(result['dashboard'] - result['dashboard_start'] for result in results)
+            total = statistics.median(result['dashboard'] for result in results)
+            print(f"{label:24}  {ready:7.0f} ms  {login:10.1f} ms  {dashboard:13.1f} ms  {total:9.0f} ms")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        worker(*sys.argv[2:5])
+    else:
+        main()
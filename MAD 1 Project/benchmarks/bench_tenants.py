@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark for per-tenant databases.
+Measures quiz submission latency for one tenant while another tenant runs an
+exam-day write burst (large score inserts in back-to-back transactions), first
+with both tenants registered on one shared database (the old setup), then with
+each tenant in its own database.
+
+Usage: python benchmarks/bench_tenants.py [scores_per_burst_transaction]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import Score
+import db_routing
+import tenants
+
+SUBMISSIONS = 200
+
+# Pause between submissions, like students submitting over a few seconds
+SUBMIT_INTERVAL = 0.01
+
+
+def make_app(folder):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(folder, 'registry.db')}"
+    app.config['TENANT_DATABASE_URI'] = 'sqlite:///' + os.path.join(folder, '{tenant}.db')
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    return app
+
+
+def provision(app, shared):
+    with app.app_context():
+        tenants.create_registry()
+        busy = tenants.create_tenant('busy', 'Busy')
+        # The shared setup registers the second tenant on the first one's database
+        tenants.create_tenant('quiet', 'Quiet', busy.database_uri if shared else None)
+        for slug in ('busy', 'quiet'):
+            tenants.activate(slug)
+            db.session.execute(text("INSERT OR IGNORE INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT OR IGNORE INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+            db.session.execute(text("INSERT OR IGNORE INTO quiz (id, chapter_id, date, duration) "
+                                    "VALUES (1, 1, '2024-01-01', '01:00')"))
+            db.session.commit()
+
+
+def run(app, burst_size):
+    """Submit scores for the quiet tenant while the busy tenant writes in bursts"""
+    stop = threading.Event()
+    bursts = []
+
+    def burst_loop():
+        count = 0
+        with app.app_context():
+            tenants.activate('busy')
+            rows = [{'user': 1 + i % 1000, 'score': i % 10} for i in range(burst_size)]
+            while not stop.is_set():
+                db.session.execute(text(
+                    "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                    "VALUES (1, :user, :score, 10, '2024-01-01 10:00:00.000000')"), rows)
+                db.session.commit()
+                count += 1
+            db.session.remove()
+        bursts.append(count)
+
+    thread = threading.Thread(target=burst_loop)
+    thread.start()
+    time.sleep(0.2)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    with app.app_context():
+        tenants.activate('quiet')
+        for i in range(SUBMISSIONS):
+            start = time.perf_counter()
+            try:
+                db.session.add(Score(quiz_id=1, user_id=5000 + i, score=5,
+                                     total_questions=10, timestamp=datetime.now()))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+            time.sleep(SUBMIT_INTERVAL)
+        db.session.remove()
+
+    elapsed = time.perf_counter() - started
+    stop.set()
+    thread.join()
+    return latencies, errors, sum(bursts) / elapsed
+
+
+def report(label, latencies, errors, bursts):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{label}")
+    print(f"  quiet tenant submit  p50 {statistics.median(ordered) * 1000:7.1f} ms   "
+          f"p95 {p95 * 1000:7.1f} ms   max {ordered[-1] * 1000:7.1f} ms   failed {errors}")
+    print(f"  busy tenant  {bursts:5.1f} burst transactions/s")
+
+
+def main():
+    burst_size = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    print(f"{SUBMISSIONS} submissions, {burst_size} scores per burst transaction")
+
+    for label, shared in (('Shared database', True), ('Database per tenant', False)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(tmp)
+            provision(app, shared)
+            report(label, *run(app, burst_size))
+            tenants.forget_engines()
+
+
+if __name__ == '__main__':
+    main()
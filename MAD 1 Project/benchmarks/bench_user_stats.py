@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the user dashboard's statistics.
+Compares the old way (load every score of the user through user.scores, then
+average and sort them) with reading the UserStats row and the three most
+recent scores, for users with longer and longer histories.
+
+Usage: python benchmarks/bench_user_stats.py [largest_history]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import text
+
+from extensions import db
+from models import User, Score
+import rollups
+
+RUNS = 20
+
+
+def old_stats(user_id):
+    user = db.session.get(User, user_id)
+    scores = user.scores
+    percentages = [score.score / score.total_questions * 100 for score in scores if score.total_questions > 0]
+    recent = sorted(scores, key=lambda score: score.timestamp, reverse=True)[:3]
+    result = (len(scores), sum(percentages) / len(percentages), recent)
+    db.session.expunge_all()
+    return result
+
+
+def new_stats(user_id):
+    stats = rollups.user_stats(user_id)
+    recent = Score.query.filter_by(user_id=user_id).order_by(Score.timestamp.desc()).limit(3).all()
+    result = (stats.attempts, stats.mean_percentage, recent)
+    db.session.expunge_all()
+    return result
+
+
+def timed(function, user_id):
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        function(user_id)
+    return (time.perf_counter() - start) / RUNS * 1000
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    histories = [size for size in (10, 100, 1000, 10000, 100000) if size <= largest]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all(bind_key=None)
+            now = datetime.now()
+            db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Bench')"))
+            db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Bench', 1)"))
+            db.session.execute(text("INSERT INTO quiz (id, chapter_id, date, duration) "
+                                    "VALUES (1, 1, '2024-01-01', '00:30')"))
+            for user_id, size in enumerate(histories, start=1):
+                db.session.execute(text(
+                    "INSERT INTO user (id, email, password, full_name, qualification, dob, is_admin) "
+                    "VALUES (:id, :email, 'x', 'Bench', 'q', '2000-01-01', 0)"),
+                    {'id': user_id, 'email': f'user{user_id}@example.com'})
+                db.session.execute(text(
+                    "INSERT INTO score (quiz_id, user_id, score, total_questions, timestamp) "
+                    "VALUES (1, :user, :score, 10, :timestamp)"),
+                    [{'user': user_id, 'score': i % 11, 'timestamp': now - timedelta(minutes=i)}
+                     for i in range(size)])
+            db.session.commit()
+            with db.engine.begin() as connection:
+                rollups.rebuild_rollups(connection)
+
+            print(f"{'scores':>8}  {'user.scores':>12}  {'UserStats':>10}")
+            for user_id, size in enumerate(histories, start=1):
+                assert old_stats(user_id)[0] == new_stats(user_id)[0]
+                print(f"{size:8d}  {timed(old_stats, user_id):9.2f} ms  {timed(new_stats, user_id):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# catalog.py
+# In-memory snapshot of the Subject -> Chapter -> Quiz tree
+# The tree is small and rarely changes, but the dashboards, the quiz form and
+# the chapters API read it on every request. Each worker keeps one immutable
+# snapshot built from four queries. Admin CRUD routes record their changes with
+# coherence.bump(CATALOG), which makes every worker call invalidate(); the next
+# read rebuilds the snapshot and swaps it in whole, so a request never sees a
+# half-built tree. Each tenant has its own snapshot.
+
+import threading
+
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Subject, Chapter, Quiz, Question
+import coherence
+import tenants
+
+# Tenant slug (None for the default database) -> catalog version and snapshot.
+# Versions go up when the catalog changes; a snapshot built for an older version is rebuilt
+_versions = {}
+_snapshots = {}
+_lock = threading.Lock()
+
+
+class SubjectEntry:
+    """A subject and its chapters"""
+
+    __slots__ = ('id', 'name', 'description', 'chapters')
+
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.chapters = ()
+
+
+class ChapterEntry:
+    """A chapter, its subject and its quizzes"""
+
+    __slots__ = ('id', 'name', 'description', 'subject_id', 'subject', 'quizzes')
+
+    def __init__(self, id, name, description, subject):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.subject_id = subject.id
+        self.subject = subject
+        self.quizzes = ()
+
+
+class QuizEntry:
+    """A quiz, its chapter and how many questions it has"""
+
+    __slots__ = ('id', 'chapter_id', 'chapter', 'date', 'closes_at', 'duration', 'duration_seconds',
+                 'remarks', 'pool_size', 'shuffle_options', 'question_count')
+
+    def __init__(self, id, chapter, date, closes_at, duration, duration_seconds, remarks, pool_size,
+                 shuffle_options, question_count):
+        self.id = id
+        self.chapter_id = chapter.id
+        self.chapter = chapter
+        self.date = date
+        self.closes_at = closes_at
+        self.duration = duration
+        self.duration_seconds = duration_seconds
+        self.remarks = remarks
+        self.pool_size = pool_size
+        self.shuffle_options = shuffle_options
+        self.question_count = question_count
+
+
+class Catalog:
+    """One version of the whole tree with lookups by id"""
+
+    __slots__ = ('version', 'subjects', 'quizzes', 'subjects_by_id', 'chapters_by_id', 'quizzes_by_id')
+
+    def __init__(self, version, subjects, quizzes, chapters_by_id):
+        self.version = version
+        self.subjects = subjects  # Tuple of SubjectEntry in id order
+        self.quizzes = quizzes  # Tuple of QuizEntry in id order
+        self.subjects_by_id = {subject.id: subject for subject in subjects}
+        self.chapters_by_id = chapters_by_id
+        self.quizzes_by_id = {quiz.id: quiz for quiz in quizzes}
+
+    @property
+    def chapter_count(self):
+        return len(self.chapters_by_id)
+
+
+def build_catalog(version):
+    """
+    Load the tree from the database into a new Catalog.
+
+    Args:
+        version: Version number the snapshot is built for
+
+    Returns:
+        Catalog
+    """
+    subjects = {}
+    for row in db.session.execute(
+            select(Subject.id, Subject.name, Subject.description).order_by(Subject.id)):
+        subjects[row.id] = SubjectEntry(row.id, row.name, row.description)
+
+    chapters = {}
+    subject_chapters = {subject_id: [] for subject_id in subjects}
+    for row in db.session.execute(
+            select(Chapter.id, Chapter.name, Chapter.description, Chapter.subject_id).order_by(Chapter.id)):
+        subject = subjects.get(row.subject_id)
+        if subject is None:
+            continue
+        chapter = ChapterEntry(row.id, row.name, row.description, subject)
+        chapters[row.id] = chapter
+        subject_chapters[row.subject_id].append(chapter)
+
+    question_counts = dict(db.session.execute(
+        select(Question.quiz_id, func.count(Question.id)).group_by(Question.quiz_id)).all())
+
+    quizzes = []
+    chapter_quizzes = {chapter_id: [] for chapter_id in chapters}
+    for row in db.session.execute(
+            select(Quiz.id, Quiz.chapter_id, Quiz.date, Quiz.closes_at, Quiz.duration, Quiz.duration_seconds,
+                   Quiz.remarks, Quiz.pool_size, Quiz.shuffle_options).order_by(Quiz.id)):
+        chapter = chapters.get(row.chapter_id)
+        if chapter is None:
+            continue
+        quiz = QuizEntry(row.id, chapter, row.date, row.closes_at, row.duration, row.duration_seconds,
+                         row.remarks, row.pool_size, row.shuffle_options, question_counts.get(row.id, 0))
+        quizzes.append(quiz)
+        chapter_quizzes[row.chapter_id].append(quiz)
+
+    for subject_id, subject in subjects.items():
+        subject.chapters = tuple(subject_chapters[subject_id])
+    for chapter_id, chapter in chapters.items():
+        chapter.quizzes = tuple(chapter_quizzes[chapter_id])
+
+    return Catalog(version, tuple(subjects.values()), tuple(quizzes), chapters)
+
+
+def get_catalog():
+    """Return the current snapshot, rebuilding it first if the catalog changed"""
+    tenant = tenants.current()
+    snapshot = _snapshots.get(tenant)
+    if snapshot is not None and snapshot.version == _versions.get(tenant, 0):
+        return snapshot
+    # Read the version before loading, so a bump during the build leaves this
+    # snapshot stale and the next read rebuilds again. The lock isn't held while
+    # loading: in requests served by asgi.py the queries yield to other
+    # requests on the same thread, which would then block on it
+    version = _versions.get(tenant, 0)
+    snapshot = build_catalog(version)
+    with _lock:
+        current = _snapshots.get(tenant)
+        if current is not None and current.version >= snapshot.version:
+            return current
+        _snapshots[tenant] = snapshot
+        return snapshot
+
+
+def invalidate(entity_id=None):
+    """Mark this worker's snapshot as stale; called by coherence.py when the catalog changes"""
+    tenant = tenants.current()
+    with _lock:
+        _versions[tenant] = _versions.get(tenant, 0) + 1
+
+
+coherence.register(coherence.CATALOG, invalidate)
+
+
+def current_version():
+    return _versions.get(tenants.current(), 0)
@@ -0,0 +1,202 @@
+# coherence.py
+# Keeping the in-process caches of several workers in step
+# The catalog snapshot, question pools and payloads, score analytics and
+# recommendations are cached in each worker's memory. When an admin edits a
+# quiz through one worker, the others have to find out without a shared cache
+# server, so the database itself records what changed:
+# - The cache_version table holds a version per cached entity (the catalog, a
+#   quiz's questions, a quiz's scores, a user's scores). Routes call bump()
+#   before they commit, so the new version is written in the same transaction
+#   as the change: it is visible exactly when the change is.
+# - Versions come from one counter, the highest version in the table plus
+#   one. SQLite takes the write lock at the bump and holds it until the commit,
+#   so versions are committed in increasing order.
+# - Before each request (at most every CACHE_CHECK_INTERVAL seconds) a worker
+#   reads the highest version, an indexed lookup. If it moved, the rows above
+#   the version the worker last saw name the entries to drop; nothing else is
+#   invalidated. A worker therefore never serves an entry that was changed more
+#   than CACHE_CHECK_INTERVAL seconds before its request started.
+# - The worker that made the change drops its own entries as soon as the
+#   transaction commits.
+# PRAGMA data_version isn't used as the cheap first check: it is per
+# connection, and changes with every quiz submission, which is most writes.
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, request
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from db_routing import RoutingSession
+from extensions import db
+from models import CacheVersion
+import db_routing
+import tenants
+
+# Entities whose versions are tracked. The id is the quiz or user id, or 0
+CATALOG = 'catalog'  # The subject -> chapter -> quiz tree
+QUIZ = 'quiz'  # A quiz's questions
+SCORES = 'scores'  # A quiz's scores
+USER = 'user'  # A user's scores
+EVERYTHING = 'everything'  # Every cached entry, e.g. after a restore
+
+# entity -> functions called with the entity id (None for every id) to drop cached entries
+_handlers = {}
+
+# Tenant slug (None for the default database) -> highest version applied, and when it was last checked
+_seen = {}
+_checked = {}
+_lock = threading.Lock()
+
+# (tenant slug, entity, entity id) -> loads in progress, see loading()
+_loads = {}
+
+
+class Load:
+    """A cache entry being loaded; current turns False if it is invalidated meanwhile"""
+
+    __slots__ = ('key', 'current')
+
+    def __init__(self, key):
+        self.key = key
+        self.current = True
+
+
+def register(entity, invalidate):
+    """
+    Have invalidate(entity_id) called when an entity changes, in this worker or
+    another. entity_id is None when every entry of the entity should go.
+    """
+    _handlers.setdefault(entity, []).append(invalidate)
+
+
+@contextmanager
+def loading(entity, entity_id):
+    """
+    Wrap loading a cache entry from the database. Store the entry only if
+    load.current is still True, checked under the same lock the invalidate
+    function takes, so a load that read the data before a change committed
+    doesn't put it back after the change was applied.
+    """
+    load = Load((tenants.current(), entity, entity_id))
+    with _lock:
+        _loads.setdefault(load.key, []).append(load)
+    try:
+        yield load
+    finally:
+        with _lock:
+            loads = _loads[load.key]
+            loads.remove(load)
+            if not loads:
+                del _loads[load.key]
+
+
+def invalidate(entity, entity_id=None):
+    """Drop this worker's cached entries for an entity (every id if entity_id is None)"""
+    tenant = tenants.current()
+    with _lock:
+        for key, loads in _loads.items():
+            if key[0] == tenant and (entity == EVERYTHING or (key[1] == entity and entity_id in (None, key[2]))):
+                for load in loads:
+                    load.current = False
+    if entity == EVERYTHING:
+        for invalidators in list(_handlers.values()):
+            for invalidator in invalidators:
+                invalidator(None)
+    else:
+        for invalidator in _handlers.get(entity, ()):
+            invalidator(entity_id)
+
+
+def _next_version(floor=0):
+    # Aliased, so it isn't correlated with the table being updated
+    latest = CacheVersion.__table__.alias('latest')
+    return select(func.max(func.coalesce(func.max(latest.c.version), 0), floor) + 1).scalar_subquery()
+
+
+def bump(entity, entity_id=0, floor=0):
+    """
+    Record a change to a cached entity in the current transaction. Call before
+    db.session.commit(); once it commits, this worker drops its entries at once
+    and the others at their next check.
+
+    Args:
+        entity: One of the entity names above
+        entity_id: ID of the quiz or user, or 0
+        floor: Version the new one must be above (see restore_backup)
+    """
+    pending = db.session.info.setdefault('cache_bumps', set())
+    if (entity, entity_id) in pending:
+        return
+    table = CacheVersion.__table__
+    updated = db.session.execute(
+        update(table).where(table.c.entity == entity, table.c.entity_id == entity_id)
+        .values(version=_next_version(floor)))
+    if not updated.rowcount:
+        db.session.execute(insert(table).values(entity=entity, entity_id=entity_id, version=_next_version(floor)))
+    pending.add((entity, entity_id))
+
+
+def latest_version(connection):
+    """Highest version in the cache_version table of a connection's database"""
+    return connection.execute(select(func.max(CacheVersion.version))).scalar() or 0
+
+
+def check():
+    """Drop the cached entries other workers changed since this worker last checked"""
+    tenant = tenants.current()
+    interval = current_app.config['CACHE_CHECK_INTERVAL']
+    now = time.monotonic()
+    seen = _seen.get(tenant)
+    if seen is not None and interval and now < _checked.get(tenant, 0) + interval:
+        return
+    _checked[tenant] = now
+
+    with db_routing.primary_engine().connect() as connection:
+        latest = latest_version(connection)
+        if seen is not None and latest == seen:
+            return
+        changes = None
+        if seen is not None and latest > seen:
+            changes = connection.execute(
+                select(CacheVersion.entity, CacheVersion.entity_id).where(CacheVersion.version > seen)).all()
+
+    if changes is None:
+        # First check in this worker, or the versions went back (the database
+        # was replaced): anything cached so far may be stale
+        invalidate(EVERYTHING)
+    else:
+        for entity, entity_id in changes:
+            invalidate(entity, entity_id)
+    with _lock:
+        if changes is None or latest > _seen.get(tenant, 0):
+            _seen[tenant] = latest
+
+
+def _check_request():
+    if request.endpoint == 'static':
+        return
+    try:
+        check()
+    except SQLAlchemyError as e:
+        # Serve from the caches rather than fail the request
+        current_app.logger.error(f"Cache version check failed: {str(e)}")
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_bumps(db_session):
+    for entity, entity_id in db_session.info.pop('cache_bumps', ()):
+        invalidate(entity, entity_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_bumps(db_session):
+    db_session.info.pop('cache_bumps', None)
+
+
+def init_app(app):
+    """Check the cache versions before every request. Call after tenants.init_app(app)."""
+    app.config.setdefault('CACHE_CHECK_INTERVAL', 0)
+    app.before_request(_check_request)
@@ -1,22 +1,43 @@
+import functools
 import click
+from flask import current_app
 from flask.cli import with_appcontext
-from __init__ import db
-from models import User
+from extensions import db
+from models import User, Tenant
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+import db_routing
+import search
+import exports
+import rollups
+import jobs
+import tasks
+import archive
+import backup
+import provisioning
+import tenants
+import warmup
 
-@click.command('init-db')
-@with_appcontext
-def init_db_command():
-    """Clear the existing data and create new tables."""
-    db.create_all()
-    
-    # Create admin user if not exists
-    admin = User.query.filter_by(email='admin@quizmaster.com').first()
+def tenant_option(command):
+    """Add a --tenant option that runs the command against that tenant's database"""
+    @click.option('--tenant', help="Use this tenant's database instead of the default one.")
+    @functools.wraps(command)
+    def wrapper(*args, tenant=None, **kwargs):
+        if tenant:
+            try:
+                tenants.activate(tenant)
+            except LookupError as e:
+                raise click.ClickException(str(e))
+        return command(*args, **kwargs)
+    return wrapper
+
+def create_admin(email='admin@quizmaster.com', password='admin123'):
+    """Create the admin user if it doesn't exist yet."""
+    admin = User.query.filter_by(email=email).first()
     if not admin:
         admin = User(
-            email='admin@quizmaster.com',
-            password=generate_password_hash('admin123'),
+            email=email,
+            password=generate_password_hash(password),
             full_name='Admin User',
             qualification='Administrator',
             dob=datetime.strptime('2000-01-01', '%Y-%m-%d'),
@@ -24,8 +45,280 @@ def init_db_command():
         )
         db.session.add(admin)
         db.session.commit()
+
+@click.command('init-db')
+@with_appcontext
+@tenant_option
+def init_db_command():
+    """Clear the existing data and create new tables."""
+    tenants.create_all()
+    
+    # Create admin user if not exists
+    create_admin()
     
     click.echo('Initialized the database.')
 
+@click.command('rebuild-search-index')
+@with_appcontext
+@tenant_option
+def rebuild_search_index_command():
+    """Rebuild the full-text search index from subjects, chapters and questions."""
+    with db_routing.primary_engine().begin() as connection:
+        search.create_search_index(connection)
+        count = search.rebuild_search_index(connection)
+    
+    click.echo(f'Search index rebuilt with {count} entries.')
+
+@click.command('rebuild-rollups')
+@with_appcontext
+@tenant_option
+def rebuild_rollups_command():
+    """Rebuild the daily attempt rollups from the score table."""
+    with db_routing.primary_engine().begin() as connection:
+        user_days, subject_days, user_chapters = rollups.rebuild_rollups(connection)
+    
+    click.echo(f'Rollups rebuilt: {user_days} user/subject days, {subject_days} subject days, '
+               f'{user_chapters} user/chapter totals.')
+
+@click.command('repair-user-stats')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only check this user (repeatable).')
+@with_appcontext
+@tenant_option
+def repair_user_stats_command(user_ids):
+    """Check each user's running totals against their scores and fix any that drifted."""
+    count = rollups.repair_user_stats(list(user_ids) or None)
+    db.session.commit()
+    
+    click.echo(f'User stats repaired for {count} users.' if count else 'User stats are up to date.')
+
+@click.command('export-scores')
+@click.option('--format', 'fmt', type=click.Choice(sorted(exports.FORMATS)), default='csv', help='Output format.')
+@click.option('--start', help='Only scores from this date on (YYYY-MM-DD).')
+@click.option('--end', help='Only scores up to this date (YYYY-MM-DD).')
+@click.option('--subject-id', type=int, help='Only scores for this subject.')
+@click.argument('output')
+@with_appcontext
+@tenant_option
+def export_scores_command(fmt, start, end, subject_id, output):
+    """Export quiz results to a CSV or XLSX file."""
+    filters = exports.parse_filters({'start': start, 'end': end, 'subject_id': subject_id})
+    size = exports.write_export(fmt, filters, output)
+    
+    click.echo(f'Exported scores to {output} ({size} bytes).')
+
+@click.command('archive-scores')
+@click.option('--before', help='Archive scores taken before this date (YYYY-MM-DD).')
+@click.option('--older-than-days', type=int, help='Archive scores older than this many days.')
+@with_appcontext
+@tenant_option
+def archive_scores_command(before, older_than_days):
+    """Move old scores from the score table into the archive."""
+    if before:
+        cutoff = datetime.strptime(before, '%Y-%m-%d')
+    else:
+        cutoff = archive.default_cutoff(older_than_days or current_app.config['SCORE_ARCHIVE_AFTER_DAYS'])
+    count = archive.archive_scores(cutoff)
+    counts = archive.archive_counts()
+    
+    click.echo(f'Archived {count} scores taken before {cutoff:%Y-%m-%d} '
+               f'({counts["hot"]} in the score table, {counts["archived"]} archived).')
+
+@click.command('restore-scores')
+@click.option('--since', required=True, help='Restore archived scores taken on or after this date (YYYY-MM-DD).')
+@with_appcontext
+@tenant_option
+def restore_scores_command(since):
+    """Move archived scores back into the score table."""
+    count = archive.restore_scores(datetime.strptime(since, '%Y-%m-%d'))
+    
+    click.echo(f'Restored {count} scores taken since {since}.')
+
+@click.command('enqueue-job')
+@click.argument('kind', type=click.Choice(jobs.task_kinds()))
+@click.option('--param', 'params', multiple=True, help='Task parameter as key=value (repeatable).')
+@click.option('--max-attempts', type=int, default=3, help='Attempts before the job is marked failed.')
+@with_appcontext
+@tenant_option
+def enqueue_job_command(kind, params, max_attempts):
+    """Queue a background job for the web workers or run-jobs to pick up."""
+    job_params = dict(param.split('=', 1) for param in params)
+    job = jobs.enqueue(kind, job_params, max_attempts=max_attempts)
+    
+    click.echo(f'Queued job #{job.id} ({kind}).')
+
+@click.command('run-jobs')
+@with_appcontext
+@tenant_option
+def run_jobs_command():
+    """Run all queued background jobs in this process, then exit."""
+    count = jobs.run_pending()
+    
+    click.echo(f'Ran {count} job(s).')
+
+@click.command('cancel-job')
+@click.argument('job_id', type=int)
+@with_appcontext
+@tenant_option
+def cancel_job_command(job_id):
+    """Cancel a queued job or ask a running one to stop."""
+    if jobs.cancel(job_id):
+        click.echo(f'Cancelled job #{job_id}.')
+    else:
+        click.echo(f'Job #{job_id} is not queued or running.')
+
+@click.command('create-tenant')
+@click.argument('slug')
+@click.option('--name', required=True, help='Name of the institution.')
+@click.option('--database-uri', help='Database for the tenant (default: TENANT_DATABASE_URI).')
+@click.option('--admin-email', default='admin@quizmaster.com', help="Email of the tenant's admin user.")
+@click.option('--admin-password', prompt=True, hide_input=True, confirmation_prompt=True,
+              help="Password of the tenant's admin user.")
+@with_appcontext
+def create_tenant_command(slug, name, database_uri, admin_email, admin_password):
+    """Register a tenant, create its database and its admin user."""
+    tenants.create_registry()
+    try:
+        tenant = tenants.create_tenant(slug, name, database_uri)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    tenants.activate(tenant.slug)
+    create_admin(admin_email, admin_password)
+    
+    click.echo(f'Created tenant {tenant.slug} ({tenant.database_uri}).')
+
+@click.command('list-tenants')
+@with_appcontext
+def list_tenants_command():
+    """List registered tenants and their databases."""
+    tenants.create_registry()
+    for tenant in Tenant.query.order_by(Tenant.slug).all():
+        click.echo(f'{tenant.slug}\t{tenant.name}\t{tenant.database_uri}')
+
+@click.command('migrate-tenants')
+@click.argument('slugs', nargs=-1)
+@with_appcontext
+def migrate_tenants_command(slugs):
+    """Bring tenant databases up to date with the models (all tenants by default)."""
+    tenants.create_registry()
+    slugs = slugs or [tenant.slug for tenant in Tenant.query.order_by(Tenant.slug).all()]
+    for slug in slugs:
+        engines = tenants.get_engines(slug)
+        if engines is None:
+            raise click.ClickException(f'Unknown tenant: {slug}')
+        tenants.migrate(engines)
+        click.echo(f'Migrated tenant {slug}.')
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_templates_command():
+    """Compile every template into the bytecode cache, e.g. after a deploy."""
+    if not current_app.config.get('TEMPLATE_CACHE_FOLDER'):
+        raise click.ClickException('TEMPLATE_CACHE_FOLDER is not set, so there is no cache to fill.')
+    loaded, elapsed = warmup.warm_up(current_app)
+    click.echo(f'Compiled {loaded} templates into {current_app.config["TEMPLATE_CACHE_FOLDER"]} '
+               f'in {elapsed * 1000:.0f} ms.')
+
+@click.command('backup-db')
+@with_appcontext
+@tenant_option
+def backup_db_command():
+    """Back up the live database into the backup folder and verify the copy."""
+    try:
+        result = backup.create_backup()
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    
+    click.echo(f'Backed up {result["pages"]} pages to {result["filename"]} '
+               f'({result["size"]} bytes, {result["seconds"]:.2f} s).')
+    for filename in result['removed']:
+        click.echo(f'Removed old backup {filename}.')
+
+@click.command('list-backups')
+@with_appcontext
+@tenant_option
+def list_backups_command():
+    """List backups, newest first."""
+    for entry in backup.list_backups():
+        click.echo(f'{entry["filename"]}\t{entry["created"]:%Y-%m-%d %H:%M:%S}\t{entry["size"]}')
+
+@click.command('verify-backup')
+@click.argument('name')
+@with_appcontext
+@tenant_option
+def verify_backup_command(name):
+    """Check a backup (file name in the backup folder, or a path) for corruption."""
+    path = backup.find_backup(name)
+    problems = backup.verify_backup(path)
+    if problems:
+        raise click.ClickException(f'{path} failed verification:\n' + '\n'.join(problems))
+    
+    click.echo(f'{path} is OK.')
+
+@click.command('restore-db')
+@click.argument('name')
+@click.confirmation_option(prompt='This replaces every row in the database with the backup. Continue?')
+@with_appcontext
+@tenant_option
+def restore_db_command(name):
+    """Replace the database's contents with a backup, keeping a backup of the current data."""
+    path = backup.find_backup(name)
+    try:
+        safety = backup.restore_backup(path)
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    
+    click.echo(f'Restored {path}. The previous data was backed up to {safety["filename"]}.')
+
+@click.command('provision-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(provisioning.FORMATS),
+              help='Input format (default: from the file extension).')
+@click.option('--report', help='Write a CSV report with the outcome of every row to this file.')
+@click.option('--workers', type=int, help='Processes hashing passwords (default: PROVISION_WORKERS).')
+@with_appcontext
+@tenant_option
+def provision_users_command(path, fmt, report, workers):
+    """Create student accounts from a CSV or JSON file (email, full_name, password[, qualification, dob])."""
+    fmt = fmt or provisioning.format_of(path)
+    if fmt is None:
+        raise click.ClickException('Unknown file type; use --format csv or --format json.')
+    try:
+        with open(path, 'rb') as f:
+            result = provisioning.provision_users(provisioning.read_rows(f, fmt), workers=workers)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    if report:
+        provisioning.write_report(result['report'], report)
+    else:
+        for line, email, status, message in result['report']:
+            if status != provisioning.CREATED:
+                click.echo(f'Line {line}: {email or "-"} {status}: {message}')
+    click.echo(f'Created {result["created"]} users, skipped {result["skipped"]}.')
+
 def init_app(app):
     app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(repair_user_stats_command)
+    app.cli.add_command(export_scores_command)
+    app.cli.add_command(archive_scores_command)
+    app.cli.add_command(restore_scores_command)
+    app.cli.add_command(enqueue_job_command)
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(cancel_job_command)
+    app.cli.add_command(create_tenant_command)
+    app.cli.add_command(list_tenants_command)
+    app.cli.add_command(migrate_tenants_command)
+    app.cli.add_command(precompile_templates_command)
+    app.cli.add_command(backup_db_command)
+    app.cli.add_command(list_backups_command)
+    app.cli.add_command(verify_backup_command)
+    app.cli.add_command(restore_db_command)
+    app.cli.add_command(provision_users_command)
+
+if __name__ == '__main__':
+    # Run a command with "python commands.py <command>" from the project directory
+    from flask.cli import ScriptInfo
+    from __init__ import app
+    app.cli.main(obj=ScriptInfo(create_app=lambda: app))
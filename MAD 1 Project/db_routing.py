@@ -0,0 +1,167 @@
+# db_routing.py
+# Read/write engine split
+# Routes marked @read_only run their queries on a separate "read" engine, so
+# long analytic reads don't hold connections or locks on the engine that quiz
+# submissions write through. By default the read engine opens the same SQLite
+# file with PRAGMA query_only; SQLALCHEMY_READ_URI can point it at a replica.
+#
+# Isolation:
+# - The primary database runs in WAL mode, so readers never block the writer
+#   and the writer never blocks readers.
+# - On SQLite, a read-only request sees one consistent snapshot, taken at its
+#   first query and kept until the request ends, even if scores are committed
+#   meanwhile. It always sees everything committed before that first query.
+# - With a replica, reads may lag the primary. A user who has just written is
+#   kept on the primary for READ_AFTER_WRITE_SECONDS so they see their own writes.
+# - Anything that writes (flushes and INSERT/UPDATE/DELETE statements) always
+#   goes to the primary, even inside a read-only route.
+#
+# When a tenant is active (see tenants.py) its own primary and read engines
+# replace the default ones for every model except the tenant registry.
+# Requests served on the event loop by asgi.py use a subclass of RoutingSession
+# that swaps in the async twin of whichever engine is picked (see async_db.py);
+# every other request uses the engines below as they are.
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+READ_BIND = 'read'
+
+# How long a user's reads stay on the primary after they write (replicas only)
+READ_AFTER_WRITE_SECONDS = 5
+
+
+def read_only(view):
+    """Route decorator: run this view's queries on the read engine"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _reads_routed():
+    if not has_request_context() or not g.get('db_read_only'):
+        return False
+    return session.get('db_primary_until', 0) <= time.time()
+
+
+def _tenant_engines():
+    """The active tenant's engines (set by tenants.activate), or None"""
+    if not has_app_context():
+        return None
+    return g.get('tenant_engines')
+
+
+class RoutingSession(Session):
+    """Session that sends reads in @read_only routes to the read engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        engines = self._db.engines
+        # Explicit binds and models on other binds (the tenant registry) stay as they are
+        if bind is not None or engine is not engines.get(None):
+            return engine
+        tenant = _tenant_engines()
+        primary = tenant.primary if tenant is not None else engine
+        reader = tenant.reader if tenant is not None else engines.get(READ_BIND)
+        if (reader is not None and not self._flushing and _reads_routed()
+                and not (clause is not None and getattr(clause, 'is_dml', False))):
+            return reader
+        return primary
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    wrote = db_session.info.pop('wrote', False)
+    if wrote and has_request_context() and current_app.config.get('SQLALCHEMY_READ_URI'):
+        session['db_primary_until'] = time.time() + READ_AFTER_WRITE_SECONDS
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def configure(app):
+    """
+    Add the read bind to the app config. Call before db.init_app(app).
+    Without SQLALCHEMY_READ_URI the read engine opens the primary database.
+    """
+    read_uri = app.config.get('SQLALCHEMY_READ_URI') or app.config['SQLALCHEMY_DATABASE_URI']
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(READ_BIND, read_uri)
+
+
+def _on_sqlite(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+def setup_primary(engine):
+    """Put a SQLite primary in WAL mode and let writers wait for the lock"""
+    if not _on_sqlite(engine):
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _primary_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+
+def setup_reader(engine):
+    """Make a SQLite read engine read-only, with one snapshot per transaction"""
+    if not _on_sqlite(engine):
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _reader_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy issue BEGIN itself (below) instead of pysqlite,
+        # which only begins transactions before writes
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA query_only=ON')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _reader_begin(connection):
+        # A read transaction pins one WAL snapshot for the whole request
+        connection.exec_driver_sql('BEGIN')
+
+
+def init_app(app):
+    """Set connection options on both engines. Call after db.init_app(app)."""
+    from extensions import db
+
+    with app.app_context():
+        setup_primary(db.engine)
+        reader = db.engines.get(READ_BIND)
+        if reader is not None:
+            setup_reader(reader)
+
+
+def primary_engine():
+    """Engine that writes go to: the active tenant's primary, or the default engine"""
+    from extensions import db
+    tenant = _tenant_engines()
+    return tenant.primary if tenant is not None else db.engine
+
+
+def read_engine():
+    """Engine for reads outside a request (exports, jobs): the read engine if configured"""
+    from extensions import db
+    tenant = _tenant_engines()
+    if tenant is not None:
+        return tenant.reader
+    return db.engines.get(READ_BIND, db.engine)
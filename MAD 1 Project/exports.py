@@ -0,0 +1,298 @@
+# exports.py
+# Streaming exports of quiz results as CSV or XLSX
+# Rows are read in keyset-paginated chunks (score.id > last id), each in its own
+# short read, so no transaction is held open for the length of the export and
+# the SQLite writer is never blocked behind it. Rows are encoded one chunk at a
+# time, so memory stays flat no matter how many scores are exported.
+
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from flask import current_app
+from sqlalchemy import select
+
+import db_routing
+import tenants
+from models import User, Subject, Chapter, Quiz, Score, ArchivedScore
+
+# Rows fetched per chunk
+CHUNK_SIZE = 2000
+
+# Supported formats and their response types
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+COLUMNS = ['score_id', 'taken_at', 'user_email', 'user_name', 'subject', 'chapter',
+           'quiz_id', 'quiz_date', 'score', 'total_questions', 'percentage']
+
+
+def parse_filters(args):
+    """
+    Read export filters from request args or a plain dict.
+
+    Args:
+        args: Mapping with optional start (YYYY-MM-DD), end (YYYY-MM-DD) and subject_id
+
+    Returns:
+        Dict with start, end (through the end of that day) and subject_id
+    """
+    filters = {'start': None, 'end': None, 'subject_id': None}
+    if args.get('start'):
+        filters['start'] = datetime.strptime(args['start'], '%Y-%m-%d')
+    if args.get('end'):
+        end = datetime.strptime(args['end'], '%Y-%m-%d')
+        filters['end'] = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+    if args.get('subject_id'):
+        filters['subject_id'] = int(args['subject_id'])
+    return filters
+
+
+def _chunk_query(model, filters, after_id, limit):
+    """
+    Build the select for the next chunk of scores after a given id.
+    The keyset page is taken from the score (or score_archive) table alone and
+    only that page is joined to its user, quiz, chapter and subject, so SQLite
+    walks the primary key once instead of picking a join order that rescans it
+    per chunk.
+    """
+    page = select(model).where(model.id > after_id)
+    if filters.get('start'):
+        page = page.where(model.timestamp >= filters['start'])
+    if filters.get('end'):
+        page = page.where(model.timestamp <= filters['end'])
+    if filters.get('subject_id'):
+        subject_quizzes = (select(Quiz.id)
+                           .join(Chapter, Chapter.id == Quiz.chapter_id)
+                           .where(Chapter.subject_id == filters['subject_id']))
+        page = page.where(model.quiz_id.in_(subject_quizzes))
+    page = page.order_by(model.id).limit(limit).subquery()
+
+    # Archived rows are exported under the id they had in the score table
+    score_id = page.c.score_id if model is ArchivedScore else page.c.id
+    return (
+        select(page.c.id, score_id.label('score_id'), page.c.timestamp, User.email, User.full_name,
+               Subject.name.label('subject'), Chapter.name.label('chapter'),
+               Quiz.id.label('quiz_id'), Quiz.date, page.c.score, page.c.total_questions)
+        .select_from(page)
+        .join(User, User.id == page.c.user_id)
+        .join(Quiz, Quiz.id == page.c.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .join(Subject, Subject.id == Chapter.subject_id)
+        .order_by(page.c.id)
+    )
+
+
+def iter_score_chunks(filters, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of export rows, one chunk at a time: archived scores first
+    (they are the oldest), then the score table.
+    Each chunk is read on a fresh read-engine connection that is returned to
+    the pool straight away, so the export never holds a long-running read.
+    """
+    for model in (ArchivedScore, Score):
+        after_id = 0
+        while True:
+            with db_routing.read_engine().connect() as connection:
+                rows = connection.execute(_chunk_query(model, filters, after_id, chunk_size)).all()
+            if not rows:
+                break
+            chunk = []
+            for row in rows:
+                percentage = round(row.score / row.total_questions * 100, 1) if row.total_questions else 0
+                chunk.append([row.score_id, row.timestamp.strftime('%Y-%m-%d %H:%M:%S'), row.email,
+                              row.full_name, row.subject, row.chapter, row.quiz_id,
+                              row.date.strftime('%Y-%m-%d'), row.score, row.total_questions, percentage])
+            yield chunk
+            after_id = rows[-1].id
+
+
+def generate_csv(filters):
+    """Yield the CSV export as encoded byte chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for chunk in iter_score_chunks(filters):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _StreamSink:
+    """
+    Write-only file object that collects what ZipFile writes so it can be
+    yielded to the client. ZipFile falls back to streaming mode (data
+    descriptors instead of seeking back) because this object can't seek.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Scores" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    """Encode one row of values as SpreadsheetML cells"""
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)):
+            cells.append(f'<c t="n"><v>{value}</v></c>')
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return '<row>' + ''.join(cells) + '</row>'
+
+
+def generate_xlsx(filters):
+    """
+    Yield the XLSX export as byte chunks.
+    The workbook is written as a streamed zip, so the worksheet is compressed
+    and sent chunk by chunk instead of being built in memory first.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            workbook.writestr(name, content)
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(_xlsx_row(COLUMNS).encode('utf-8'))
+            for chunk in iter_score_chunks(filters):
+                sheet.write(''.join(_xlsx_row(row) for row in chunk).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def generate_export(fmt, filters):
+    """Return the byte-chunk generator for an export format"""
+    if fmt == 'xlsx':
+        return generate_xlsx(filters)
+    return generate_csv(filters)
+
+
+def export_folder():
+    """Folder background exports are written to; each tenant has its own"""
+    folder = current_app.config['EXPORT_FOLDER']
+    tenant = tenants.current()
+    return os.path.join(folder, tenant) if tenant else folder
+
+
+def export_filename(fmt):
+    """Build a timestamped file name for an export"""
+    return f"scores_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.{fmt}"
+
+
+def write_export(fmt, filters, path, on_chunk=None):
+    """
+    Write an export to a file. The data goes to "<path>.part" first and is
+    renamed when complete, so a half-written export is never offered for download.
+
+    Args:
+        fmt: 'csv' or 'xlsx'
+        filters: Filters from parse_filters
+        path: Destination file path
+        on_chunk: Optional callable run after each chunk is written; if it
+            raises, the partial file is removed and the exception propagates
+
+    Returns:
+        Number of bytes written
+    """
+    partial_path = path + '.part'
+    size = 0
+    try:
+        with open(partial_path, 'wb') as output:
+            for data in generate_export(fmt, filters):
+                output.write(data)
+                size += len(data)
+                if on_chunk:
+                    on_chunk()
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, path)
+    return size
+
+
+def list_exports(folder):
+    """
+    List finished and in-progress export files, newest first.
+
+    Returns:
+        List of dicts with name, size, modified and done
+    """
+    if not os.path.isdir(folder):
+        return []
+    files = []
+    for entry in os.scandir(folder):
+        if not entry.is_file():
+            continue
+        done = not entry.name.endswith('.part')
+        stat = entry.stat()
+        files.append({
+            'name': entry.name if done else entry.name[:-len('.part')],
+            'size': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime),
+            'done': done,
+        })
+    files.sort(key=lambda item: item['modified'], reverse=True)
+    return files
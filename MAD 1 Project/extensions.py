@@ -4,6 +4,9 @@
 
 from flask_sqlalchemy import SQLAlchemy
 
+from db_routing import RoutingSession
+
 # Create the SQLAlchemy instance without binding it to an app yet
 # This will be initialized with the Flask app in app.py
-db = SQLAlchemy()
+# RoutingSession sends queries in read-only routes to the read engine
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,519 @@
+# jobs.py
+# In-process background jobs
+# Jobs are rows in the job table, so they survive restarts and can be enqueued
+# from any process (web worker or CLI) without a separate broker. Each web
+# process runs one dispatcher thread that picks up due jobs and runs them on a
+# small thread pool. A job is claimed with a conditional UPDATE before it runs,
+# so it runs once even when several processes poll the same database.
+# Tenant databases have their own job tables; the dispatcher polls the default
+# database and every tenant whose engines the process has open.
+# Tasks registered with schedule() run again a fixed time after their last run
+# was due to start: whenever none is queued or running, the dispatcher queues
+# the next one. Each process remembers when a task's next run can be due and
+# only looks at the job table for it from then on, or once a job it ran,
+# cancelled or retried may have changed that.
+# While a job runs, a heartbeat thread refreshes its heartbeat_at every quarter
+# of JOB_LEASE_SECONDS. A running job whose heartbeat is older than the lease
+# lost its process (killed, crashed or restarted mid-run): the dispatcher
+# requeues it, or marks it failed once it is out of attempts.
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, exists, func, insert, literal, or_, select, update
+
+from extensions import db
+from models import Job
+import db_routing
+import tenants
+
+# Job states; queued and running jobs count as active
+STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Seconds before the first retry; doubled for every further attempt
+RETRY_BACKOFF = 5
+
+# Default JOB_LEASE_SECONDS: how long a running job may go without a heartbeat
+DEFAULT_LEASE_SECONDS = 120
+
+# Error recorded on a job whose process stopped while running it
+LOST_ERROR = 'The process running this job stopped responding'
+
+# kind -> task function
+_tasks = {}
+
+# kind -> seconds between runs, for tasks that run on a schedule
+_schedules = {}
+
+# (tenant slug, kind) -> when the next run of a scheduled task can be due, as of
+# this process's last look at the job table
+_next_due = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a task when the job has been asked to stop"""
+
+
+class JobContext:
+    """What a running task gets: its parameters and a way to check for cancellation"""
+
+    def __init__(self, job_id, params):
+        self.job_id = job_id
+        self.params = params
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested. Call between units of work."""
+        requested = db.session.execute(
+            select(Job.cancel_requested).where(Job.id == self.job_id)
+        ).scalar()
+        if requested:
+            raise JobCancelled()
+
+
+def task(kind):
+    """
+    Register a function as the task for a job kind.
+    The function receives a JobContext and returns a JSON-serializable result.
+    """
+    def register(function):
+        _tasks[kind] = function
+        return function
+    return register
+
+
+def task_kinds():
+    """Names of all registered tasks"""
+    return sorted(_tasks)
+
+
+def schedule(kind, seconds):
+    """Run a task every so many seconds, counted from when its last run started"""
+    _schedules[kind] = seconds
+
+
+def lease_seconds():
+    """JOB_LEASE_SECONDS of the current app"""
+    return current_app.config.get('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+
+def lease_cutoff(now=None):
+    """Running jobs whose last heartbeat is before this have lost their process"""
+    return (now or datetime.now()) - timedelta(seconds=lease_seconds())
+
+
+def _last_heartbeat():
+    # Jobs claimed before heartbeats were recorded only have started_at
+    return func.coalesce(Job.heartbeat_at, Job.started_at)
+
+
+def _is_stale(cutoff):
+    return and_(Job.status == 'running', _last_heartbeat() < cutoff)
+
+
+def requeue_stale(now=None):
+    """
+    Requeue running jobs whose heartbeat is older than JOB_LEASE_SECONDS, or
+    mark them failed (cancelled, if that was requested) once they are out of
+    attempts. Only writes when there are any.
+
+    Returns:
+        Number of jobs requeued or finished
+    """
+    now = now or datetime.now()
+    stale = _is_stale(lease_cutoff(now))
+    if not db.session.execute(select(exists().where(stale))).scalar():
+        return 0
+    changed = db.session.execute(
+        update(Job).where(stale, Job.attempts < Job.max_attempts, ~Job.cancel_requested)
+        .values(status='queued', run_after=now, error=LOST_ERROR)
+    ).rowcount
+    changed += db.session.execute(
+        update(Job).where(stale, Job.cancel_requested)
+        .values(status='cancelled', finished_at=now)
+    ).rowcount
+    changed += db.session.execute(
+        update(Job).where(stale)
+        .values(status='failed', error=LOST_ERROR, finished_at=now)
+    ).rowcount
+    db.session.commit()
+    current_app.logger.warning(f"Recovered {changed} job(s) whose process stopped ({tenants.current() or 'default'})")
+    return changed
+
+
+def queue_scheduled(now=None):
+    """
+    Queue the next run of every scheduled task that has no job queued or
+    running; a running job whose heartbeat lapsed doesn't count, so a lost run
+    never holds up the schedule. Call after requeue_stale(), as the dispatcher
+    does, so a lost run is retried rather than joined by a new one.
+
+    A task is only looked up in the job table once its next run can be due,
+    and the table is only written when a run is queued. Each insert only
+    happens if there still is none, so processes polling the same database at
+    once don't queue a task twice.
+
+    Returns:
+        Number of jobs queued
+    """
+    now = now or datetime.now()
+    tenant = tenants.current()
+    cutoff = lease_cutoff(now)
+    queued = 0
+    wrote = False
+    for kind, seconds in _schedules.items():
+        key = (tenant, kind)
+        if key in _next_due and now < _next_due[key]:
+            continue
+        interval = timedelta(seconds=seconds)
+        active = exists().where(Job.kind == kind, or_(
+            Job.status == 'queued', and_(Job.status == 'running', _last_heartbeat() >= cutoff)))
+        # A run cancelled before it started still counts, so cancelling skips it
+        last = db.session.execute(
+            select(Job.started_at, Job.run_after).where(Job.kind == kind).order_by(Job.id.desc()).limit(1)
+        ).first()
+        run_after = (last.started_at or last.run_after) + interval if last else now
+        if db.session.execute(select(active)).scalar():
+            # The next run is due an interval after this one starts; while one
+            # overruns that, it is looked at again every lease
+            _next_due[key] = run_after if run_after > now else now + timedelta(seconds=lease_seconds())
+            continue
+        wrote = True
+        queued += db.session.execute(
+            insert(Job).from_select(
+                ['kind', 'params', 'status', 'attempts', 'max_attempts', 'cancel_requested', 'created_at', 'run_after'],
+                select(literal(kind), literal('{}'), literal('queued'), literal(0), literal(3), literal(False),
+                       literal(now), literal(run_after)).where(~active))
+        ).rowcount
+        # Whichever process queued it, this run starts at run_after at the earliest
+        _next_due[key] = run_after + interval
+    if wrote:
+        db.session.commit()
+    return queued
+
+
+def _recheck_schedules():
+    """Have the next queue_scheduled() look at every scheduled task of the active tenant again"""
+    tenant = tenants.current()
+    for key in list(_next_due):
+        if key[0] == tenant:
+            _next_due.pop(key, None)
+
+
+def enqueue(kind, params=None, max_attempts=3):
+    """
+    Add a job to the queue and wake this process's dispatcher.
+
+    Args:
+        kind: Name of a registered task
+        params: JSON-serializable dict of task arguments
+        max_attempts: How many times to try before marking the job failed
+
+    Returns:
+        The new Job
+    """
+    if kind not in _tasks:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, params=json.dumps(params or {}), max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+
+    runner = current_app.extensions.get('jobs')
+    if runner:
+        runner.wake()
+    return job
+
+
+def cancel(job_id):
+    """
+    Cancel a job. A queued job is cancelled straight away; a running job is
+    asked to stop and is cancelled at its next check_cancelled().
+
+    Returns:
+        True if the job was queued or running
+    """
+    now = datetime.now()
+    cancelled = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='cancelled', finished_at=now)
+    ).rowcount
+    requested = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status.in_(ACTIVE_STATUSES))
+        .values(cancel_requested=True)
+    ).rowcount
+    db.session.commit()
+    _recheck_schedules()
+    return bool(cancelled or requested)
+
+
+def retry(job_id):
+    """
+    Put a failed or cancelled job back on the queue with a fresh set of attempts.
+
+    Returns:
+        True if the job was requeued
+    """
+    requeued = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status.in_(('failed', 'cancelled')))
+        .values(status='queued', attempts=0, cancel_requested=False, error=None,
+                run_after=datetime.now(), started_at=None, finished_at=None)
+    ).rowcount
+    db.session.commit()
+    _recheck_schedules()
+
+    runner = current_app.extensions.get('jobs')
+    if requeued and runner:
+        runner.wake()
+    return bool(requeued)
+
+
+def due_job_ids(limit):
+    """IDs of queued jobs whose retry delay has passed, oldest first"""
+    return db.session.execute(
+        select(Job.id)
+        .where(Job.status == 'queued', Job.run_after <= datetime.now())
+        .order_by(Job.id)
+        .limit(limit)
+    ).scalars().all()
+
+
+def _claim(job_id):
+    """Move a job from queued to running. Returns False if another worker got it first."""
+    now = datetime.now()
+    claimed = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued')
+        .values(status='running', attempts=Job.attempts + 1, started_at=now, heartbeat_at=now, finished_at=None)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+class Heartbeat:
+    """Thread that refreshes a running job's heartbeat_at until the job is done"""
+
+    def __init__(self, engine, job_id, attempt, interval, logger):
+        self.engine = engine
+        self.job_id = job_id
+        self.attempt = attempt
+        self.interval = interval
+        self.logger = logger
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-{job_id}-heartbeat', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        table = Job.__table__
+        while not self._stopped.wait(self.interval):
+            try:
+                # Its own short transaction, so it never waits on the task's
+                with self.engine.begin() as connection:
+                    connection.execute(
+                        update(table)
+                        .where(table.c.id == self.job_id, table.c.attempts == self.attempt,
+                               table.c.status == 'running')
+                        .values(heartbeat_at=datetime.now()))
+            except Exception:
+                self.logger.exception(f"Could not record the heartbeat of job {self.job_id}")
+
+
+def _owns(job, attempt):
+    """Whether this run still holds the job, i.e. it wasn't found stale and taken over meanwhile"""
+    return job.status == 'running' and job.attempts == attempt
+
+
+def run_job(job_id):
+    """
+    Claim and run one job in the current app context, recording the outcome.
+    A failed job is requeued with exponential backoff until max_attempts is reached.
+
+    Returns:
+        False if the job was not queued (already taken, finished or cancelled)
+    """
+    if not _claim(job_id):
+        return False
+
+    job = db.session.get(Job, job_id)
+    attempt = job.attempts
+    function = _tasks.get(job.kind)
+    context = JobContext(job.id, json.loads(job.params))
+    heartbeat = Heartbeat(db_routing.primary_engine(), job_id, attempt,
+                          lease_seconds() / 4, current_app.logger)
+    heartbeat.start()
+    try:
+        if function is None:
+            raise LookupError(f'No task registered for job kind {job.kind}')
+        result = function(context)
+    except JobCancelled:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        if not _owns(job, attempt):
+            return _lost(job_id)
+        job.status = 'cancelled'
+        job.finished_at = datetime.now()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception(f"Job {job_id} ({job.kind}) failed")
+        job = db.session.get(Job, job_id)
+        if not _owns(job, attempt):
+            return _lost(job_id)
+        job.error = f'{type(e).__name__}: {e}'
+        if job.attempts < job.max_attempts and not job.cancel_requested:
+            job.status = 'queued'
+            job.run_after = datetime.now() + timedelta(seconds=RETRY_BACKOFF * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.now()
+    else:
+        db.session.refresh(job)
+        if not _owns(job, attempt):
+            return _lost(job_id)
+        job.status = 'succeeded'
+        job.result = json.dumps(result)
+        job.error = None
+        job.finished_at = datetime.now()
+    finally:
+        heartbeat.stop()
+    db.session.commit()
+    # Queue the next run of a scheduled task now, rather than when it is due
+    _recheck_schedules()
+    return True
+
+
+def _lost(job_id):
+    """A run that finished after its job was found stale: the run that took over records the outcome"""
+    db.session.rollback()
+    current_app.logger.warning(f"Job {job_id} was taken over after its heartbeat lapsed; dropping this run's outcome")
+    return True
+
+
+def run_pending():
+    """
+    Run every due job in the calling thread until the queue is empty.
+    Used by the run-jobs CLI command when no web process is running.
+
+    Returns:
+        Number of jobs run
+    """
+    count = 0
+    requeue_stale()
+    while True:
+        job_ids = due_job_ids(limit=10)
+        if not job_ids:
+            return count
+        for job_id in job_ids:
+            if run_job(job_id):
+                count += 1
+
+
+def job_to_dict(job):
+    """Status of a job for JSON polling"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'duration': job.duration,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+    }
+
+
+class JobRunner:
+    """
+    Dispatcher thread plus worker pool for one process.
+    The dispatcher wakes when a job is enqueued here, or every poll interval
+    to pick up jobs enqueued by other processes and retries that are due.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config['JOB_WORKERS']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self._wake_event = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._executor = None
+
+    def start(self):
+        """Start the dispatcher thread if it isn't running yet"""
+        if self._executor is not None:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True).start()
+
+    def wake(self):
+        """
+        Make a running dispatcher look for due jobs now. In a process that never
+        started one (e.g. a CLI command) the job just waits in the table for a
+        web process or run-jobs to pick it up.
+        """
+        self._wake_event.set()
+
+    def _dispatch(self):
+        while True:
+            for tenant in [None, *tenants.active_tenants()]:
+                try:
+                    self._dispatch_due(tenant)
+                except Exception:
+                    self.app.logger.exception(f"Job dispatcher failed to poll the job table ({tenant or 'default'})")
+            self._wake_event.wait(self.poll_interval)
+            self._wake_event.clear()
+
+    def _dispatch_due(self, tenant):
+        free_slots = self.workers - len(self._in_flight)
+        if free_slots <= 0:
+            return
+        with self.app.app_context():
+            tenants.activate(tenant)
+            requeue_stale()
+            queue_scheduled()
+            job_ids = [job_id for job_id in due_job_ids(limit=self.workers)
+                       if (tenant, job_id) not in self._in_flight][:free_slots]
+        for job_id in job_ids:
+            with self._lock:
+                self._in_flight.add((tenant, job_id))
+            self._executor.submit(self._run, tenant, job_id)
+
+    def _run(self, tenant, job_id):
+        try:
+            with self.app.app_context():
+                tenants.activate(tenant)
+                run_job(job_id)
+        except Exception:
+            self.app.logger.exception(f"Job {job_id} could not be run")
+        finally:
+            with self._lock:
+                self._in_flight.discard((tenant, job_id))
+            # A slot is free, so look for the next job
+            self._wake_event.set()
+
+
+def init_app(app):
+    """
+    Attach a JobRunner to the app. Its threads start with the first request,
+    so CLI commands and scripts don't start them.
+    """
+    app.config.setdefault('JOB_WORKERS', 2)
+    app.config.setdefault('JOB_POLL_INTERVAL', 5)
+    app.config.setdefault('JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+    runner = JobRunner(app)
+    app.extensions['jobs'] = runner
+    app.before_request(runner.start)
+    return runner
@@ -0,0 +1,149 @@
+# listings.py
+# Read models for the listing pages
+# Listing pages only print a few columns per row, but loading them as ORM
+# objects builds a tracked instance per row and lazy-loads each row's quiz,
+# chapter and subject one query at a time. These functions select just the
+# columns each template needs, joined in one query, into small __slots__ rows
+# that the session doesn't track. Pages that change data keep using the models.
+
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Subject, Chapter, Quiz, Question, ArchivedScore
+
+# Quizzes shown per page of the admin's all quizzes list
+PER_PAGE = 50
+
+
+class QuizRow:
+    """A quiz in an admin list, with its chapter and subject names"""
+
+    __slots__ = ('id', 'chapter_id', 'chapter_name', 'subject_name', 'date', 'closes_at', 'duration',
+                 'pool_size', 'question_count')
+
+    def __init__(self, id, chapter_id, chapter_name, subject_name, date, closes_at, duration, pool_size,
+                 question_count):
+        self.id = id
+        self.chapter_id = chapter_id
+        self.chapter_name = chapter_name
+        self.subject_name = subject_name
+        self.date = date
+        self.closes_at = closes_at
+        self.duration = duration
+        self.pool_size = pool_size
+        self.question_count = question_count
+
+
+class ChapterRow:
+    """A chapter in a subject's chapter list"""
+
+    __slots__ = ('id', 'name', 'description')
+
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+
+
+class QuestionRow:
+    """A question with its options, as listed for the admin"""
+
+    __slots__ = ('id', 'question_text', 'option1', 'option2', 'option3', 'option4', 'correct_option')
+
+    def __init__(self, id, question_text, option1, option2, option3, option4, correct_option):
+        self.id = id
+        self.question_text = question_text
+        self.option1 = option1
+        self.option2 = option2
+        self.option3 = option3
+        self.option4 = option4
+        self.correct_option = correct_option
+
+
+class ScoreRow:
+    """A score in a user's history, hot or archived"""
+
+    __slots__ = ('id', 'subject_name', 'chapter_name', 'timestamp', 'score', 'total_questions', 'archived')
+
+    def __init__(self, id, subject_name, chapter_name, timestamp, score, total_questions, archived):
+        self.id = id  # ID in the score table, also for archived scores
+        self.subject_name = subject_name
+        self.chapter_name = chapter_name
+        self.timestamp = timestamp
+        self.score = score
+        self.total_questions = total_questions
+        self.archived = archived
+
+    @property
+    def percentage(self):
+        return self.score / self.total_questions * 100 if self.total_questions else 0.0
+
+
+def _quiz_query():
+    """Quiz columns with chapter and subject names and question counts"""
+    # Counted per listed quiz through ix_question_quiz, so a page costs its own rows
+    question_count = select(func.count(Question.id)).where(Question.quiz_id == Quiz.id) \
+        .correlate(Quiz).scalar_subquery()
+    return select(Quiz.id, Quiz.chapter_id, Chapter.name, Subject.name, Quiz.date, Quiz.closes_at,
+                  Quiz.duration, Quiz.pool_size, question_count) \
+        .join(Chapter, Chapter.id == Quiz.chapter_id) \
+        .join(Subject, Subject.id == Chapter.subject_id)
+
+
+def quiz_page(page=1, per_page=PER_PAGE):
+    """
+    One page of every quiz, in id order.
+
+    Returns:
+        Tuple of (QuizRows, total number of quizzes)
+    """
+    total = db.session.execute(select(func.count()).select_from(Quiz)).scalar()
+    rows = db.session.execute(
+        _quiz_query().order_by(Quiz.id).offset((page - 1) * per_page).limit(per_page))
+    return [QuizRow(*row) for row in rows], total
+
+
+def chapter_quizzes(chapter_id):
+    """QuizRows for a chapter's quizzes, in id order"""
+    rows = db.session.execute(_quiz_query().where(Quiz.chapter_id == chapter_id).order_by(Quiz.id))
+    return [QuizRow(*row) for row in rows]
+
+
+def subject_chapters(subject_id):
+    """ChapterRows for a subject's chapters, in id order"""
+    rows = db.session.execute(
+        select(Chapter.id, Chapter.name, Chapter.description)
+        .where(Chapter.subject_id == subject_id).order_by(Chapter.id))
+    return [ChapterRow(*row) for row in rows]
+
+
+def quiz_questions(quiz_id):
+    """QuestionRows for a quiz's questions, in id order"""
+    rows = db.session.execute(
+        select(Question.id, Question.question_text, Question.option1, Question.option2,
+               Question.option3, Question.option4, Question.correct_option)
+        .where(Question.quiz_id == quiz_id).order_by(Question.id))
+    return [QuestionRow(*row) for row in rows]
+
+
+def score_rows(model, user_id, offset, limit):
+    """
+    ScoreRows for one slice of a user's history in the score or archive table, newest first.
+
+    Args:
+        model: Score or ArchivedScore
+        user_id: ID of the user
+        offset: Rows of that table to skip
+        limit: Most rows to return
+    """
+    archived = model is ArchivedScore
+    score_id = model.score_id if archived else model.id
+    rows = db.session.execute(
+        select(score_id, Subject.name, Chapter.name, model.timestamp, model.score, model.total_questions)
+        .join(Quiz, Quiz.id == model.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .join(Subject, Subject.id == Chapter.subject_id)
+        .where(model.user_id == user_id)
+        .order_by(model.timestamp.desc(), model.id.desc())
+        .offset(offset).limit(limit))
+    return [ScoreRow(*row, archived) for row in rows]
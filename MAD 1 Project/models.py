@@ -45,6 +45,9 @@ class Chapter(db.Model):
     # Link to quizzes in this chapter (cascade ensures quizzes are deleted when chapter is deleted)
     quizzes = db.relationship('Quiz', backref='chapter', lazy=True, cascade="all, delete-orphan")
     
+    # A subject's chapter list
+    __table_args__ = (db.Index('ix_chapter_subject', 'subject_id'),)
+    
     def __repr__(self):
         return f'<Chapter {self.name}>'
 
@@ -54,13 +57,29 @@ class Quiz(db.Model):
     """
     id = db.Column(db.Integer, primary_key=True)  # Unique identifier for each quiz
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), nullable=False)  # Link to parent chapter
-    date = db.Column(db.DateTime, nullable=False)  # Date when the quiz is scheduled
-    duration = db.Column(db.String(10), nullable=False)  # Duration in HH:MM format
+    date = db.Column(db.DateTime, nullable=False)  # When the quiz opens
+    closes_at = db.Column(db.DateTime, nullable=True)  # When the quiz closes (None keeps it open)
+    duration = db.Column(db.String(10), nullable=False)  # Duration in HH:MM format, for display
+    # Time allowed per attempt in seconds (0 means no time limit)
+    duration_seconds = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     remarks = db.Column(db.Text, nullable=True)  # Additional notes about the quiz
+    # Number of questions drawn at random for each attempt (None means every question)
+    pool_size = db.Column(db.Integer, nullable=True)
+    # Whether the options of each question are shown in a random order
+    shuffle_options = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     # Link to questions in this quiz (cascade ensures questions are deleted when quiz is deleted)
     questions = db.relationship('Question', backref='quiz', lazy=True, cascade="all, delete-orphan")
     # Link to scores for this quiz (cascade ensures scores are deleted when quiz is deleted)
     scores = db.relationship('Score', backref='quiz', lazy=True, cascade="all, delete-orphan")
+    # Link to attempts started on this quiz (cascade ensures attempts are deleted when quiz is deleted)
+    attempts = db.relationship('QuizAttempt', backref='quiz', lazy=True, cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # The user dashboard lists quizzes that have not closed yet, in opening order
+        db.Index('ix_quiz_window', 'closes_at', 'date'),
+        # A chapter's quiz list
+        db.Index('ix_quiz_chapter', 'chapter_id'),
+    )
     
     def __repr__(self):
         return f'<Quiz {self.id} for Chapter {self.chapter_id}>'
@@ -78,6 +97,9 @@ class Question(db.Model):
     option4 = db.Column(db.String(200), nullable=False)  # Fourth option
     correct_option = db.Column(db.Integer, nullable=False)  # Which option is correct (1, 2, 3, or 4)
     
+    # A quiz's question list and question count
+    __table_args__ = (db.Index('ix_question_quiz', 'quiz_id'),)
+    
     def __repr__(self):
         return f'<Question {self.id} for Quiz {self.quiz_id}>'
 
@@ -92,5 +114,211 @@ class Score(db.Model):
     total_questions = db.Column(db.Integer, nullable=False)  # Total number of questions
     timestamp = db.Column(db.DateTime, default=datetime.now, nullable=False)  # When the quiz was taken
     
+    __table_args__ = (
+        db.Index('ix_score_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_score_quiz', 'quiz_id'),
+        # Whether a user has attempted a quiz, e.g. when picking quizzes to recommend
+        db.Index('ix_score_user_quiz', 'user_id', 'quiz_id'),
+    )
+    
     def __repr__(self):
         return f'<Score {self.score}/{self.total_questions} for User {self.user_id} on Quiz {self.quiz_id}>'
+
+class ArchivedScore(db.Model):
+    """
+    ArchivedScore model - A score moved out of the score table by archival
+    Same fields as Score, so archived rows can be shown and restored as they were
+    """
+    __tablename__ = 'score_archive'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Unique identifier for each archived row
+    score_id = db.Column(db.Integer, nullable=False)  # ID the score had in the score table
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)  # Link to the quiz
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Link to the user
+    score = db.Column(db.Integer, nullable=False)  # Number of correct answers
+    total_questions = db.Column(db.Integer, nullable=False)  # Total number of questions
+    timestamp = db.Column(db.DateTime, nullable=False)  # When the quiz was taken
+    archived_at = db.Column(db.DateTime, default=datetime.now, nullable=False)  # When the score was archived
+    
+    quiz = db.relationship('Quiz')  # Quiz the score belongs to
+    
+    __table_args__ = (
+        db.Index('ix_score_archive_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_score_archive_quiz', 'quiz_id'),
+        # Archived scores still mean the quiz was attempted
+        db.Index('ix_score_archive_user_quiz', 'user_id', 'quiz_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ArchivedScore {self.score_id} for User {self.user_id} on Quiz {self.quiz_id}>'
+
+class QuizAttempt(db.Model):
+    """
+    QuizAttempt model - The exact questions and option order shown to a user for one attempt
+    Also holds the answers saved so far while the quiz is being taken (see autosave.py)
+    """
+    id = db.Column(db.Integer, primary_key=True)  # Unique identifier for each attempt
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)  # Link to the quiz
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Link to the user
+    question_ids = db.Column(db.Text, nullable=False)  # JSON list of drawn question ids, in display order
+    option_orders = db.Column(db.Text, nullable=False)  # JSON list of option orders, one per question
+    answer_key = db.Column(db.Text, nullable=False)  # JSON list of correct options, one per question
+    # JSON list of drawn question ids deleted before the attempt was submitted; they aren't graded
+    removed_question_ids = db.Column(db.Text, nullable=False, default='[]', server_default='[]')
+    started_at = db.Column(db.DateTime, default=datetime.now, nullable=False)  # When the questions were drawn
+    deadline = db.Column(db.DateTime, nullable=True)  # When time runs out, fixed at the start (None: no limit)
+    # JSON object of question id -> selected option, as saved while the quiz is taken
+    answers = db.Column(db.Text, nullable=False, default='{}', server_default='{}')
+    saved_at = db.Column(db.DateTime, nullable=True)  # When answers were last written
+    submitted_at = db.Column(db.DateTime, nullable=True)  # When the attempt was graded
+    
+    __table_args__ = (db.Index('ix_quiz_attempt_user_quiz', 'user_id', 'quiz_id'),)
+    
+    def __repr__(self):
+        return f'<QuizAttempt {self.id} for User {self.user_id} on Quiz {self.quiz_id}>'
+
+class UserSubjectDaily(db.Model):
+    """
+    UserSubjectDaily model - Attempt counts and score sums per user, subject and day
+    Kept up to date on every quiz submission so summaries never scan raw scores
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)  # Link to the user
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), primary_key=True)  # Link to the subject
+    day = db.Column(db.Date, primary_key=True)  # Day the attempts were made
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Number of quizzes taken
+    score_sum = db.Column(db.Integer, nullable=False, default=0)  # Total correct answers
+    question_sum = db.Column(db.Integer, nullable=False, default=0)  # Total questions answered
+    percentage_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of per-attempt percentages
+    
+    def __repr__(self):
+        return f'<UserSubjectDaily User {self.user_id} Subject {self.subject_id} on {self.day}>'
+
+class SubjectDaily(db.Model):
+    """
+    SubjectDaily model - Attempt counts and score sums per subject and day across all users
+    """
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), primary_key=True)  # Link to the subject
+    day = db.Column(db.Date, primary_key=True)  # Day the attempts were made
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Number of quizzes taken
+    score_sum = db.Column(db.Integer, nullable=False, default=0)  # Total correct answers
+    question_sum = db.Column(db.Integer, nullable=False, default=0)  # Total questions answered
+    percentage_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of per-attempt percentages
+    
+    def __repr__(self):
+        return f'<SubjectDaily Subject {self.subject_id} on {self.day}>'
+
+class UserChapterStats(db.Model):
+    """
+    UserChapterStats model - Attempt counts and score sums per user and chapter
+    Kept up to date on every quiz submission; quiz recommendations read it to find weak chapters
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)  # Link to the user
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), primary_key=True)  # Link to the chapter
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Number of quizzes taken
+    score_sum = db.Column(db.Integer, nullable=False, default=0)  # Total correct answers
+    question_sum = db.Column(db.Integer, nullable=False, default=0)  # Total questions answered
+    percentage_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of per-attempt percentages
+    last_attempt_at = db.Column(db.DateTime, nullable=True)  # When the chapter was last practised
+    
+    def __repr__(self):
+        return f'<UserChapterStats User {self.user_id} Chapter {self.chapter_id}>'
+
+class UserStats(db.Model):
+    """
+    UserStats model - Running totals of one user's quiz attempts
+    Updated in the same transaction as every new score; repair-user-stats checks it against the scores
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)  # Link to the user
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Number of quizzes taken
+    # Number of attempts that had questions; only these count towards the average
+    graded_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    score_sum = db.Column(db.Integer, nullable=False, default=0)  # Total correct answers
+    question_sum = db.Column(db.Integer, nullable=False, default=0)  # Total questions answered
+    percentage_sum = db.Column(db.Float, nullable=False, default=0.0)  # Sum of per-attempt percentages
+    best_percentage = db.Column(db.Float, nullable=False, default=0.0)  # Best result of any attempt
+    last_attempt_at = db.Column(db.DateTime, nullable=True)  # When the user last submitted a quiz
+    
+    @property
+    def mean_percentage(self):
+        """Average percentage over the attempts that had questions"""
+        return self.percentage_sum / self.graded_attempts if self.graded_attempts else 0.0
+    
+    def __repr__(self):
+        return f'<UserStats User {self.user_id}>'
+
+class Job(db.Model):
+    """
+    Job model - A unit of background work run by the in-process job runner
+    Params and result are stored as JSON text
+    """
+    id = db.Column(db.Integer, primary_key=True)  # Unique identifier for each job
+    kind = db.Column(db.String(50), nullable=False)  # Name of the registered task to run
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON arguments for the task
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed or cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # Number of times the job has been started
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)  # Give up after this many failures
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Set to stop a running job
+    result = db.Column(db.Text)  # JSON result of a successful run
+    error = db.Column(db.Text)  # Last error message
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)  # When the job was enqueued
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.now)  # Not started before this time (retry backoff)
+    started_at = db.Column(db.DateTime)  # When the latest attempt started
+    heartbeat_at = db.Column(db.DateTime)  # Last sign of life from the process running the job
+    finished_at = db.Column(db.DateTime)  # When the job succeeded, failed or was cancelled
+    
+    @property
+    def duration(self):
+        """Seconds the latest attempt has been running, or took to finish"""
+        if not self.started_at:
+            return None
+        end = self.finished_at or datetime.now()
+        return (end - self.started_at).total_seconds()
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+class CacheVersion(db.Model):
+    """
+    CacheVersion model - Version of something the workers cache in memory
+    Bumped in the same transaction as every change to it; see coherence.py
+    """
+    __tablename__ = 'cache_version'
+    entity = db.Column(db.String(20), primary_key=True)  # catalog, quiz, scores, user or everything
+    entity_id = db.Column(db.Integer, primary_key=True, default=0)  # Quiz or user id, or 0
+    version = db.Column(db.Integer, nullable=False)  # Taken from one counter across all entities
+    
+    __table_args__ = (db.Index('ix_cache_version_version', 'version'),)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.entity} {self.entity_id} v{self.version}>'
+
+class CacheWarmup(db.Model):
+    """
+    CacheWarmup model - A worker's latest warm-up of its caches for a quiz
+    Written by each worker before the quiz opens; see prewarm.py
+    """
+    __tablename__ = 'cache_warmup'
+    worker = db.Column(db.String(100), primary_key=True)  # host:pid of the worker process
+    quiz_id = db.Column(db.Integer, primary_key=True)  # Quiz warmed up (no foreign key, so deleting the quiz isn't blocked)
+    warmed_at = db.Column(db.DateTime, nullable=False)  # When the warm-up finished
+    checked_at = db.Column(db.DateTime, nullable=True)  # When the worker last checked its quizzes, on every pass
+    seconds = db.Column(db.Float, nullable=False)  # How long it took
+    error = db.Column(db.Text)  # Why it failed, if it did
+    
+    def __repr__(self):
+        return f'<CacheWarmup {self.worker} quiz {self.quiz_id}>'
+
+class Tenant(db.Model):
+    """
+    Tenant model - An institution with its own database
+    Lives in the tenant registry (the "tenants" bind), not in the tenant databases
+    """
+    __bind_key__ = 'tenants'
+    id = db.Column(db.Integer, primary_key=True)  # Unique identifier for each tenant
+    slug = db.Column(db.String(63), unique=True, nullable=False)  # Subdomain / path prefix, e.g. "acme"
+    name = db.Column(db.String(100), nullable=False)  # Institution name
+    database_uri = db.Column(db.String(500), nullable=False)  # Where the tenant's data lives
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)  # When the tenant was provisioned
+    
+    def __repr__(self):
+        return f'<Tenant {self.slug}>'
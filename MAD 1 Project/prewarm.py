@@ -0,0 +1,203 @@
+# prewarm.py
+# Loading the caches before a quiz opens
+# When an exam opens, every student starts it within a minute or so. A worker
+# that hasn't served the quiz yet would load its question pool, answer key and
+# payload and compile the quiz pages while those requests queue behind it,
+# once per worker. Instead, each worker runs a prewarmer thread that looks at
+# the catalog every PREWARM_CHECK_SECONDS and loads the caches of quizzes that
+# open within the next PREWARM_LEAD_MINUTES (or opened less than that ago):
+# - the catalog (the dashboard's quiz list)
+# - the quiz's question pool and answer key (starting and grading an attempt)
+# - the quiz's question payload, unless students draw from a pool
+# - the templates of the pages students go through, compiled
+# If an admin edits the quiz after that, coherence.py drops the entries and the
+# next check loads them again. Each worker records its warm-ups in the
+# cache_warmup table, which the admin jobs page shows before the quiz opens,
+# and stamps its records on every check. Records of a worker that stopped
+# checking (it exited or its thread died) are shown as stale.
+# Tenants are warmed up in the workers that have served them.
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, update
+
+from extensions import db
+from models import CacheWarmup
+import catalog
+import coherence
+import question_pool
+import tenants
+import warmup
+
+# Pages on the way into, through and out of a quiz
+TEMPLATES = ('base.html', 'user/dashboard.html', 'user/quiz.html', 'user/scores.html')
+
+# Warm-up records older than this are deleted
+KEEP_RECORDS = timedelta(days=1)
+
+# Checks a worker may miss before its records are shown as stale
+STALE_AFTER_CHECKS = 3
+
+# (tenant slug, quiz id) of the warm-ups this worker has recorded
+_recorded = set()
+
+
+def worker_name():
+    """Host and process id of this worker, as recorded in cache_warmup"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def quizzes_due(now=None):
+    """Quizzes of the active tenant opening within the lead time, or opened less than that ago and still open"""
+    now = now or datetime.now()
+    lead = timedelta(minutes=current_app.config['PREWARM_LEAD_MINUTES'])
+    return [quiz for quiz in catalog.get_catalog().quizzes
+            if now - lead <= quiz.date <= now + lead and (quiz.closes_at is None or quiz.closes_at > now)]
+
+
+def warm_quiz(quiz):
+    """Load a quiz's question pool, answer key and (for unpooled quizzes) payload into this worker"""
+    question_pool.get_pool(quiz.id)
+    question_pool.get_answer_key(quiz.id)
+    if not question_pool.is_pooled(quiz):
+        question_pool.quiz_payload(quiz)
+
+
+def warm_templates(app):
+    """Compile the pages students go through during a quiz, and build the URL map"""
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+    warmup.build_url_map(app)
+
+
+def record(quiz_id, seconds, error=None):
+    """Save this worker's latest warm-up of a quiz"""
+    now = datetime.now()
+    db.session.merge(CacheWarmup(worker=worker_name(), quiz_id=quiz_id, warmed_at=now, checked_at=now,
+                                 seconds=seconds, error=error))
+    db.session.commit()
+
+
+def warm_due(app, now=None):
+    """
+    Warm up the quizzes of the active tenant that are due, unless this worker
+    already has them cached and has recorded so.
+
+    Returns:
+        IDs of the quizzes warmed up
+    """
+    # Changes other workers made must be dropped first, or they would be kept
+    coherence.check()
+    now = now or datetime.now()
+    tenant = tenants.current()
+    warmed = []
+    for quiz in quizzes_due(now):
+        if question_pool.is_cached(quiz) and (tenant, quiz.id) in _recorded:
+            continue
+        start = time.perf_counter()
+        error = None
+        try:
+            warm_quiz(quiz)
+            warm_templates(app)
+            warmed.append(quiz.id)
+        except Exception as e:
+            db.session.rollback()
+            error = str(e)
+            app.logger.exception(f"Could not warm up quiz {quiz.id}")
+        record(quiz.id, time.perf_counter() - start, error)
+        if error is None:
+            _recorded.add((tenant, quiz.id))
+    # Show this worker is still checking, and drop old records even when
+    # nothing needed warming up
+    db.session.execute(update(CacheWarmup).where(CacheWarmup.worker == worker_name())
+                       .values(checked_at=now))
+    prune_records(now)
+    if warmed:
+        app.logger.info(f"Warmed up the caches of quizzes {warmed} ({tenant or 'default'})")
+    return warmed
+
+
+def prune_records(now=None):
+    """Delete warm-up records older than KEEP_RECORDS"""
+    db.session.execute(delete(CacheWarmup).where(CacheWarmup.warmed_at < (now or datetime.now()) - KEEP_RECORDS))
+    db.session.commit()
+
+
+def status(now=None):
+    """
+    Warm-up of the active tenant's quizzes opening within a day, for the admin
+    jobs page: dicts with the quiz, when its warm-up starts, each worker's
+    latest warm-up record, and the workers whose records are stale because
+    they haven't checked for STALE_AFTER_CHECKS intervals.
+    """
+    now = now or datetime.now()
+    lead = timedelta(minutes=current_app.config['PREWARM_LEAD_MINUTES'])
+    stale_before = now - timedelta(seconds=current_app.config['PREWARM_CHECK_SECONDS'] * STALE_AFTER_CHECKS)
+    quizzes = [quiz for quiz in catalog.get_catalog().quizzes
+               if now - lead <= quiz.date <= now + KEEP_RECORDS and (quiz.closes_at is None or quiz.closes_at > now)]
+    quizzes.sort(key=lambda quiz: quiz.date)
+    records = {}
+    stale = {}
+    if quizzes:
+        for row in CacheWarmup.query.filter(CacheWarmup.quiz_id.in_([quiz.id for quiz in quizzes])) \
+                .order_by(CacheWarmup.worker):
+            records.setdefault(row.quiz_id, []).append(row)
+            if (row.checked_at or row.warmed_at) < stale_before:
+                stale.setdefault(row.quiz_id, set()).add(row.worker)
+    return [{'quiz': quiz, 'starts_at': quiz.date - lead, 'records': records.get(quiz.id, []),
+             'stale': stale.get(quiz.id, set())}
+            for quiz in quizzes]
+
+
+class Prewarmer:
+    """Thread that warms up the caches of due quizzes every PREWARM_CHECK_SECONDS"""
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['PREWARM_CHECK_SECONDS']
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Start the prewarmer thread if it isn't running yet"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._run, name='cache-prewarmer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Warm up the due quizzes of every tenant this worker serves"""
+        for tenant in [None, *tenants.active_tenants()]:
+            try:
+                with self.app.app_context():
+                    tenants.activate(tenant)
+                    warm_due(self.app)
+            except Exception:
+                self.app.logger.exception(f"Cache prewarmer failed ({tenant or 'default'})")
+
+
+def init_app(app):
+    """
+    Attach a Prewarmer to the app. Its thread starts with the first request, so
+    CLI commands and scripts don't start it. PREWARM_LEAD_MINUTES 0 turns it off.
+    """
+    app.config.setdefault('PREWARM_LEAD_MINUTES', 10)
+    app.config.setdefault('PREWARM_CHECK_SECONDS', 30)
+    prewarmer = Prewarmer(app)
+    app.extensions['prewarm'] = prewarmer
+    if app.config['PREWARM_LEAD_MINUTES']:
+        app.before_request(prewarmer.start)
+    return prewarmer
@@ -0,0 +1,296 @@
+# provisioning.py
+# Bulk creation of student accounts from a CSV or JSON file
+# Hashing the password is what makes creating an account slow: scrypt takes
+# about 0.1 s of CPU per password by design. Rows are read in chunks of
+# CHUNK_SIZE, and each chunk's passwords are hashed on a pool of
+# PROVISION_WORKERS processes while the previous chunk is being inserted.
+# Emails are checked against earlier rows of the file, and against the unique
+# index on user.email one chunk at a time. Each chunk is inserted in one
+# transaction; if it hits an email registered in the meantime, that chunk is
+# inserted row by row instead. Every row gets a line in the report: created, or
+# why it was skipped.
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+import tenants
+from extensions import db
+from models import User
+
+# Rows read, checked, hashed and inserted together
+CHUNK_SIZE = 500
+
+# Supported input formats
+FORMATS = ('csv', 'json')
+
+# Columns read from the file; the others are optional
+REQUIRED_COLUMNS = ('email', 'full_name', 'password')
+OPTIONAL_COLUMNS = ('qualification', 'dob')
+
+# Values for the optional columns, as on the registration form
+DEFAULT_QUALIFICATION = 'Not specified'
+DEFAULT_DOB = datetime(2000, 1, 1)
+
+# Longest values the user table holds
+MAX_LENGTH = 100
+
+# Report statuses
+CREATED = 'created'
+INVALID = 'invalid'
+DUPLICATE = 'duplicate'
+EXISTS = 'exists'
+FAILED = 'failed'
+
+REPORT_COLUMNS = ['line', 'email', 'status', 'message']
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def upload_folder():
+    """Folder uploaded files wait in until their job runs; each tenant has its own"""
+    folder = current_app.config['PROVISION_FOLDER']
+    tenant = tenants.current()
+    return os.path.join(folder, tenant) if tenant else folder
+
+
+def format_of(filename):
+    """Input format of a file from its extension, or None if unsupported"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return extension if extension in FORMATS else None
+
+
+def read_rows(stream, fmt):
+    """
+    Read users from a CSV file (with a header row) or a JSON list of objects.
+
+    Args:
+        stream: Binary file object
+        fmt: 'csv' or 'json'
+
+    Returns:
+        Iterator of (line number, dict of column -> value)
+    """
+    if fmt == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text)
+        if reader.fieldnames is None:
+            return
+        missing = set(REQUIRED_COLUMNS) - {name.strip().lower() for name in reader.fieldnames}
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, {(key or '').strip().lower(): value for key, value in row.items()}
+    elif fmt == 'json':
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get('users')
+        if not isinstance(data, list):
+            raise ValueError('Expected a list of users, or {"users": [...]}')
+        for number, row in enumerate(data, start=1):
+            yield number, row if isinstance(row, dict) else {}
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def check_row(row):
+    """
+    Validate one row and fill in the optional columns.
+
+    Returns:
+        Tuple of (user values, None) or (None, error message)
+    """
+    def text(name):
+        value = row.get(name)
+        return '' if value is None else str(value).strip()
+
+    email, full_name = text('email'), text('full_name')
+    password = row.get('password')
+    if not EMAIL_PATTERN.match(email):
+        return None, 'Invalid email address'
+    if not full_name:
+        return None, 'Full name is required'
+    if not isinstance(password, str) or not password:
+        return None, 'Password is required'
+    qualification = text('qualification') or DEFAULT_QUALIFICATION
+    if max(len(email), len(full_name), len(qualification)) > MAX_LENGTH:
+        return None, f'Values can be at most {MAX_LENGTH} characters long'
+    dob = DEFAULT_DOB
+    if text('dob'):
+        try:
+            dob = datetime.strptime(text('dob'), '%Y-%m-%d')
+        except ValueError:
+            return None, 'Date of birth must be in YYYY-MM-DD format'
+    return {'email': email, 'full_name': full_name, 'password': password,
+            'qualification': qualification, 'dob': dob}, None
+
+
+def hash_passwords(passwords):
+    """Hash a batch of passwords; runs in the worker processes"""
+    return [generate_password_hash(password) for password in passwords]
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Provisioner:
+    """Creates users chunk by chunk and keeps the per-row report"""
+
+    def __init__(self, pool=None, workers=1):
+        self.pool = pool
+        self.workers = workers
+        self.report = []
+        self.created = 0
+        self.seen = set()
+
+    def screen(self, chunk):
+        """
+        Check a chunk of (line, row) pairs. Reports the rejected rows.
+
+        Returns:
+            List of (line, user values) to create
+        """
+        accepted = []
+        for line, row in chunk:
+            values, error = check_row(row)
+            if error:
+                self.report.append((line, str(row.get('email') or ''), INVALID, error))
+            elif values['email'] in self.seen:
+                self.report.append((line, values['email'], DUPLICATE, 'Email appears earlier in the file'))
+            else:
+                self.seen.add(values['email'])
+                accepted.append((line, values))
+
+        # One indexed lookup for the whole chunk
+        registered = set(db.session.execute(
+            select(User.email).where(User.email.in_([values['email'] for line, values in accepted]))
+        ).scalars())
+        users = []
+        for line, values in accepted:
+            if values['email'] in registered:
+                self.report.append((line, values['email'], EXISTS, 'Email is already registered'))
+            else:
+                users.append((line, values))
+        return users
+
+    def start_hashing(self, users):
+        """Start hashing a chunk's passwords. Returns the futures to pass to insert()."""
+        passwords = [values['password'] for line, values in users]
+        if self.pool is None:
+            done = Future()
+            done.set_result(hash_passwords(passwords))
+            return [done]
+        size = max(1, -(-len(passwords) // self.workers))
+        return [self.pool.submit(hash_passwords, passwords[start:start + size])
+                for start in range(0, len(passwords), size)]
+
+    def insert(self, users, hashing):
+        """Insert a chunk once its passwords are hashed, in one transaction if possible"""
+        hashes = [password_hash for batch in hashing for password_hash in batch.result()]
+        records = [{'email': values['email'], 'password': password_hash, 'full_name': values['full_name'],
+                    'qualification': values['qualification'], 'dob': values['dob'], 'is_admin': False}
+                   for (line, values), password_hash in zip(users, hashes)]
+        if not records:
+            return
+        try:
+            db.session.execute(insert(User), records)
+            db.session.commit()
+        except IntegrityError:
+            # Someone registered one of these emails since the chunk was checked
+            db.session.rollback()
+            for (line, values), record in zip(users, records):
+                self._insert_one(line, record)
+            return
+        self.created += len(records)
+        self.report.extend((line, values['email'], CREATED, '') for line, values in users)
+
+    def _insert_one(self, line, record):
+        try:
+            db.session.execute(insert(User), [record])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            self.report.append((line, record['email'], EXISTS, 'Email is already registered'))
+        except Exception as e:
+            db.session.rollback()
+            self.report.append((line, record['email'], FAILED, str(e)))
+        else:
+            self.created += 1
+            self.report.append((line, record['email'], CREATED, ''))
+
+
+def provision_users(rows, workers=None, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """
+    Create student accounts from rows read by read_rows().
+
+    Args:
+        rows: Iterable of (line number, dict) pairs
+        workers: Hashing processes (default PROVISION_WORKERS, or one per CPU);
+            0 hashes in this process
+        chunk_size: Rows per chunk
+        on_chunk: Optional callback after each chunk is inserted; raising in it
+            stops before the next chunk
+
+    Returns:
+        Dict with created, skipped and the report (list of (line, email, status,
+        message) tuples in file order)
+    """
+    if workers is None:
+        workers = current_app.config.get('PROVISION_WORKERS')
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = None
+    if workers:
+        # Not forked: the web process running the job has other threads
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    provisioner = Provisioner(pool, max(workers, 1))
+    try:
+        pending = None
+        for chunk in _chunks(rows, chunk_size):
+            users = provisioner.screen(chunk)
+            hashing = provisioner.start_hashing(users)
+            # Insert the previous chunk while this one is being hashed
+            if pending is not None:
+                provisioner.insert(*pending)
+                if on_chunk is not None:
+                    on_chunk()
+            pending = (users, hashing)
+        if pending is not None:
+            provisioner.insert(*pending)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    report = sorted(provisioner.report)
+    return {'created': provisioner.created, 'skipped': len(report) - provisioner.created, 'report': report}
+
+
+def write_report(report, path):
+    """Write a provisioning report to a CSV file"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_COLUMNS)
+        writer.writerows(report)
+
+
+def report_filename():
+    """Build a timestamped file name for a provisioning report"""
+    return f"provisioning_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.csv"
@@ -0,0 +1,331 @@
+# question_pool.py
+# Randomized question pools for quizzes
+# Each quiz's question ids are cached in a compact array so an attempt can draw
+# K questions in O(K) without ORDER BY RANDOM() over the question table.
+# The drawn set is stored on a QuizAttempt so grading never reloads the pool,
+# and the answer key is cached with the pool so starting an attempt doesn't
+# query the question table either.
+#
+# The quiz page is rendered in the browser from a compact JSON payload of the
+# questions (no answers). A quiz that shows every question has one payload for
+# all students, encoded once per worker and revalidated by ETag; a quiz that
+# draws from a larger pool sends each student only the questions they drew.
+
+import hashlib
+import json
+import random
+import threading
+from array import array
+from datetime import datetime
+
+from sqlalchemy import text, update
+
+from extensions import db
+from models import Question, QuizAttempt
+import coherence
+import schedule
+import tenants
+
+# Option numbers as stored on Question (option1 .. option4)
+OPTION_NUMBERS = (1, 2, 3, 4)
+
+# (tenant slug, quiz_id) -> array of question ids, filled on first use
+_pool_cache = {}
+# (tenant slug, quiz_id) -> {question id: correct option}, loaded with the pool
+_answer_key_cache = {}
+# (tenant slug, quiz_id) -> (JSON payload, ETag) of quizzes that show every question
+_payload_cache = {}
+_pool_lock = threading.Lock()
+
+# A single SystemRandom keeps draws unpredictable between students
+_rng = random.SystemRandom()
+
+
+def _load_pool(quiz_id):
+    key = (tenants.current(), quiz_id)
+    with coherence.loading(coherence.QUIZ, quiz_id) as load:
+        rows = db.session.query(Question.id, Question.correct_option).filter_by(quiz_id=quiz_id) \
+            .order_by(Question.id).all()
+        pool = array('q', (row.id for row in rows))
+        answer_key = {row.id: row.correct_option for row in rows}
+        with _pool_lock:
+            if load.current:
+                _pool_cache[key] = pool
+                _answer_key_cache[key] = answer_key
+    return pool, answer_key
+
+
+def get_pool(quiz_id):
+    """
+    Return the cached array of question ids for a quiz, loading it on first use.
+
+    Args:
+        quiz_id: ID of the quiz
+
+    Returns:
+        array('q') of question ids in insertion order
+    """
+    pool = _pool_cache.get((tenants.current(), quiz_id))
+    if pool is None:
+        pool, _ = _load_pool(quiz_id)
+    return pool
+
+
+def get_answer_key(quiz_id):
+    """Return the cached {question id: correct option} of a quiz, loaded along with its pool"""
+    answer_key = _answer_key_cache.get((tenants.current(), quiz_id))
+    if answer_key is None:
+        _, answer_key = _load_pool(quiz_id)
+    return answer_key
+
+
+def invalidate_pool(quiz_id=None):
+    """
+    Drop the cached pool, answer key and payload for a quiz after its questions change.
+    Called by coherence.py in every worker.
+
+    Args:
+        quiz_id: ID of the quiz, or None to clear every cached pool of the tenant
+    """
+    tenant = tenants.current()
+    with _pool_lock:
+        for cache in (_pool_cache, _answer_key_cache, _payload_cache):
+            if quiz_id is None:
+                for key in [key for key in cache if key[0] == tenant]:
+                    del cache[key]
+            else:
+                cache.pop((tenant, quiz_id), None)
+
+
+coherence.register(coherence.QUIZ, invalidate_pool)
+
+
+def draw_questions(quiz, rng=None):
+    """
+    Pick the questions and option order for a new attempt.
+
+    Args:
+        quiz: Quiz to draw from
+        rng: Optional random.Random, mainly for reproducible benchmarks
+
+    Returns:
+        Tuple of (question_ids, option_orders)
+    """
+    rng = rng or _rng
+    pool = get_pool(quiz.id)
+
+    if quiz.pool_size and quiz.pool_size < len(pool):
+        # random.sample on a large sequence tracks picked indexes in a set,
+        # so this costs O(K) rather than O(pool size)
+        question_ids = rng.sample(pool, quiz.pool_size)
+    else:
+        question_ids = list(pool)
+        if quiz.pool_size:
+            rng.shuffle(question_ids)
+
+    option_orders = []
+    for _ in question_ids:
+        order = list(OPTION_NUMBERS)
+        if quiz.shuffle_options:
+            rng.shuffle(order)
+        option_orders.append(order)
+    return question_ids, option_orders
+
+
+def get_open_attempt(user_id, quiz_id):
+    """Return the user's started but not yet submitted attempt at a quiz, if any"""
+    return QuizAttempt.query.filter_by(user_id=user_id, quiz_id=quiz_id, submitted_at=None) \
+        .order_by(QuizAttempt.id.desc()).first()
+
+
+def claim_attempt(attempt, submitted_at):
+    """
+    Mark an open attempt submitted, in a new transaction. The update only
+    matches an attempt that is still open, so when two submissions race, one
+    claims it and the other gets False and must roll back without recording a
+    score. The session is committed first: SQLite can't turn a read snapshot
+    that another write has overtaken into a write, and the attempt is read
+    again after the claim.
+
+    Returns:
+        True if this call claimed the attempt
+    """
+    db.session.commit()
+    claimed = db.session.execute(
+        update(QuizAttempt)
+        .where(QuizAttempt.id == attempt.id, QuizAttempt.submitted_at.is_(None))
+        .values(submitted_at=submitted_at)
+        .execution_options(synchronize_session=False))
+    return claimed.rowcount == 1
+
+
+def remove_question(question_id, quiz_id):
+    """
+    Record a question that is being deleted on the open attempts that drew it,
+    so they aren't graded on it. Call in the same transaction as the delete.
+
+    Returns:
+        Number of open attempts updated
+    """
+    return db.session.execute(text(
+        "UPDATE quiz_attempt SET removed_question_ids = json_insert(removed_question_ids, '$[#]', :question_id) "
+        "WHERE quiz_id = :quiz_id AND submitted_at IS NULL "
+        "AND EXISTS (SELECT 1 FROM json_each(quiz_attempt.question_ids) WHERE value = :question_id)"),
+        {'question_id': question_id, 'quiz_id': quiz_id}).rowcount
+
+
+def start_attempt(quiz, user_id):
+    """
+    Return the user's open attempt at a quiz, or draw and store a new one.
+    Reloading the quiz page shows the same questions instead of a new draw.
+
+    Args:
+        quiz: Quiz being attempted
+        user_id: ID of the user taking the quiz
+
+    Returns:
+        The QuizAttempt, or None if the quiz has no questions
+    """
+    attempt = get_open_attempt(user_id, quiz.id)
+    if attempt:
+        return attempt
+
+    question_ids, option_orders = draw_questions(quiz)
+    if not question_ids:
+        return None
+
+    correct = get_answer_key(quiz.id)
+    missing = [question_id for question_id in question_ids if question_id not in correct]
+    if missing:
+        # The questions changed between loading the pool and the answer key
+        correct = dict(correct)
+        correct.update(db.session.query(Question.id, Question.correct_option).filter(Question.id.in_(missing)))
+    attempt = QuizAttempt(
+        quiz_id=quiz.id,
+        user_id=user_id,
+        question_ids=json.dumps(question_ids),
+        option_orders=json.dumps(option_orders),
+        answer_key=json.dumps([correct[question_id] for question_id in question_ids]),
+        started_at=datetime.now()
+    )
+    attempt.deadline = schedule.attempt_deadline(quiz, attempt)
+    db.session.add(attempt)
+    db.session.commit()
+    return attempt
+
+
+def is_cached(quiz):
+    """True if this worker has everything cached that starting an attempt at the quiz needs"""
+    key = (tenants.current(), quiz.id)
+    if key not in _pool_cache or key not in _answer_key_cache:
+        return False
+    return is_pooled(quiz) or key in _payload_cache
+
+
+def is_pooled(quiz):
+    """True if each attempt draws a subset of the quiz's questions"""
+    return bool(quiz.pool_size) and quiz.pool_size < len(get_pool(quiz.id))
+
+
+def _payload_query():
+    return db.session.query(Question.id, Question.question_text,
+                            Question.option1, Question.option2, Question.option3, Question.option4)
+
+
+def encode_payload(rows):
+    """
+    Encode question rows as the compact JSON the quiz page renders:
+    {"questions": [[id, text, [option1, option2, option3, option4]], ...]}
+
+    Returns:
+        Tuple of (UTF-8 JSON bytes, ETag)
+    """
+    body = json.dumps(
+        {'questions': [[row.id, row.question_text, [row.option1, row.option2, row.option3, row.option4]]
+                       for row in rows]},
+        ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def quiz_payload(quiz):
+    """Cached payload of every question in a quiz that isn't pooled"""
+    key = (tenants.current(), quiz.id)
+    payload = _payload_cache.get(key)
+    if payload is None:
+        with coherence.loading(coherence.QUIZ, quiz.id) as load:
+            payload = encode_payload(_payload_query().filter(Question.quiz_id == quiz.id).order_by(Question.id))
+            with _pool_lock:
+                if load.current:
+                    _payload_cache[key] = payload
+    return payload
+
+
+def attempt_payload(attempt):
+    """Payload of the questions drawn for one attempt"""
+    question_ids = json.loads(attempt.question_ids)
+    return encode_payload(_payload_query().filter(Question.id.in_(question_ids)).order_by(Question.id))
+
+
+def attempt_layout(attempt):
+    """
+    The attempt's question order and option order, embedded in the quiz page.
+    The browser lays out the payload's questions with it.
+    """
+    return {
+        'questions': json.loads(attempt.question_ids),
+        'options': json.loads(attempt.option_orders),
+    }
+
+
+def selected_options(attempt, answers):
+    """
+    The selected option numbers of a submission, in the attempt's question order.
+
+    Args:
+        attempt: QuizAttempt being submitted
+        answers: Either a list of selected option numbers in the attempt's
+            question order (0 or None for unanswered), as submitted by the quiz
+            page, or a mapping of "question_<id>" to the selected option number
+            (e.g. request.form)
+
+    Raises:
+        ValueError: If an answer list doesn't match the attempt's questions
+    """
+    question_ids = json.loads(attempt.question_ids)
+    if isinstance(answers, list):
+        if len(answers) != len(question_ids):
+            raise ValueError('Expected one answer per question')
+        return answers
+    selected = []
+    for question_id in question_ids:
+        selected_option = answers.get(f'question_{question_id}')
+        selected.append(int(selected_option) if selected_option and selected_option.isdigit() else None)
+    return selected
+
+
+def grade_attempt(attempt, answers):
+    """
+    Grade an attempt against the answer key stored when it was drawn, without
+    reloading the quiz. Questions deleted while it was open (recorded by
+    remove_question) are left out of both the score and the total.
+
+    Args:
+        attempt: QuizAttempt being submitted
+        answers: Answers in either form selected_options() takes
+
+    Returns:
+        Tuple of (score, total_questions)
+
+    Raises:
+        ValueError: If an answer list doesn't match the attempt's questions
+    """
+    selected = selected_options(attempt, answers)
+    removed = set(json.loads(attempt.removed_question_ids or '[]'))
+    graded = [(selected_option, correct_option) for question_id, selected_option, correct_option
+              in zip(json.loads(attempt.question_ids), selected, json.loads(attempt.answer_key))
+              if question_id not in removed]
+
+    # bool is an int subclass, so rule out true/false from JSON explicitly
+    score = sum(1 for selected_option, correct_option in graded
+                if type(selected_option) is int and selected_option == correct_option)
+    return score, len(graded)
@@ -0,0 +1,277 @@
+# ratelimit.py
+# Admission control for the login and quiz endpoints
+# Routes marked @limited get two checks before the view runs:
+# - A token bucket per user (per client IP before login, and always for the
+#   login form) refills at a steady rate up to a burst size. A request that
+#   would only have to wait a moment for its token waits; otherwise it is
+#   turned away with 429 and a Retry-After header.
+# - A concurrency gate per route and worker. When it is full a request queues
+#   for up to RATE_LIMIT_QUEUE_SECONDS, then gets 503 with Retry-After, so a
+#   refresh storm sheds load instead of piling up behind the database.
+#
+# Buckets live in worker memory by default. Set RATE_LIMIT_STORAGE_URI to a
+# SQLite file to share them between workers; it is kept separate from the app
+# database so limiter writes never queue behind quiz submissions.
+# Counters are per worker and shown at /admin/limits. Queued requests served
+# by asgi.py wait on the event loop rather than blocking its thread.
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, render_template, request, session
+from sqlalchemy import create_engine, event, text
+
+import async_db
+import tenants
+
+# Most buckets kept in memory; the least recently used are dropped beyond this
+MEMORY_BUCKET_LIMIT = 10000
+
+# Buckets untouched this long (seconds) are deleted from shared storage
+SHARED_BUCKET_TTL = 3600
+
+
+class RateLimitRule:
+    """Limits for one endpoint"""
+
+    __slots__ = ('burst', 'per_second', 'concurrency', 'methods', 'gate')
+
+    def __init__(self, burst, per_second, concurrency, methods=None):
+        self.burst = burst  # Requests allowed back to back
+        self.per_second = per_second  # Tokens added per second
+        self.concurrency = concurrency  # Requests running at once in this worker
+        self.methods = set(methods) if methods else None  # None limits every method
+        self.gate = threading.BoundedSemaphore(concurrency)
+
+
+class RouteStats:
+    """Counters for one endpoint in this worker"""
+
+    __slots__ = ('allowed', 'delayed', 'limited', 'shed', 'in_flight', 'peak_in_flight', 'queue_seconds')
+
+    def __init__(self):
+        self.allowed = 0  # Requests that ran
+        self.delayed = 0  # Requests that waited for a token or a free slot first
+        self.limited = 0  # Rejected with 429 (bucket empty)
+        self.shed = 0  # Rejected with 503 (route busy)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queue_seconds = 0.0  # Total time spent waiting
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MemoryBuckets:
+    """Token buckets in this worker's memory"""
+
+    def __init__(self):
+        # key -> (tokens, updated_at, seconds to refill completely), least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, per_second, max_wait):
+        """
+        Take a token from a bucket, borrowing against the next refill if it
+        arrives within max_wait seconds.
+
+        Returns:
+            Tuple of (taken, wait): seconds to sleep before proceeding if taken,
+            otherwise seconds until a token would be available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (burst, now, 0))
+            tokens = min(burst, tokens + (now - updated_at) * per_second)
+            if tokens - 1 < -max_wait * per_second:
+                return False, (1 - tokens) / per_second
+            self._buckets[key] = (tokens - 1, now, (burst - tokens + 1) / per_second)
+            self._buckets.move_to_end(key)
+            self._prune(now)
+        return True, max(0.0, (1 - tokens) / per_second)
+
+    def _prune(self, now):
+        # Drop the least recently used buckets while they have refilled
+        # completely (they behave like new ones), and beyond MEMORY_BUCKET_LIMIT
+        # whether they have or not. Only the oldest buckets are looked at, so
+        # each call costs about one bucket however many are kept.
+        while self._buckets:
+            key, (_, updated_at, refill) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= MEMORY_BUCKET_LIMIT and now - updated_at <= refill:
+                break
+            del self._buckets[key]
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file shared by every worker"""
+
+    TAKE = text(
+        "INSERT INTO rate_limit_bucket (key, tokens, updated_at) VALUES (:key, :burst - 1, :now) "
+        "ON CONFLICT(key) DO UPDATE SET "
+        "tokens = min(:burst, tokens + (:now - updated_at) * :rate) - 1, updated_at = :now "
+        "WHERE min(:burst, tokens + (:now - updated_at) * :rate) - 1 >= -:max_wait * :rate "
+        "RETURNING tokens"
+    )
+
+    def __init__(self, uri):
+        self.engine = create_engine(uri)
+        self._calls = 0
+
+        @event.listens_for(self.engine, 'connect')
+        def _pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA busy_timeout=1000')
+            cursor.close()
+
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS rate_limit_bucket "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"))
+
+    def take(self, key, burst, per_second, max_wait):
+        """
+        Same as MemoryBuckets.take, as one atomic upsert. In requests served on
+        the event loop it runs on a thread, so waiting on the file's lock never
+        blocks the loop.
+        """
+        return async_db.off_loop(self._take, key, burst, per_second, max_wait)
+
+    def _take(self, key, burst, per_second, max_wait):
+        now = time.time()
+        params = {'key': key, 'burst': burst, 'rate': per_second, 'now': now, 'max_wait': max_wait}
+        with self.engine.begin() as connection:
+            tokens = connection.execute(self.TAKE, params).scalar()
+            if tokens is None:
+                row = connection.execute(text(
+                    "SELECT tokens, updated_at FROM rate_limit_bucket WHERE key = :key"), params).first()
+                available = min(burst, row.tokens + (now - row.updated_at) * per_second)
+                return False, (1 - available) / per_second
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                connection.execute(text("DELETE FROM rate_limit_bucket WHERE updated_at < :cutoff"),
+                                   {'cutoff': now - SHARED_BUCKET_TTL})
+        return True, max(0.0, -tokens / per_second)
+
+
+class Limiter:
+    """Rules, buckets and counters for one app"""
+
+    def __init__(self, app):
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.queue_seconds = app.config['RATE_LIMIT_QUEUE_SECONDS']
+        self.rules = {endpoint: RateLimitRule(**limits) for endpoint, limits in app.config['RATE_LIMITS'].items()}
+        self.stats = {endpoint: RouteStats() for endpoint in self.rules}
+        storage_uri = app.config.get('RATE_LIMIT_STORAGE_URI')
+        self.buckets = SQLiteBuckets(storage_uri) if storage_uri else MemoryBuckets()
+        self._lock = threading.Lock()
+
+    def _bucket_key(self, endpoint):
+        # User ids are only unique within a tenant
+        if endpoint != 'login' and 'user_id' in session:
+            client = f"user:{session['user_id']}"
+        else:
+            client = f'ip:{request.remote_addr}'
+        return f'{endpoint}:{tenants.current() or ""}:{client}'
+
+    def _count(self, stats, field, waited=0.0):
+        with self._lock:
+            setattr(stats, field, getattr(stats, field) + 1)
+            stats.queue_seconds += waited
+
+    def _take_token(self, endpoint, rule, stats):
+        """Returns None when the request may go on, or the seconds to tell the client to wait"""
+        try:
+            taken, wait = self.buckets.take(self._bucket_key(endpoint), rule.burst, rule.per_second,
+                                            self.queue_seconds)
+        except Exception:
+            # Never turn students away because the shared limiter store is unavailable
+            current_app.logger.exception('Rate limiter storage failed; allowing the request')
+            return None
+        if not taken:
+            self._count(stats, 'limited')
+            return wait
+        if wait > 0:
+            self._count(stats, 'delayed', wait)
+            async_db.sleep(wait)
+        return None
+
+    def _enter(self, rule, stats):
+        """Take a concurrency slot, queueing briefly. Returns False if the route stays busy."""
+        if not rule.gate.acquire(blocking=False):
+            started = time.monotonic()
+            acquired = async_db.acquire(rule.gate, self.queue_seconds)
+            self._count(stats, 'delayed' if acquired else 'shed', time.monotonic() - started)
+            if not acquired:
+                return False
+        with self._lock:
+            stats.allowed += 1
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        return True
+
+    def _leave(self, rule, stats):
+        with self._lock:
+            stats.in_flight -= 1
+        rule.gate.release()
+
+    def call(self, endpoint, view, args, kwargs):
+        rule = self.rules.get(endpoint)
+        if not self.enabled or rule is None or (rule.methods and request.method not in rule.methods):
+            return view(*args, **kwargs)
+        stats = self.stats[endpoint]
+
+        wait = self._take_token(endpoint, rule, stats)
+        if wait is not None:
+            return _reject(429, wait, 'Too Many Requests',
+                           'You are sending requests too quickly. Please wait a moment and try again.')
+        if not self._enter(rule, stats):
+            return _reject(503, 1, 'Server Busy',
+                           'Too many students are doing this right now. Please try again in a moment.')
+        try:
+            return view(*args, **kwargs)
+        finally:
+            self._leave(rule, stats)
+
+    def snapshot(self):
+        """Counters and limits of every limited endpoint, for the admin metrics page"""
+        with self._lock:
+            return {
+                endpoint: dict(stats.to_dict(), burst=self.rules[endpoint].burst,
+                               per_second=self.rules[endpoint].per_second,
+                               concurrency=self.rules[endpoint].concurrency)
+                for endpoint, stats in self.stats.items()
+            }
+
+
+def _reject(status, retry_after, error, message):
+    retry_after = max(1, math.ceil(retry_after))
+    if request.is_json or request.path.startswith('/api/'):
+        response = jsonify(error=message, retry_after=retry_after)
+    else:
+        response = current_app.make_response(render_template('error.html', error=error, message=message))
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def limited(view):
+    """Route decorator: apply the RATE_LIMITS rule for this endpoint"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return current_app.extensions['ratelimit'].call(view.__name__, view, args, kwargs)
+    return wrapper
+
+
+def init_app(app):
+    """Build the limiter from RATE_LIMITS"""
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+    app.config.setdefault('RATE_LIMIT_QUEUE_SECONDS', 0.5)
+    app.config.setdefault('RATE_LIMITS', {})
+    limiter = Limiter(app)
+    app.extensions['ratelimit'] = limiter
+    return limiter
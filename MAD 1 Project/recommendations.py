@@ -0,0 +1,196 @@
+# recommendations.py
+# "Next quiz" suggestions for the user dashboard
+# Candidates are the open quizzes the user hasn't attempted, found with one
+# indexed query (ix_quiz_window for the window, ix_score_user_quiz and
+# ix_score_archive_user_quiz to skip attempted quizzes). Each is scored from the user's per-chapter totals:
+# the weaker the chapter (or its subject, for chapters not tried yet) and the
+# longer since it was practised, the higher it ranks, with a nudge for quizzes
+# that close soon. Results are cached per user until their next submission.
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, select
+
+from extensions import db
+from models import Quiz, UserChapterStats
+import archive
+import catalog
+import coherence
+import tenants
+
+# Suggestions shown on the dashboard
+RECOMMENDATION_COUNT = 3
+
+# Average assumed for chapters and subjects the user hasn't tried yet
+UNTRIED_AVERAGE = 50.0
+
+# Up to STALE_WEIGHT points for not having practised a chapter in STALE_DAYS days
+STALE_DAYS = 14
+STALE_WEIGHT = 20.0
+
+# Points for quizzes that close within CLOSING_SOON
+CLOSING_SOON = timedelta(days=3)
+CLOSING_SOON_WEIGHT = 10.0
+
+# Quizzes open and close over time, so cached suggestions are also refreshed after this many seconds
+CACHE_SECONDS = 300
+
+# Users whose suggestions each worker keeps
+CACHE_SIZE = 10000
+
+# (tenant slug, user_id) -> (catalog version, expiry time, recommendations), least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Recommendation:
+    """A suggested quiz and why it was picked"""
+
+    __slots__ = ('quiz', 'score', 'reason')
+
+    def __init__(self, quiz, score, reason):
+        self.quiz = quiz  # catalog QuizEntry
+        self.score = score
+        self.reason = reason
+
+
+def unattempted_quiz_ids(user_id, now=None):
+    """Ids of the open quizzes the user has no score for"""
+    now = now or datetime.now()
+    return db.session.execute(
+        select(Quiz.id)
+        .where(or_(Quiz.closes_at.is_(None), Quiz.closes_at > now), Quiz.date <= now,
+               ~archive.attempted(user_id, Quiz.id))
+    ).scalars().all()
+
+
+def _chapter_stats(user_id):
+    """chapter_id -> (attempts, percentage_sum, last attempt)"""
+    rows = db.session.execute(
+        select(UserChapterStats.chapter_id, UserChapterStats.attempts,
+               UserChapterStats.percentage_sum, UserChapterStats.last_attempt_at)
+        .where(UserChapterStats.user_id == user_id)
+    ).all()
+    return {chapter_id: (attempts, percentage_sum, last_attempt_at)
+            for chapter_id, attempts, percentage_sum, last_attempt_at in rows}
+
+
+def _subject_stats(chapter_stats, chapters_by_id):
+    """subject_id -> (attempts, percentage_sum, last attempt), summed over the user's chapters"""
+    subjects = {}
+    for chapter_id, (attempts, percentage_sum, last_attempt_at) in chapter_stats.items():
+        chapter = chapters_by_id.get(chapter_id)
+        if chapter is None:
+            continue
+        total_attempts, total_percentage, last = subjects.get(chapter.subject_id, (0, 0.0, None))
+        if last is None or (last_attempt_at is not None and last_attempt_at > last):
+            last = last_attempt_at
+        subjects[chapter.subject_id] = (total_attempts + attempts, total_percentage + percentage_sum, last)
+    return subjects
+
+
+def score_quiz(quiz, chapter_stats, subject_stats, now):
+    """
+    Rank a candidate quiz for one user.
+
+    Args:
+        quiz: catalog QuizEntry
+        chapter_stats: The user's stats by chapter id, from _chapter_stats
+        subject_stats: The user's stats by subject id, from _subject_stats
+        now: Current time
+
+    Returns:
+        Tuple of (score, reason); higher scores are recommended first
+    """
+    chapter = quiz.chapter
+    stats = chapter_stats.get(chapter.id)
+    area = chapter.name
+    if not stats or stats[0] <= 0:
+        stats = subject_stats.get(chapter.subject_id)
+        area = chapter.subject.name
+
+    if stats and stats[0] > 0:
+        attempts, percentage_sum, last_attempt_at = stats
+        average = percentage_sum / attempts
+        idle_days = (now - last_attempt_at).days if last_attempt_at else STALE_DAYS
+        reason = f'Your average in {area} is {average:.0f}%'
+    else:
+        average = UNTRIED_AVERAGE
+        idle_days = STALE_DAYS
+        reason = f"You haven't tried {chapter.subject.name} yet"
+
+    score = (100.0 - average) + STALE_WEIGHT * min(idle_days, STALE_DAYS) / STALE_DAYS
+    if quiz.closes_at is not None and quiz.closes_at - now <= CLOSING_SOON:
+        score += CLOSING_SOON_WEIGHT
+        reason += f", and this quiz closes on {quiz.closes_at.strftime('%d %b')}"
+    return score, reason
+
+
+def build_recommendations(user_id, now=None, count=RECOMMENDATION_COUNT):
+    """
+    Pick the best quizzes for a user to take next.
+
+    Returns:
+        List of up to count Recommendations, best first
+    """
+    now = now or datetime.now()
+    snapshot = catalog.get_catalog()
+    quizzes_by_id = snapshot.quizzes_by_id
+    candidates = [quizzes_by_id[quiz_id] for quiz_id in unattempted_quiz_ids(user_id, now)
+                  if quiz_id in quizzes_by_id and quizzes_by_id[quiz_id].question_count > 0]
+    if not candidates:
+        return []
+
+    chapter_stats = _chapter_stats(user_id)
+    subject_stats = _subject_stats(chapter_stats, snapshot.chapters_by_id)
+    ranked = []
+    for quiz in candidates:
+        score, reason = score_quiz(quiz, chapter_stats, subject_stats, now)
+        ranked.append(Recommendation(quiz, score, reason))
+    # Ties go to the quiz that opened first
+    ranked.sort(key=lambda recommendation: (-recommendation.score, recommendation.quiz.date, recommendation.quiz.id))
+    return ranked[:count]
+
+
+def get_recommendations(user_id):
+    """Return the cached recommendations for a user, building them if missing or stale"""
+    key = (tenants.current(), user_id)
+    version = catalog.current_version()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+            _cache.move_to_end(key)
+            return entry[2]
+
+    with coherence.loading(coherence.USER, user_id) as load:
+        recommendations = build_recommendations(user_id)
+        with _cache_lock:
+            if load.current:
+                _cache[key] = (version, time.monotonic() + CACHE_SECONDS, recommendations)
+                _cache.move_to_end(key)
+                while len(_cache) > CACHE_SIZE:
+                    _cache.popitem(last=False)
+    return recommendations
+
+
+def invalidate_user(user_id=None):
+    """
+    Drop a user's cached recommendations, e.g. after they submit a quiz.
+    Called by coherence.py in every worker.
+
+    Args:
+        user_id: ID of the user, or None to clear the tenant's whole cache
+    """
+    tenant = tenants.current()
+    with _cache_lock:
+        if user_id is None:
+            for key in [key for key in _cache if key[0] == tenant]:
+                del _cache[key]
+        else:
+            _cache.pop((tenant, user_id), None)
+
+
+coherence.register(coherence.USER, invalidate_user)
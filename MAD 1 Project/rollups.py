@@ -0,0 +1,364 @@
+# rollups.py
+# Daily time-series rollups of quiz attempts
+# UserSubjectDaily and SubjectDaily hold attempt counts and score sums per day.
+# They are updated incrementally in the same transaction as each new Score and
+# can be rebuilt from the score table at any time, so summary charts cost
+# O(days) instead of O(scores) and come back in date order.
+# UserChapterStats holds the same sums per user and chapter (without days),
+# for quiz recommendations and per-subject totals, and UserStats each user's
+# running totals, best result and last attempt, so the user dashboard and
+# summary cost the same however many quizzes the user has taken.
+
+from datetime import date
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from extensions import db
+from models import Subject, Chapter, Quiz, UserSubjectDaily, SubjectDaily, UserChapterStats, UserStats
+import archive
+import schema
+
+ROLLUP_MODELS = (UserSubjectDaily, SubjectDaily, UserChapterStats)
+
+
+def _percentage(score, total_questions):
+    return (score / total_questions) * 100 if total_questions > 0 else 0.0
+
+
+def _upsert(model, keys, attempts, score_sum, question_sum, percentage_sum, sums=None, **latest):
+    """
+    Add to a rollup row, creating it if it doesn't exist yet.
+    sums adds to further columns, such as UserStats.graded_attempts.
+    Keyword arguments such as last_attempt_at keep the larger of the stored and new values.
+    """
+    sums = sums or {}
+    stmt = insert(model).values(**keys, attempts=attempts, score_sum=score_sum,
+                                question_sum=question_sum, percentage_sum=percentage_sum, **sums, **latest)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            'attempts': model.attempts + stmt.excluded.attempts,
+            'score_sum': model.score_sum + stmt.excluded.score_sum,
+            'question_sum': model.question_sum + stmt.excluded.question_sum,
+            'percentage_sum': model.percentage_sum + stmt.excluded.percentage_sum,
+            **{name: getattr(model, name) + getattr(stmt.excluded, name) for name in sums},
+            **{name: func.max(func.coalesce(getattr(model, name), getattr(stmt.excluded, name)),
+                              getattr(stmt.excluded, name))
+               for name in latest},
+        }
+    )
+    db.session.execute(stmt)
+
+
+def record_score(score, chapter):
+    """
+    Add a new score to the rollups.
+    Call before committing the Score so both land in the same transaction.
+
+    Args:
+        score: The Score being saved
+        chapter: Chapter the quiz belongs to
+    """
+    day = score.timestamp.date()
+    percentage = _percentage(score.score, score.total_questions)
+    _upsert(UserSubjectDaily, {'user_id': score.user_id, 'subject_id': chapter.subject_id, 'day': day},
+            1, score.score, score.total_questions, percentage)
+    _upsert(SubjectDaily, {'subject_id': chapter.subject_id, 'day': day},
+            1, score.score, score.total_questions, percentage)
+    _upsert(UserChapterStats, {'user_id': score.user_id, 'chapter_id': chapter.id},
+            1, score.score, score.total_questions, percentage, last_attempt_at=score.timestamp)
+    _upsert(UserStats, {'user_id': score.user_id}, 1, score.score, score.total_questions, percentage,
+            sums={'graded_attempts': 1 if score.total_questions > 0 else 0},
+            best_percentage=percentage, last_attempt_at=score.timestamp)
+
+
+def _grouped_sums(group_names, quiz_ids):
+    """Aggregate the hot and archived scores of some quizzes per rollup key"""
+    scores = archive.all_scores('quiz_id', 'user_id', 'score', 'total_questions', 'timestamp')
+    columns = {'user_id': scores.c.user_id, 'subject_id': Chapter.subject_id,
+               'chapter_id': Chapter.id, 'day': func.date(scores.c.timestamp)}
+    group_columns = [columns[name] for name in group_names]
+    percentage = func.sum(func.iif(scores.c.total_questions > 0,
+                                   scores.c.score * 100.0 / scores.c.total_questions, 0.0))
+    return db.session.execute(
+        select(*group_columns, func.count(), func.sum(scores.c.score),
+               func.sum(scores.c.total_questions), percentage)
+        .select_from(scores)
+        .join(Quiz, Quiz.id == scores.c.quiz_id)
+        .join(Chapter, Chapter.id == Quiz.chapter_id)
+        .where(scores.c.quiz_id.in_(quiz_ids))
+        .group_by(*group_columns)
+    ).all()
+
+
+def remove_scores(quiz_ids):
+    """
+    Subtract the scores of quizzes that are about to be deleted from the rollups,
+    archived scores included. Call before the scores are deleted, in the same transaction.
+
+    Args:
+        quiz_ids: IDs of the quizzes being deleted
+    """
+    for user_id, subject_id, day_text, attempts, score_sum, question_sum, percentage_sum in _grouped_sums(
+            ('user_id', 'subject_id', 'day'), quiz_ids):
+        _upsert(UserSubjectDaily,
+                {'user_id': user_id, 'subject_id': subject_id, 'day': date.fromisoformat(day_text)},
+                -attempts, -score_sum, -question_sum, -percentage_sum)
+    for subject_id, day_text, attempts, score_sum, question_sum, percentage_sum in _grouped_sums(
+            ('subject_id', 'day'), quiz_ids):
+        _upsert(SubjectDaily, {'subject_id': subject_id, 'day': date.fromisoformat(day_text)},
+                -attempts, -score_sum, -question_sum, -percentage_sum)
+    # last_attempt_at stays as it was; it only steers recommendations
+    for user_id, chapter_id, attempts, score_sum, question_sum, percentage_sum in _grouped_sums(
+            ('user_id', 'chapter_id'), quiz_ids):
+        _upsert(UserChapterStats, {'user_id': user_id, 'chapter_id': chapter_id},
+                -attempts, -score_sum, -question_sum, -percentage_sum)
+    for model in ROLLUP_MODELS:
+        model.query.filter(model.attempts <= 0).delete(synchronize_session=False)
+    _refresh_user_stats(quiz_ids)
+
+
+def remove_subject(subject_id):
+    """Drop every rollup row of a subject that is being deleted"""
+    quiz_ids = db.session.execute(
+        select(Quiz.id).join(Chapter, Chapter.id == Quiz.chapter_id).where(Chapter.subject_id == subject_id)
+    ).scalars().all()
+    _refresh_user_stats(quiz_ids)
+    for model in (UserSubjectDaily, SubjectDaily):
+        model.query.filter_by(subject_id=subject_id).delete(synchronize_session=False)
+    UserChapterStats.query.filter(
+        UserChapterStats.chapter_id.in_(select(Chapter.id).where(Chapter.subject_id == subject_id))
+    ).delete(synchronize_session=False)
+
+
+def user_totals(user_ids=None, exclude_quiz_ids=()):
+    """
+    Compute UserStats values from the hot and archived scores.
+
+    Args:
+        user_ids: Only these users, or None for everyone
+        exclude_quiz_ids: Leave out the scores of these quizzes
+
+    Returns:
+        Dict of user_id -> dict of UserStats column values
+    """
+    scores = archive.all_scores('quiz_id', 'user_id', 'score', 'total_questions', 'timestamp')
+    percentage = func.iif(scores.c.total_questions > 0, scores.c.score * 100.0 / scores.c.total_questions, 0.0)
+    graded = func.sum(func.iif(scores.c.total_questions > 0, 1, 0))
+    stmt = (select(scores.c.user_id, func.count(), graded, func.sum(scores.c.score),
+                   func.sum(scores.c.total_questions), func.sum(percentage), func.max(percentage),
+                   func.max(scores.c.timestamp))
+            .group_by(scores.c.user_id))
+    if user_ids is not None:
+        stmt = stmt.where(scores.c.user_id.in_(user_ids))
+    if exclude_quiz_ids:
+        stmt = stmt.where(scores.c.quiz_id.not_in(exclude_quiz_ids))
+    return {
+        user_id: {'attempts': attempts, 'graded_attempts': graded_attempts, 'score_sum': score_sum,
+                  'question_sum': question_sum, 'percentage_sum': percentage_sum,
+                  'best_percentage': best_percentage, 'last_attempt_at': last_attempt_at}
+        for user_id, attempts, graded_attempts, score_sum, question_sum, percentage_sum, best_percentage,
+        last_attempt_at in db.session.execute(stmt)
+    }
+
+
+def write_user_stats(user_ids, totals):
+    """Replace the UserStats rows of some users with totals from user_totals()"""
+    gone = [user_id for user_id in user_ids if user_id not in totals]
+    if gone:
+        UserStats.query.filter(UserStats.user_id.in_(gone)).delete(synchronize_session=False)
+    for user_id, values in totals.items():
+        stmt = insert(UserStats).values(user_id=user_id, **values)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id'], set_=values))
+
+
+def _refresh_user_stats(quiz_ids):
+    # The best result and last attempt can't be subtracted, so recompute the
+    # affected users without the scores that are about to be deleted
+    scores = archive.all_scores('quiz_id', 'user_id')
+    user_ids = db.session.execute(
+        select(scores.c.user_id).where(scores.c.quiz_id.in_(quiz_ids)).distinct()).scalars().all()
+    if user_ids:
+        write_user_stats(user_ids, user_totals(user_ids, exclude_quiz_ids=quiz_ids))
+
+
+def _stats_differ(stored, values):
+    return any(
+        round(stored[name], 6) != round(value, 6) if isinstance(value, float) else stored[name] != value
+        for name, value in values.items()
+    )
+
+
+def repair_user_stats(user_ids=None):
+    """
+    Compare UserStats with the score tables and fix any row that has drifted.
+    The caller commits.
+
+    Args:
+        user_ids: Only check these users, or None for everyone
+
+    Returns:
+        Number of users whose stats were corrected
+    """
+    totals = user_totals(user_ids)
+    columns = [UserStats.user_id, UserStats.attempts, UserStats.graded_attempts, UserStats.score_sum,
+               UserStats.question_sum, UserStats.percentage_sum, UserStats.best_percentage,
+               UserStats.last_attempt_at]
+    stmt = select(*columns)
+    if user_ids is not None:
+        stmt = stmt.where(UserStats.user_id.in_(user_ids))
+    rows = {row.user_id: row._asdict() for row in db.session.execute(stmt)}
+
+    wrong = {user_id for user_id, row in rows.items()
+             if user_id not in totals or _stats_differ(row, totals[user_id])}
+    wrong.update(user_id for user_id in totals if user_id not in rows)
+    if wrong:
+        write_user_stats(wrong, {user_id: totals[user_id] for user_id in wrong if user_id in totals})
+    return len(wrong)
+
+
+_PERCENTAGE = "CASE WHEN score.total_questions > 0 THEN score.score * 100.0 / score.total_questions ELSE 0 END"
+_PERCENTAGE_SUM = f"sum({_PERCENTAGE})"
+# Hot and archived scores together, so archival never changes the rollups
+_SCORE_SOURCE = ("FROM (SELECT quiz_id, user_id, score, total_questions, timestamp FROM score "
+                 "UNION ALL SELECT quiz_id, user_id, score, total_questions, timestamp FROM score_archive) AS score "
+                 "JOIN quiz ON quiz.id = score.quiz_id "
+                 "JOIN chapter ON chapter.id = quiz.chapter_id")
+
+
+def rebuild_rollups(connection):
+    """
+    Recompute the rollup tables from the score and score_archive tables.
+
+    Args:
+        connection: SQLAlchemy connection to the database, inside a transaction
+
+    Returns:
+        Tuple of (user_subject_days, subject_days, user_chapters) row counts; user_stats
+        gets one row per user who has scores
+    """
+    connection.execute(text("DELETE FROM user_subject_daily"))
+    connection.execute(text("DELETE FROM subject_daily"))
+    connection.execute(text("DELETE FROM user_chapter_stats"))
+    connection.execute(text(
+        "INSERT INTO user_subject_daily (user_id, subject_id, day, attempts, score_sum, question_sum, percentage_sum) "
+        "SELECT score.user_id, chapter.subject_id, date(score.timestamp), count(*), sum(score.score), "
+        f"sum(score.total_questions), {_PERCENTAGE_SUM} {_SCORE_SOURCE} "
+        "GROUP BY score.user_id, chapter.subject_id, date(score.timestamp)"
+    ))
+    connection.execute(text(
+        "INSERT INTO subject_daily (subject_id, day, attempts, score_sum, question_sum, percentage_sum) "
+        "SELECT chapter.subject_id, date(score.timestamp), count(*), sum(score.score), "
+        f"sum(score.total_questions), {_PERCENTAGE_SUM} {_SCORE_SOURCE} "
+        "GROUP BY chapter.subject_id, date(score.timestamp)"
+    ))
+    connection.execute(text(
+        "INSERT INTO user_chapter_stats (user_id, chapter_id, attempts, score_sum, question_sum, percentage_sum, "
+        "last_attempt_at) "
+        "SELECT score.user_id, chapter.id, count(*), sum(score.score), "
+        f"sum(score.total_questions), {_PERCENTAGE_SUM}, max(score.timestamp) {_SCORE_SOURCE} "
+        "GROUP BY score.user_id, chapter.id"
+    ))
+    rebuild_user_stats(connection)
+    return (connection.execute(text("SELECT count(*) FROM user_subject_daily")).scalar(),
+            connection.execute(text("SELECT count(*) FROM subject_daily")).scalar(),
+            connection.execute(text("SELECT count(*) FROM user_chapter_stats")).scalar())
+
+
+def rebuild_user_stats(connection):
+    """Recompute the user_stats table from the score and score_archive tables"""
+    connection.execute(text("DELETE FROM user_stats"))
+    connection.execute(text(
+        "INSERT INTO user_stats (user_id, attempts, graded_attempts, score_sum, question_sum, percentage_sum, "
+        "best_percentage, last_attempt_at) "
+        "SELECT score.user_id, count(*), sum(CASE WHEN score.total_questions > 0 THEN 1 ELSE 0 END), "
+        f"sum(score.score), sum(score.total_questions), {_PERCENTAGE_SUM}, max({_PERCENTAGE}), "
+        f"max(score.timestamp) {_SCORE_SOURCE} "
+        "GROUP BY score.user_id"
+    ))
+
+
+# Fill the rollups on db.create_all() when the tables are new but scores already
+# exist, e.g. the first start after upgrading an existing database
+@event.listens_for(db.metadata, 'after_create')
+def _backfill_rollups_after_create(target, connection, **kw):
+    has_rollups = (connection.execute(text("SELECT 1 FROM subject_daily LIMIT 1")).first()
+                   and connection.execute(text("SELECT 1 FROM user_chapter_stats LIMIT 1")).first()
+                   and connection.execute(text("SELECT 1 FROM user_stats LIMIT 1")).first())
+    has_scores = connection.execute(text("SELECT 1 FROM score LIMIT 1")).first()
+    if has_scores and not has_rollups:
+        rebuild_rollups(connection)
+    elif 'user_stats.graded_attempts' in schema.columns_added(connection):
+        # Stats kept before graded attempts were counted
+        rebuild_user_stats(connection)
+
+
+def _monthly(model, *conditions):
+    """Attempts and mean percentage per month from a rollup table, oldest first"""
+    month = func.strftime('%Y-%m', model.day)
+    rows = db.session.execute(
+        select(month, func.sum(model.attempts), func.sum(model.percentage_sum))
+        .where(*conditions)
+        .group_by(month)
+        .order_by(month)
+    ).all()
+
+    labels, counts, means = [], [], []
+    for month_key, attempts, percentage_sum in rows:
+        year, month_number = (int(part) for part in month_key.split('-'))
+        labels.append(date(year, month_number, 1).strftime('%b %Y'))
+        counts.append(attempts)
+        means.append(round(percentage_sum / attempts, 1) if attempts else 0)
+    return {'labels': labels, 'counts': counts, 'means': means}
+
+
+def _by_subject(model, *conditions):
+    """Attempts and mean percentage per subject from a rollup table, by subject name"""
+    rows = db.session.execute(
+        select(Subject.name, func.sum(model.attempts), func.sum(model.percentage_sum))
+        .join(Subject, Subject.id == model.subject_id)
+        .where(*conditions)
+        .group_by(Subject.id, Subject.name)
+        .order_by(Subject.name)
+    ).all()
+    return [{'subject': name, 'attempts': attempts,
+             'average': round(percentage_sum / attempts, 1) if attempts else 0}
+            for name, attempts, percentage_sum in rows]
+
+
+def user_monthly_attempts(user_id):
+    """Monthly attempts and mean percentage for one user"""
+    return _monthly(UserSubjectDaily, UserSubjectDaily.user_id == user_id)
+
+
+def user_subject_averages(user_id):
+    """Attempts and mean percentage per subject for one user, from their per-chapter totals"""
+    rows = db.session.execute(
+        select(Subject.name, func.sum(UserChapterStats.attempts), func.sum(UserChapterStats.percentage_sum))
+        .join(Chapter, Chapter.id == UserChapterStats.chapter_id)
+        .join(Subject, Subject.id == Chapter.subject_id)
+        .where(UserChapterStats.user_id == user_id)
+        .group_by(Subject.id, Subject.name)
+        .order_by(Subject.name)
+    ).all()
+    return [{'subject': name, 'attempts': attempts,
+             'average': round(percentage_sum / attempts, 1) if attempts else 0}
+            for name, attempts, percentage_sum in rows]
+
+
+def user_stats(user_id):
+    """The user's UserStats row, or an empty one if they haven't taken a quiz yet"""
+    return db.session.get(UserStats, user_id) or UserStats(user_id=user_id, attempts=0, graded_attempts=0,
+                                                            score_sum=0, question_sum=0, percentage_sum=0.0,
+                                                            best_percentage=0.0)
+
+
+def monthly_attempts():
+    """Monthly attempts and mean percentage across all users"""
+    return _monthly(SubjectDaily)
+
+
+def subject_attempts():
+    """Attempts and mean percentage per subject across all users"""
+    return _by_subject(SubjectDaily)
@@ -2,14 +2,37 @@
 # This file contains all the routes (URL endpoints) for the application
 # Each route function handles a specific URL and HTTP method
 
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, Response, \
+    stream_with_context, send_from_directory
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import json
+import os
 import traceback
+import uuid
 
 # Import database and models
 from extensions import db
-from models import User, Subject, Chapter, Quiz, Question, Score
+from models import User, Subject, Chapter, Quiz, Question, Score, QuizAttempt, Job
+import search
+import question_pool
+import exports
+import analytics
+import rollups
+import jobs
+import tasks
+import catalog
+import coherence
+import archive
+import autosave
+import backup
+import provisioning
+import prewarm
+import schedule
+import recommendations
+import listings
+from db_routing import read_only
+from ratelimit import limited
 
 def register_routes(app):
     """
@@ -38,6 +61,7 @@ def register_routes(app):
 
     # Authentication routes
     @app.route('/login', methods=['GET', 'POST'])
+    @limited
     def login():
         """Handle user login"""
         if request.method == 'POST':
@@ -141,15 +165,25 @@ def register_routes(app):
             user_id = session['user_id']
             user = User.query.get_or_404(user_id)
             
-            # Get all available quizzes
-            quizzes = Quiz.query.all()
+            # Only open and upcoming quizzes, from the in-memory catalog
+            now = datetime.now()
+            quizzes_by_id = catalog.get_catalog().quizzes_by_id
+            quizzes = [quizzes_by_id[quiz_id] for quiz_id in schedule.current_quiz_ids(now)
+                       if quiz_id in quizzes_by_id]
             
-            # Get user's attempted quizzes
-            attempted_quizzes = Score.query.filter_by(user_id=user_id).all()
-            attempted_quiz_ids = [score.quiz_id for score in attempted_quizzes]
+            # Get which of these quizzes the user has attempted
+            attempted_quiz_ids = archive.attempted_quiz_ids(user_id, [quiz.id for quiz in quizzes])
+            
+            # Weak, long unpractised areas first; cached until the user's next submission
+            suggestions = recommendations.get_recommendations(user_id)
+            
+            # Running totals and the last few scores, however long the user's history
+            stats = rollups.user_stats(user_id)
+            recent_scores = listings.score_rows(Score, user_id, 0, 3)
             
             return render_template('user/dashboard.html', user=user, quizzes=quizzes, 
-                                attempted_quiz_ids=attempted_quiz_ids)
+                                attempted_quiz_ids=attempted_quiz_ids, now=now,
+                                recommendations=suggestions, stats=stats, recent_scores=recent_scores)
         except Exception as e:
             app.logger.error(f"Error in user_dashboard: {str(e)}")
             app.logger.error(traceback.format_exc())
@@ -157,6 +191,7 @@ def register_routes(app):
             return redirect(url_for('index'))
 
     @app.route('/user/quiz/<int:quiz_id>')
+    @limited
     def start_quiz(quiz_id):
         """Display quiz questions for the user to attempt"""
         # Check if user is logged in
@@ -166,22 +201,39 @@ def register_routes(app):
         try:
             user_id = session['user_id']
             
-            # Check if user has already attempted this quiz
-            existing_attempt = Score.query.filter_by(user_id=user_id, quiz_id=quiz_id).first()
-            if existing_attempt:
+            # Check if user has already attempted this quiz (archived scores count too)
+            if archive.has_attempted(user_id, quiz_id):
                 flash('You have already attempted this quiz.', 'warning')
                 return redirect(url_for('user_dashboard'))
             
-            # Get quiz and its questions
+            # Quizzes can only be started while their window is open
             quiz = Quiz.query.get_or_404(quiz_id)
-            questions = Question.query.filter_by(quiz_id=quiz_id).all()
+            status = schedule.window_status(quiz)
+            if status == 'upcoming':
+                flash(f"This quiz opens on {quiz.date.strftime('%d %b, %Y at %H:%M')}.", 'warning')
+                return redirect(url_for('user_dashboard'))
+            if status == 'closed':
+                flash('This quiz has closed.', 'warning')
+                return redirect(url_for('user_dashboard'))
+            
+            # Draw (or reuse) this user's set of questions
+            attempt = question_pool.start_attempt(quiz, user_id)
             
             # If no questions, redirect with a message
-            if not questions:
+            if not attempt:
                 flash('This quiz does not have any questions yet.', 'warning')
                 return redirect(url_for('user_dashboard'))
             
-            return render_template('user/quiz.html', quiz=quiz, questions=questions)
+            # The page only carries this attempt's layout; the browser fetches the
+            # question text from quiz_questions and renders it. The timer counts
+            # down to the attempt's deadline, so reloading the page doesn't reset it,
+            # and the answers saved so far are selected again
+            autosave.flush([attempt.id])
+            layout = question_pool.attempt_layout(attempt)
+            layout['answers'] = autosave.stored_answers(attempt)
+            return render_template('user/quiz.html', quiz=quiz, layout=layout,
+                                   seconds_left=schedule.seconds_left(quiz, attempt),
+                                   autosave_interval=app.config['AUTOSAVE_INTERVAL_SECONDS'])
         except Exception as e:
             app.logger.error(f"Error in start_quiz: {str(e)}")
             app.logger.error(traceback.format_exc())
@@ -189,59 +241,98 @@ def register_routes(app):
             return redirect(url_for('user_dashboard'))
 
     @app.route('/user/submit_quiz/<int:quiz_id>', methods=['POST'])
+    @limited
     def submit_quiz(quiz_id):
         """Process quiz submission and calculate score"""
+        def finish(endpoint):
+            # The quiz page posts JSON and follows the redirect itself
+            target = url_for(endpoint)
+            return jsonify(redirect=target) if request.is_json else redirect(target)
+        
         # Check if user is logged in
         if 'user_id' not in session:
-            return redirect(url_for('login'))
+            return finish('login')
         
         try:
             user_id = session['user_id']
             
-            # Check if user has already attempted this quiz
-            existing_attempt = Score.query.filter_by(user_id=user_id, quiz_id=quiz_id).first()
-            if existing_attempt:
+            # Check if user has already attempted this quiz (archived scores count too)
+            if archive.has_attempted(user_id, quiz_id):
                 flash('You have already attempted this quiz.', 'warning')
-                return redirect(url_for('user_dashboard'))
+                return finish('user_dashboard')
             
-            # Get quiz and its questions
+            # Get the questions that were drawn for this user when the quiz was opened
             quiz = Quiz.query.get_or_404(quiz_id)
-            questions = Question.query.filter_by(quiz_id=quiz_id).all()
+            attempt = question_pool.get_open_attempt(user_id, quiz_id)
             
-            # If no questions, redirect with a message
-            if not questions:
-                flash('This quiz does not have any questions.', 'warning')
-                return redirect(url_for('user_dashboard'))
+            # If the quiz was never opened, there is nothing to grade
+            if not attempt:
+                flash('Please start the quiz before submitting it.', 'warning')
+                return finish('user_dashboard')
             
-            # Calculate score
-            score = 0
-            for question in questions:
-                selected_option = request.form.get(f'question_{question.id}')
-                if selected_option and int(selected_option) == question.correct_option:
-                    score += 1
+            # The quiz page sends {"answers": [option, ...]} in the attempt's question order
+            answers = request.form
+            if request.is_json:
+                answers = (request.get_json(silent=True) or {}).get('answers')
+                if not isinstance(answers, list):
+                    raise ValueError('Expected a list of answers')
+            
+            # Write what is still buffered, then claim the attempt: if another
+            # submission got there first, it has recorded the score
+            autosave.flush([attempt.id])
+            submitted_at = datetime.now()
+            if not question_pool.claim_attempt(attempt, submitted_at):
+                db.session.rollback()
+                flash('You have already attempted this quiz.', 'warning')
+                return finish('user_dashboard')
+            
+            # Grade the stored answers: those saved while the quiz was being taken,
+            # updated with the final ones unless they were sent after the deadline
+            stored = autosave.stored_answers(attempt)
+            late = schedule.is_late(quiz, attempt)
+            if not late:
+                stored = autosave.merge(stored, autosave.submitted_answers(attempt, answers))
+            attempt.answers = json.dumps(stored)
+            score, total_questions = question_pool.grade_attempt(attempt, autosave.answer_list(attempt, stored))
             
             # Save score
             new_score = Score(
                 quiz_id=quiz_id,
                 user_id=user_id,
                 score=score,
-                total_questions=len(questions),
-                timestamp=datetime.now()
+                total_questions=total_questions,
+                timestamp=submitted_at
             )
+            attempt.submitted_at = submitted_at
             
             db.session.add(new_score)
+            # Update the daily rollups in the same transaction as the score
+            rollups.record_score(new_score, quiz.chapter)
+            # Every worker drops its cached analytics for the quiz and the user's recommendations
+            coherence.bump(coherence.SCORES, quiz_id)
+            coherence.bump(coherence.USER, user_id)
             db.session.commit()
             
-            flash(f'Quiz submitted! Your score: {score}/{len(questions)}', 'success')
-            return redirect(url_for('user_scores'))
+            if late:
+                flash(f'Time ran out before the quiz was submitted, so only the answers saved in time count. '
+                      f'Your score: {score}/{total_questions}', 'warning')
+            else:
+                flash(f'Quiz submitted! Your score: {score}/{total_questions}', 'success')
+            return finish('user_scores')
+        except ValueError:
+            # Reopens the attempt if it was claimed
+            db.session.rollback()
+            flash('The quiz answers could not be read. Please try again.', 'danger')
+            return finish('user_dashboard')
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error in submit_quiz: {str(e)}")
             app.logger.error(traceback.format_exc())
             flash('An error occurred while submitting the quiz. Please try again.', 'danger')
-            return redirect(url_for('user_dashboard'))
+            return finish('user_dashboard')
 
     @app.route('/user/scores')
+    @read_only
     def user_scores():
         """Display user's quiz scores"""
         # Check if user is logged in and not an admin
@@ -250,9 +341,13 @@ def register_routes(app):
         
         try:
             user_id = session['user_id']
-            scores = Score.query.filter_by(user_id=user_id).order_by(Score.timestamp.desc()).all()
+            page = max(request.args.get('page', 1, type=int), 1)
             
-            return render_template('user/scores.html', scores=scores)
+            # Recent scores first; older pages continue into the archive
+            scores, total = archive.user_score_page(user_id, page)
+            pages = (total + archive.PER_PAGE - 1) // archive.PER_PAGE
+            
+            return render_template('user/scores.html', scores=scores, page=page, pages=pages, total=total)
         except Exception as e:
             app.logger.error(f"Error in user_scores: {str(e)}")
             app.logger.error(traceback.format_exc())
@@ -260,6 +355,7 @@ def register_routes(app):
             return redirect(url_for('user_dashboard'))
 
     @app.route('/user/summary')
+    @read_only
     def user_summary():
         """Display summary charts of user's performance"""
         # Check if user is logged in and not an admin
@@ -268,56 +364,20 @@ def register_routes(app):
         
         try:
             user_id = session['user_id']
-            scores = Score.query.filter_by(user_id=user_id).all()
-            
-            # Initialize empty lists for template
-            subject_labels = []
-            subject_averages = []
-            month_labels = []
-            month_values = []
-            
-            if scores:
-                # Prepare data for subject-wise performance chart
-                subject_data = {}
-                for score in scores:
-                    quiz = Quiz.query.get(score.quiz_id)
-                    if not quiz:
-                        continue
-                        
-                    chapter = Chapter.query.get(quiz.chapter_id)
-                    if not chapter:
-                        continue
-                        
-                    subject = Subject.query.get(chapter.subject_id)
-                    if not subject:
-                        continue
-                    
-                    if subject.name not in subject_data:
-                        subject_data[subject.name] = {'total': 0, 'count': 0}
-                    
-                    if score.total_questions > 0:  # Prevent division by zero
-                        subject_data[subject.name]['total'] += (score.score / score.total_questions) * 100
-                    subject_data[subject.name]['count'] += 1
-                
-                # Calculate averages
-                for subject_name, data in subject_data.items():
-                    average = data['total'] / data['count'] if data['count'] > 0 else 0
-                    subject_labels.append(subject_name)
-                    subject_averages.append(round(average, 1))
-                
-                # Prepare data for monthly attempts chart
-                month_data = {}
-                for score in scores:
-                    month = score.timestamp.strftime('%b %Y')
-                    if month not in month_data:
-                        month_data[month] = 0
-                    month_data[month] += 1
-                
-                month_labels = list(month_data.keys())
-                month_values = list(month_data.values())
+            # Totals come from UserStats, subject averages from the per-chapter
+            # totals and the monthly chart from the per-day rollups, never every score
+            stats = rollups.user_stats(user_id)
+            subject_rows = rollups.user_subject_averages(user_id)
+            monthly = rollups.user_monthly_attempts(user_id)
+            
+            subject_labels = [row['subject'] for row in subject_rows]
+            subject_averages = [row['average'] for row in subject_rows]
+            month_labels = monthly['labels']
+            month_values = monthly['counts']
             
             # Pass the data to the template
             return render_template('user/summary.html', 
+                                stats=stats,
                                 subject_labels=subject_labels,
                                 subject_averages=subject_averages,
                                 month_labels=month_labels,
@@ -337,7 +397,7 @@ def register_routes(app):
             return redirect(url_for('login'))
         
         try:
-            subjects = Subject.query.all()
+            subjects = catalog.get_catalog().subjects
             return render_template('admin/dashboard.html', subjects=subjects)
         except Exception as e:
             app.logger.error(f"Error in admin_dashboard: {str(e)}")
@@ -353,14 +413,14 @@ def register_routes(app):
             return redirect(url_for('login'))
         
         try:
-            subjects = Subject.query.all()
+            subjects = catalog.get_catalog().subjects
             
             if request.method == 'POST':
                 # Get form data
                 chapter_id = request.form.get('chapter_id')
-                date = request.form.get('date')
-                duration = request.form.get('duration')
                 remarks = request.form.get('remarks')
+                pool_size = request.form.get('pool_size', type=int)
+                shuffle_options = request.form.get('shuffle_options') == 'on'
                 
                 # Validate chapter exists
                 chapter = Chapter.query.get_or_404(chapter_id)
@@ -368,17 +428,23 @@ def register_routes(app):
                 # Create new quiz
                 new_quiz = Quiz(
                     chapter_id=chapter_id,
-                    date=datetime.strptime(date, '%Y-%m-%d'),
-                    duration=duration,
-                    remarks=remarks
+                    remarks=remarks,
+                    pool_size=pool_size or None,
+                    shuffle_options=shuffle_options
                 )
+                schedule.set_schedule(new_quiz, request.form.get('date'), request.form.get('closes_at'),
+                                      request.form.get('duration'))
                 db.session.add(new_quiz)
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 
                 flash('Quiz created successfully! Now add questions to your quiz.', 'success')
                 return redirect(url_for('admin_questions', quiz_id=new_quiz.id))
             
             return render_template('admin/create_quiz.html', subjects=subjects)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('create_quiz'))
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error in create_quiz: {str(e)}")
@@ -387,6 +453,7 @@ def register_routes(app):
             return redirect(url_for('admin_dashboard'))
 
     @app.route('/admin/all-quizzes')
+    @read_only
     def all_quizzes():
         """Display all quizzes"""
         # Check if user is logged in and is an admin
@@ -394,8 +461,10 @@ def register_routes(app):
             return redirect(url_for('login'))
         
         try:
-            quizzes = Quiz.query.all()
-            return render_template('admin/all_quizzes.html', quizzes=quizzes)
+            page = max(request.args.get('page', 1, type=int), 1)
+            quizzes, total = listings.quiz_page(page)
+            pages = (total + listings.PER_PAGE - 1) // listings.PER_PAGE
+            return render_template('admin/all_quizzes.html', quizzes=quizzes, page=page, pages=pages, total=total)
         except Exception as e:
             app.logger.error(f"Error in all_quizzes: {str(e)}")
             app.logger.error(traceback.format_exc())
@@ -418,12 +487,13 @@ def register_routes(app):
                 # Create new subject
                 new_subject = Subject(name=name, description=description)
                 db.session.add(new_subject)
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 
                 flash('Subject added successfully', 'success')
                 return redirect(url_for('admin_subjects'))
             
-            subjects = Subject.query.all()
+            subjects = catalog.get_catalog().subjects
             return render_template('admin/subjects.html', subjects=subjects)
         except Exception as e:
             db.session.rollback()
@@ -447,6 +517,7 @@ def register_routes(app):
                 subject.name = request.form.get('name')
                 subject.description = request.form.get('description')
                 
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 flash('Subject updated successfully', 'success')
                 return redirect(url_for('admin_subjects'))
@@ -469,17 +540,23 @@ def register_routes(app):
         try:
             subject = Subject.query.get_or_404(subject_id)
             
-            # Delete associated chapters, quizzes, questions, and scores
+            # Delete associated chapters, quizzes, questions, scores and rollups
+            rollups.remove_subject(subject_id)
             chapters = Chapter.query.filter_by(subject_id=subject_id).all()
             for chapter in chapters:
                 quizzes = Quiz.query.filter_by(chapter_id=chapter.id).all()
+                archive.delete_quiz_scores([quiz.id for quiz in quizzes])
                 for quiz in quizzes:
                     Question.query.filter_by(quiz_id=quiz.id).delete()
                     Score.query.filter_by(quiz_id=quiz.id).delete()
+                    QuizAttempt.query.filter_by(quiz_id=quiz.id).delete()
+                    coherence.bump(coherence.QUIZ, quiz.id)
+                    coherence.bump(coherence.SCORES, quiz.id)
                 Quiz.query.filter_by(chapter_id=chapter.id).delete()
             Chapter.query.filter_by(subject_id=subject_id).delete()
             
             db.session.delete(subject)
+            coherence.bump(coherence.CATALOG)
             db.session.commit()
             
             flash('Subject deleted successfully', 'success')
@@ -509,12 +586,13 @@ def register_routes(app):
                 # Create new chapter
                 new_chapter = Chapter(name=name, description=description, subject_id=subject_id)
                 db.session.add(new_chapter)
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 
                 flash('Chapter added successfully', 'success')
                 return redirect(url_for('admin_chapters', subject_id=subject_id))
             
-            chapters = Chapter.query.filter_by(subject_id=subject_id).all()
+            chapters = listings.subject_chapters(subject_id)
             return render_template('admin/chapters.html', subject=subject, chapters=chapters)
         except Exception as e:
             db.session.rollback()
@@ -538,6 +616,7 @@ def register_routes(app):
                 chapter.name = request.form.get('name')
                 chapter.description = request.form.get('description')
                 
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 flash('Chapter updated successfully', 'success')
                 return redirect(url_for('admin_chapters', subject_id=chapter.subject_id))
@@ -563,12 +642,19 @@ def register_routes(app):
             
             # Delete associated quizzes, questions, and scores
             quizzes = Quiz.query.filter_by(chapter_id=chapter_id).all()
+            quiz_ids = [quiz.id for quiz in quizzes]
+            rollups.remove_scores(quiz_ids)
+            archive.delete_quiz_scores(quiz_ids)
             for quiz in quizzes:
                 Question.query.filter_by(quiz_id=quiz.id).delete()
                 Score.query.filter_by(quiz_id=quiz.id).delete()
+                QuizAttempt.query.filter_by(quiz_id=quiz.id).delete()
+                coherence.bump(coherence.QUIZ, quiz.id)
+                coherence.bump(coherence.SCORES, quiz.id)
             Quiz.query.filter_by(chapter_id=chapter_id).delete()
             
             db.session.delete(chapter)
+            coherence.bump(coherence.CATALOG)
             db.session.commit()
             
             flash('Chapter deleted successfully', 'success')
@@ -592,25 +678,31 @@ def register_routes(app):
             
             if request.method == 'POST':
                 # Get form data
-                date = request.form.get('date')
-                duration = request.form.get('duration')
                 remarks = request.form.get('remarks')
+                pool_size = request.form.get('pool_size', type=int)
+                shuffle_options = request.form.get('shuffle_options') == 'on'
                 
                 # Create new quiz
                 new_quiz = Quiz(
                     chapter_id=chapter_id,
-                    date=datetime.strptime(date, '%Y-%m-%d'),
-                    duration=duration,
-                    remarks=remarks
+                    remarks=remarks,
+                    pool_size=pool_size or None,
+                    shuffle_options=shuffle_options
                 )
+                schedule.set_schedule(new_quiz, request.form.get('date'), request.form.get('closes_at'),
+                                      request.form.get('duration'))
                 db.session.add(new_quiz)
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 
                 flash('Quiz added successfully', 'success')
                 return redirect(url_for('admin_quizzes', chapter_id=chapter_id))
             
-            quizzes = Quiz.query.filter_by(chapter_id=chapter_id).all()
+            quizzes = listings.chapter_quizzes(chapter_id)
             return render_template('admin/quizzes.html', chapter=chapter, quizzes=quizzes)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin_quizzes', chapter_id=chapter_id))
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error in admin_quizzes: {str(e)}")
@@ -630,15 +722,22 @@ def register_routes(app):
             
             if request.method == 'POST':
                 # Update quiz data
-                quiz.date = datetime.strptime(request.form.get('date'), '%Y-%m-%d')
-                quiz.duration = request.form.get('duration')
+                schedule.set_schedule(quiz, request.form.get('date'), request.form.get('closes_at'),
+                                      request.form.get('duration'))
                 quiz.remarks = request.form.get('remarks')
+                quiz.pool_size = request.form.get('pool_size', type=int) or None
+                quiz.shuffle_options = request.form.get('shuffle_options') == 'on'
                 
+                coherence.bump(coherence.CATALOG)
                 db.session.commit()
                 flash('Quiz updated successfully', 'success')
                 return redirect(url_for('admin_quizzes', chapter_id=quiz.chapter_id))
             
             return render_template('admin/edit_quiz.html', quiz=quiz)
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('edit_quiz', quiz_id=quiz_id))
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"Error in edit_quiz: {str(e)}")
@@ -657,11 +756,17 @@ def register_routes(app):
             quiz = Quiz.query.get_or_404(quiz_id)
             chapter_id = quiz.chapter_id
             
-            # Delete associated questions and scores
+            # Delete associated questions, scores and attempts
+            rollups.remove_scores([quiz_id])
+            archive.delete_quiz_scores([quiz_id])
             Question.query.filter_by(quiz_id=quiz_id).delete()
             Score.query.filter_by(quiz_id=quiz_id).delete()
+            QuizAttempt.query.filter_by(quiz_id=quiz_id).delete()
+            coherence.bump(coherence.QUIZ, quiz_id)
+            coherence.bump(coherence.SCORES, quiz_id)
             
             db.session.delete(quiz)
+            coherence.bump(coherence.CATALOG)
             db.session.commit()
             
             flash('Quiz deleted successfully', 'success')
@@ -703,12 +808,14 @@ def register_routes(app):
                     correct_option=correct_option
                 )
                 db.session.add(new_question)
+                coherence.bump(coherence.CATALOG)
+                coherence.bump(coherence.QUIZ, quiz_id)
                 db.session.commit()
                 
                 flash('Question added successfully', 'success')
                 return redirect(url_for('admin_questions', quiz_id=quiz_id))
             
-            questions = Question.query.filter_by(quiz_id=quiz_id).all()
+            questions = listings.quiz_questions(quiz_id)
             return render_template('admin/questions.html', quiz=quiz, questions=questions)
         except Exception as e:
             db.session.rollback()
@@ -736,6 +843,7 @@ def register_routes(app):
                 question.option4 = request.form.get('option4')
                 question.correct_option = int(request.form.get('correct_option'))
                 
+                coherence.bump(coherence.QUIZ, question.quiz_id)
                 db.session.commit()
                 flash('Question updated successfully', 'success')
                 return redirect(url_for('admin_questions', quiz_id=question.quiz_id))
@@ -759,7 +867,11 @@ def register_routes(app):
             question = Question.query.get_or_404(question_id)
             quiz_id = question.quiz_id
             
+            # Students who drew the question aren't graded on it
+            question_pool.remove_question(question_id, quiz_id)
             db.session.delete(question)
+            coherence.bump(coherence.CATALOG)
+            coherence.bump(coherence.QUIZ, quiz_id)
             db.session.commit()
             
             flash('Question deleted successfully', 'success')
@@ -772,6 +884,7 @@ def register_routes(app):
             return redirect(url_for('admin_dashboard'))
 
     @app.route('/admin/summary')
+    @read_only
     def admin_summary():
         """Display summary charts for the admin"""
         # Check if user is logged in and is an admin
@@ -779,34 +892,254 @@ def register_routes(app):
             return redirect(url_for('login'))
         
         try:
-            # Get all subjects and their scores
-            subjects = Subject.query.all()
+            # Score distributions are computed from cached per-quiz arrays
+            summary = analytics.admin_summary()
+            # Attempt counts and the monthly trend come from the daily rollups
+            subject_attempts = {row['subject']: row['attempts'] for row in rollups.subject_attempts()}
             subject_data = {}
             
-            for subject in subjects:
-                subject_data[subject.name] = {
-                    'top_score': 0,
-                    'attempts': 0
+            for subject_name, stats in summary['subjects'].items():
+                subject_data[subject_name] = {
+                    'top_score': stats['max'],
+                    'attempts': subject_attempts.get(subject_name, 0),
+                    'mean': stats['mean'],
+                    'median': stats['median'],
+                    'pass_rate': stats['pass_rate']
                 }
-                
-                for chapter in subject.chapters:
-                    for quiz in chapter.quizzes:
-                        scores = Score.query.filter_by(quiz_id=quiz.id).all()
-                        subject_data[subject.name]['attempts'] += len(scores)
-                        
-                        for score in scores:
-                            if score.total_questions > 0:  # Prevent division by zero
-                                percentage = (score.score / score.total_questions) * 100
-                                if percentage > subject_data[subject.name]['top_score']:
-                                    subject_data[subject.name]['top_score'] = percentage
-        
-            return render_template('admin/summary.html', subject_data=subject_data)
+            
+            return render_template('admin/summary.html', subject_data=subject_data,
+                                overall=summary['overall'], quiz_stats=summary['quizzes'],
+                                trend=rollups.monthly_attempts(), pass_mark=analytics.PASS_MARK)
         except Exception as e:
             app.logger.error(f"Error in admin_summary: {str(e)}")
             app.logger.error(traceback.format_exc())
             flash('An error occurred while loading the summary. Please try again.', 'danger')
             return redirect(url_for('admin_dashboard'))
 
+    @app.route('/admin/search')
+    @read_only
+    def admin_search():
+        """Search subjects, chapters and questions"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            query = request.args.get('q', '').strip()
+            page = request.args.get('page', 1, type=int)
+            
+            results, total = search.search(query, page=page)
+            pages = (total + search.PER_PAGE - 1) // search.PER_PAGE
+            
+            return render_template('admin/search.html', query=query, results=results,
+                                total=total, page=page, pages=pages)
+        except Exception as e:
+            app.logger.error(f"Error in admin_search: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while searching. Please try again.', 'danger')
+            return redirect(url_for('admin_dashboard'))
+
+    @app.route('/admin/export/scores')
+    @read_only
+    def export_scores():
+        """Stream quiz results as a CSV or XLSX download"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            fmt = request.args.get('format', 'csv')
+            if fmt not in exports.FORMATS:
+                flash('Unsupported export format.', 'danger')
+                return redirect(url_for('admin_exports'))
+            
+            filters = exports.parse_filters(request.args)
+            
+            # The generator reads and encodes one chunk of rows at a time
+            response = Response(stream_with_context(exports.generate_export(fmt, filters)),
+                                mimetype=exports.FORMATS[fmt])
+            response.headers['Content-Disposition'] = f'attachment; filename={exports.export_filename(fmt)}'
+            return response
+        except ValueError:
+            flash('Invalid export filters. Dates must be in YYYY-MM-DD format.', 'danger')
+            return redirect(url_for('admin_exports'))
+        except Exception as e:
+            app.logger.error(f"Error in export_scores: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while exporting scores. Please try again.', 'danger')
+            return redirect(url_for('admin_exports'))
+
+    @app.route('/admin/exports', methods=['GET', 'POST'])
+    def admin_exports():
+        """Start background exports and list the finished export files"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            if request.method == 'POST':
+                fmt = request.form.get('format', 'csv')
+                if fmt not in exports.FORMATS:
+                    flash('Unsupported export format.', 'danger')
+                    return redirect(url_for('admin_exports'))
+                
+                # Validate the filters now; the job parses them again when it runs
+                exports.parse_filters(request.form)
+                job = jobs.enqueue('export_scores', {
+                    'format': fmt,
+                    'start': request.form.get('start'),
+                    'end': request.form.get('end'),
+                    'subject_id': request.form.get('subject_id')
+                })
+                
+                flash(f'Export job #{job.id} queued. The file will be listed here when it is ready.', 'success')
+                return redirect(url_for('admin_exports'))
+            
+            subjects = Subject.query.all()
+            files = exports.list_exports(exports.export_folder())
+            return render_template('admin/exports.html', subjects=subjects, files=files)
+        except ValueError:
+            flash('Invalid export filters. Dates must be in YYYY-MM-DD format.', 'danger')
+            return redirect(url_for('admin_exports'))
+        except Exception as e:
+            app.logger.error(f"Error in admin_exports: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while managing exports. Please try again.', 'danger')
+            return redirect(url_for('admin_dashboard'))
+
+    @app.route('/admin/exports/<path:filename>')
+    def download_export(filename):
+        """Download a finished background export"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        return send_from_directory(exports.export_folder(), filename, as_attachment=True)
+
+    @app.route('/admin/jobs', methods=['GET', 'POST'])
+    def admin_jobs():
+        """List background jobs and enqueue maintenance tasks"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            if request.method == 'POST':
+                kind = request.form.get('kind')
+                if kind not in tasks.MAINTENANCE_TASKS:
+                    flash('Unknown task.', 'danger')
+                    return redirect(url_for('admin_jobs'))
+                
+                job = jobs.enqueue(kind)
+                flash(f'Job #{job.id} queued: {tasks.MAINTENANCE_TASKS[kind]}.', 'success')
+                return redirect(url_for('admin_jobs'))
+            
+            recent_jobs = Job.query.order_by(Job.id.desc()).limit(50).all()
+            return render_template('admin/jobs.html', jobs=recent_jobs,
+                                maintenance_tasks=tasks.MAINTENANCE_TASKS,
+                                backups=backup.list_backups(),
+                                warmups=prewarm.status())
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in admin_jobs: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while managing jobs. Please try again.', 'danger')
+            return redirect(url_for('admin_dashboard'))
+
+    @app.route('/admin/jobs/<int:job_id>')
+    def job_status(job_id):
+        """API endpoint to poll the status of a background job"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        job = Job.query.get_or_404(job_id)
+        return jsonify(jobs.job_to_dict(job))
+
+    @app.route('/admin/limits')
+    def rate_limit_stats():
+        """API endpoint with this worker's rate limiter counters per endpoint"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        return jsonify(app.extensions['ratelimit'].snapshot())
+
+    @app.route('/admin/jobs/<int:job_id>/cancel', methods=['POST'])
+    def cancel_job(job_id):
+        """Cancel a queued job or ask a running one to stop"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            if jobs.cancel(job_id):
+                flash(f'Job #{job_id} cancelled.', 'success')
+            else:
+                flash(f'Job #{job_id} has already finished.', 'warning')
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in cancel_job: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while cancelling the job. Please try again.', 'danger')
+        return redirect(url_for('admin_jobs'))
+
+    @app.route('/admin/jobs/<int:job_id>/retry', methods=['POST'])
+    def retry_job(job_id):
+        """Requeue a failed or cancelled job"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            if jobs.retry(job_id):
+                flash(f'Job #{job_id} queued again.', 'success')
+            else:
+                flash('Only failed or cancelled jobs can be retried.', 'warning')
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in retry_job: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while retrying the job. Please try again.', 'danger')
+        return redirect(url_for('admin_jobs'))
+
+    @app.route('/admin/users/provision', methods=['GET', 'POST'])
+    def admin_provision_users():
+        """Upload a CSV or JSON file of students and create their accounts in the background"""
+        # Check if user is logged in and is an admin
+        if 'user_id' not in session or not session.get('is_admin'):
+            return redirect(url_for('login'))
+        
+        try:
+            if request.method == 'POST':
+                upload = request.files.get('file')
+                fmt = provisioning.format_of(upload.filename) if upload and upload.filename else None
+                if fmt is None:
+                    flash('Please choose a .csv or .json file.', 'danger')
+                    return redirect(url_for('admin_provision_users'))
+                
+                # The job reads the file from disk and deletes it when done
+                folder = provisioning.upload_folder()
+                os.makedirs(folder, exist_ok=True)
+                filename = f'{uuid.uuid4().hex}.{fmt}'
+                upload.save(os.path.join(folder, filename))
+                job = jobs.enqueue('provision_users', {'filename': filename, 'format': fmt}, max_attempts=1)
+                
+                flash(f'Provisioning job #{job.id} queued. Its report will be listed below when it is done.', 'success')
+                return redirect(url_for('admin_provision_users'))
+            
+            recent_jobs = Job.query.filter_by(kind='provision_users').order_by(Job.id.desc()).limit(20).all()
+            results = {job.id: json.loads(job.result) for job in recent_jobs if job.result}
+            return render_template('admin/provision.html', jobs=recent_jobs, results=results,
+                                   required_columns=provisioning.REQUIRED_COLUMNS,
+                                   optional_columns=provisioning.OPTIONAL_COLUMNS)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in admin_provision_users: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            flash('An error occurred while provisioning users. Please try again.', 'danger')
+            return redirect(url_for('admin_dashboard'))
+
     # API route to get chapters for a subject
     @app.route('/api/chapters/<int:subject_id>')
     def get_chapters(subject_id):
@@ -816,7 +1149,8 @@ def register_routes(app):
             return jsonify([])
         
         try:
-            chapters = Chapter.query.filter_by(subject_id=subject_id).all()
+            subject = catalog.get_catalog().subjects_by_id.get(subject_id)
+            chapters = subject.chapters if subject else ()
             chapters_data = [{'id': chapter.id, 'name': chapter.name} for chapter in chapters]
             
             return jsonify(chapters_data)
@@ -824,3 +1158,75 @@ def register_routes(app):
             app.logger.error(f"Error in get_chapters: {str(e)}")
             app.logger.error(traceback.format_exc())
             return jsonify([]), 500
+
+    # API route the quiz page sends its changed answers to while the quiz is taken
+    @app.route('/api/quizzes/<int:quiz_id>/answers', methods=['POST'])
+    @limited
+    def save_answers(quiz_id):
+        """Buffer answer changes for the user's open attempt; see autosave.py"""
+        # Check if user is logged in
+        if 'user_id' not in session:
+            return jsonify(error='Not logged in'), 401
+        
+        try:
+            quiz = catalog.get_catalog().quizzes_by_id.get(quiz_id)
+            attempt = question_pool.get_open_attempt(session['user_id'], quiz_id)
+            if quiz is None or attempt is None:
+                return jsonify(error='Quiz not started'), 404
+            
+            # The page sends {"answers": {"<question id>": option or null, ...}}
+            changes = autosave.parse_changes(attempt, (request.get_json(silent=True) or {}).get('answers'))
+            
+            # Saves after the deadline don't count, as with late submissions
+            if schedule.is_late(quiz, attempt):
+                return jsonify(error='Time is up', seconds_left=0), 409
+            if changes:
+                autosave.save(quiz, attempt, changes)
+            
+            # The page resets its timer from seconds_left
+            return jsonify(saved=len(changes), seconds_left=schedule.seconds_left(quiz, attempt))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        except Exception as e:
+            app.logger.error(f"Error in save_answers: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            return jsonify(error='Could not save the answers'), 500
+
+    # API route to get the questions (without answers) the quiz page renders
+    @app.route('/api/quizzes/<int:quiz_id>/questions')
+    @limited
+    def quiz_questions(quiz_id):
+        """Compact JSON payload of a quiz's questions, revalidated by ETag"""
+        # Check if user is logged in
+        if 'user_id' not in session:
+            return jsonify(error='Not logged in'), 401
+        
+        try:
+            quiz = catalog.get_catalog().quizzes_by_id.get(quiz_id)
+            if quiz is None:
+                return jsonify(error='Quiz not found'), 404
+            # Questions stay hidden until the quiz opens
+            if schedule.window_status(quiz) == 'upcoming':
+                return jsonify(error='Quiz not open yet'), 404
+            
+            # Only students taking the quiz get its questions
+            attempt = question_pool.get_open_attempt(session['user_id'], quiz_id)
+            if attempt is None:
+                return jsonify(error='Quiz not started'), 404
+            
+            if question_pool.is_pooled(quiz):
+                # Students only get the questions they drew, never the whole pool
+                body, etag = question_pool.attempt_payload(attempt)
+            else:
+                # The same for every student, so it is encoded once per quiz version
+                body, etag = question_pool.quiz_payload(quiz)
+            
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        except Exception as e:
+            app.logger.error(f"Error in quiz_questions: {str(e)}")
+            app.logger.error(traceback.format_exc())
+            return jsonify(error='Could not load the quiz'), 500
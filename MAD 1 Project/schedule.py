@@ -0,0 +1,195 @@
+# schedule.py
+# When quizzes can be taken and how long an attempt may last
+# A quiz opens at Quiz.date and closes at Quiz.closes_at (None keeps it open).
+# Quiz.duration_seconds is the time allowed per attempt; the HH:MM text in
+# Quiz.duration is kept in step for display. The user dashboard only loads
+# open and upcoming quizzes (an indexed range on closes_at), and attempts are
+# checked against the window and their own deadline on the server. Quizzes
+# created before closing times existed are closed when the column is added.
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, or_, select, text
+
+from extensions import db
+from models import Quiz
+import schema
+
+# Seconds after the deadline a submission is still accepted, for the browser's
+# automatic submit and its retries to arrive
+DEFAULT_SUBMIT_GRACE_SECONDS = 60
+
+# Accepted by the admin quiz forms: datetime-local inputs, or a plain date
+TIME_FORMATS = ('%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def parse_duration(value):
+    """
+    Turn an HH:MM duration into seconds.
+
+    Raises:
+        ValueError: If the value is not a positive HH:MM duration
+    """
+    hours, _, minutes = (value or '').strip().partition(':')
+    if not (hours.isdigit() and minutes.isdigit() and len(minutes) == 2):
+        raise ValueError('Duration must be given as HH:MM.')
+    seconds = int(hours) * 3600 + int(minutes) * 60
+    if seconds <= 0 or int(minutes) >= 60:
+        raise ValueError('Duration must be a time such as 00:30, with minutes below 60.')
+    return seconds
+
+
+def format_duration(seconds):
+    """Seconds as HH:MM"""
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}'
+
+
+def parse_time(value, field):
+    """
+    Parse a date or date and time from a form.
+
+    Returns:
+        datetime, or None if the value is empty
+
+    Raises:
+        ValueError: If the value can't be read
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+    raise ValueError(f'{field} must be a date and time.')
+
+
+def set_schedule(quiz, opens_at, closes_at, duration):
+    """
+    Validate and set a quiz's window and duration from the admin form.
+
+    Args:
+        quiz: Quiz to update
+        opens_at: Form value of the opening date (and time)
+        closes_at: Form value of the closing date and time, or empty to keep the quiz open
+        duration: HH:MM time allowed per attempt
+
+    Raises:
+        ValueError: With a message for the admin if a value is invalid
+    """
+    opens = parse_time(opens_at, 'Opening time')
+    if opens is None:
+        raise ValueError('Opening time is required.')
+    closes = parse_time(closes_at, 'Closing time')
+    if closes is not None and closes <= opens:
+        raise ValueError('The quiz must close after it opens.')
+    seconds = parse_duration(duration)
+    quiz.date = opens
+    quiz.closes_at = closes
+    quiz.duration_seconds = seconds
+    quiz.duration = format_duration(seconds)
+
+
+def window_status(quiz, now=None):
+    """'upcoming', 'open' or 'closed' for a Quiz or catalog QuizEntry"""
+    now = now or datetime.now()
+    if now < quiz.date:
+        return 'upcoming'
+    if quiz.closes_at is not None and now >= quiz.closes_at:
+        return 'closed'
+    return 'open'
+
+
+def current_quiz_ids(now=None):
+    """
+    Ids of the quizzes that are open or upcoming, soonest first.
+    Closed quizzes are skipped by the ix_quiz_window index, so this costs the
+    number of current quizzes however many closed ones have piled up.
+    """
+    now = now or datetime.now()
+    return db.session.execute(
+        select(Quiz.id)
+        .where(or_(Quiz.closes_at.is_(None), Quiz.closes_at > now))
+        .order_by(Quiz.date, Quiz.id)
+    ).scalars().all()
+
+
+def attempt_deadline(quiz, attempt):
+    """
+    When an attempt's time runs out: its duration after it started, or the
+    closing time if that comes first. None if neither applies. Attempts store
+    their deadline when they start, so later changes to the quiz don't move it.
+    """
+    if attempt.deadline is not None:
+        return attempt.deadline
+    deadlines = []
+    if quiz.duration_seconds:
+        deadlines.append(attempt.started_at + timedelta(seconds=quiz.duration_seconds))
+    if quiz.closes_at is not None:
+        deadlines.append(quiz.closes_at)
+    return min(deadlines) if deadlines else None
+
+
+def seconds_left(quiz, attempt, now=None):
+    """Whole seconds until the attempt's deadline (never negative), or None without a deadline"""
+    deadline = attempt_deadline(quiz, attempt)
+    if deadline is None:
+        return None
+    return max(0, int((deadline - (now or datetime.now())).total_seconds()))
+
+
+def is_late(quiz, attempt, now=None):
+    """Whether a submission for the attempt arrives after its deadline and grace period"""
+    deadline = attempt_deadline(quiz, attempt)
+    if deadline is None:
+        return False
+    grace = current_app.config.get('QUIZ_SUBMIT_GRACE_SECONDS', DEFAULT_SUBMIT_GRACE_SECONDS)
+    return (now or datetime.now()) > deadline + timedelta(seconds=grace)
+
+
+def backfill_durations(connection):
+    """
+    Fill duration_seconds from the HH:MM text for quizzes created before the
+    column existed. Durations that can't be read are left at 0 (no time limit).
+
+    Returns:
+        Number of quizzes updated
+    """
+    rows = connection.execute(text("SELECT id, duration FROM quiz WHERE duration_seconds = 0")).all()
+    updates = []
+    for quiz_id, duration in rows:
+        try:
+            updates.append({'id': quiz_id, 'seconds': parse_duration(duration)})
+        except ValueError:
+            continue
+    if updates:
+        connection.execute(text("UPDATE quiz SET duration_seconds = :seconds WHERE id = :id"), updates)
+    return len(updates)
+
+
+def backfill_closing_times(connection):
+    """
+    Close the quizzes created before closes_at existed, which never closed.
+    Their dates were stored without a time, so they open at midnight, and
+    duration_seconds is the time allowed per attempt rather than the window:
+    they close at the end of their opening day, or once an attempt started
+    at opening would have ended if that is later. Only run when the column
+    is added, so quizzes an admin leaves open on purpose afterwards stay open.
+
+    Returns:
+        Number of quizzes updated
+    """
+    return connection.execute(text(
+        "UPDATE quiz SET closes_at = max(datetime(date, 'start of day', '+1 day'), "
+        "datetime(date, '+' || duration_seconds || ' seconds')) "
+        "WHERE closes_at IS NULL")).rowcount
+
+
+# Runs after schema.py has added the new columns to an existing database
+@event.listens_for(db.metadata, 'after_create')
+def _backfill_durations_after_create(target, connection, **kw):
+    backfill_durations(connection)
+    if 'quiz.closes_at' in schema.columns_added(connection):
+        backfill_closing_times(connection)
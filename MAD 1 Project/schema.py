@@ -0,0 +1,69 @@
+# schema.py
+# Keeps existing SQLite databases in step with the models
+# db.create_all() only creates missing tables, so columns and indexes that were
+# added to a model after the database was created are added here
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from extensions import db
+
+
+def add_missing_columns(connection, metadata):
+    """
+    Add any model column that is missing from an existing table.
+    New NOT NULL columns must declare a server_default so existing rows get a value.
+
+    Args:
+        connection: SQLAlchemy connection to the database
+        metadata: MetaData holding the model tables
+
+    Returns:
+        List of "table.column" names that were added
+    """
+    inspector = inspect(connection)
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def add_missing_indexes(connection, metadata):
+    """
+    Create any model index that is missing from an existing table.
+
+    Returns:
+        List of index names that were created
+    """
+    inspector = inspect(connection)
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                added.append(index.name)
+    return added
+
+
+def columns_added(connection):
+    """The "table.column" names the latest db.create_all() on this connection added"""
+    return connection.info.get('added_columns', [])
+
+
+# Run on every db.create_all() so the app can start against an older database.
+# The added columns are kept on the connection for the backfills that run after this
+@event.listens_for(db.metadata, 'after_create')
+def _add_missing_columns_after_create(target, connection, **kw):
+    connection.info['added_columns'] = add_missing_columns(connection, target)
+    add_missing_indexes(connection, target)
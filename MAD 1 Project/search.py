@@ -0,0 +1,182 @@
+# search.py
+# Full-text search over subjects, chapters and the question bank
+# The index is an SQLite FTS5 virtual table kept in sync by database triggers,
+# so every write path (ORM, bulk deletes, raw SQL) updates it automatically
+
+from sqlalchemy import event, text
+
+from extensions import db
+
+# Each indexed row gets a rowid derived from its source table and primary key
+# (id * 4 + kind code), so triggers can update or delete an entry by rowid
+# instead of scanning the index
+KIND_CODES = {'subject': 1, 'chapter': 2, 'question': 3}
+
+# Results shown per page on the admin search screen
+PER_PAGE = 20
+
+# Column weights for bm25 ranking: kind, ref_id, title, body
+# A hit in the title (name / question text) counts more than one in the body
+RANK_WEIGHTS = '0.0, 0.0, 10.0, 2.0'
+
+_INDEX_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED,
+    ref_id UNINDEXED,
+    title,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# Source rows for each kind, as (rowid, kind, ref_id, title, body) selects
+_SUBJECT_ROW = "{p}.id * 4 + 1, 'subject', {p}.id, {p}.name, coalesce({p}.description, '')"
+_CHAPTER_ROW = "{p}.id * 4 + 2, 'chapter', {p}.id, {p}.name, coalesce({p}.description, '')"
+_QUESTION_ROW = ("{p}.id * 4 + 3, 'question', {p}.id, {p}.question_text, "
+                 "{p}.option1 || ' ' || {p}.option2 || ' ' || {p}.option3 || ' ' || {p}.option4")
+
+_SOURCES = [
+    ('subject', _SUBJECT_ROW),
+    ('chapter', _CHAPTER_ROW),
+    ('question', _QUESTION_ROW),
+]
+
+
+def _trigger_ddl():
+    """Build the insert/update/delete triggers for every indexed table"""
+    statements = []
+    for table, row in _SOURCES:
+        code = KIND_CODES[table]
+        insert = (f"INSERT INTO search_index(rowid, kind, ref_id, title, body) "
+                  f"VALUES ({row.format(p='new')});")
+        delete = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code};"
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS search_{table}_ai AFTER INSERT ON {table} "
+                          f"BEGIN {insert} END")
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS search_{table}_au AFTER UPDATE ON {table} "
+                          f"BEGIN {delete} {insert} END")
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS search_{table}_ad AFTER DELETE ON {table} "
+                          f"BEGIN {delete} END")
+    return statements
+
+
+def _index_exists(connection):
+    row = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    )).first()
+    return row is not None
+
+
+def create_search_index(connection):
+    """
+    Create the FTS5 table and its sync triggers if they don't exist yet.
+    A freshly created index is populated from the existing rows.
+
+    Args:
+        connection: SQLAlchemy connection to the SQLite database
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+    is_new = not _index_exists(connection)
+    connection.execute(text(_INDEX_DDL))
+    for statement in _trigger_ddl():
+        connection.execute(text(statement))
+    if is_new:
+        rebuild_search_index(connection)
+
+
+def rebuild_search_index(connection):
+    """
+    Repopulate the whole index from the source tables and merge its segments.
+
+    Args:
+        connection: SQLAlchemy connection to the SQLite database
+
+    Returns:
+        Number of indexed rows
+    """
+    connection.execute(text("DELETE FROM search_index"))
+    for table, row in _SOURCES:
+        connection.execute(text(
+            f"INSERT INTO search_index(rowid, kind, ref_id, title, body) "
+            f"SELECT {row.format(p=table)} FROM {table}"
+        ))
+    connection.execute(text("INSERT INTO search_index(search_index) VALUES ('optimize')"))
+    return connection.execute(text("SELECT count(*) FROM search_index")).scalar()
+
+
+# Build the index whenever db.create_all() creates the schema
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index_after_schema(target, connection, **kw):
+    create_search_index(connection)
+
+
+def build_match_query(raw_query):
+    """
+    Turn free text typed by an admin into a safe FTS5 MATCH expression.
+    Every word is quoted (so FTS5 operators are taken literally) and
+    prefix-matched, and all words must appear.
+
+    Returns:
+        The MATCH expression, or None if the input has no searchable words
+    """
+    terms = []
+    for word in (raw_query or '').split():
+        word = word.replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*')
+    return ' '.join(terms) or None
+
+
+def search(raw_query, page=1, per_page=PER_PAGE):
+    """
+    Run a ranked, paginated search over the index.
+
+    Args:
+        raw_query: Search text as typed by the user
+        page: 1-based page number
+        per_page: Number of results per page
+
+    Returns:
+        Tuple of (results, total) where results is a list of dicts with
+        kind, id, title, body and the ids needed to link to the admin pages
+    """
+    match = build_match_query(raw_query)
+    if match is None:
+        return [], 0
+
+    page = max(page, 1)
+    total = db.session.execute(
+        text("SELECT count(*) FROM search_index WHERE search_index MATCH :match"),
+        {'match': match}
+    ).scalar()
+
+    # Rank and paginate inside FTS5 first, then join only the page of hits
+    # back to their parents to get the ids used for links
+    rows = db.session.execute(text(f"""
+        SELECT hits.kind, hits.ref_id, hits.title, hits.body,
+               chapter.subject_id AS chapter_subject_id,
+               question.quiz_id AS question_quiz_id
+        FROM (
+            SELECT kind, ref_id, title, body, bm25(search_index, {RANK_WEIGHTS}) AS score
+            FROM search_index
+            WHERE search_index MATCH :match
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        ) AS hits
+        LEFT JOIN chapter ON hits.kind = 'chapter' AND chapter.id = hits.ref_id
+        LEFT JOIN question ON hits.kind = 'question' AND question.id = hits.ref_id
+        ORDER BY hits.score
+    """), {'match': match, 'limit': per_page, 'offset': (page - 1) * per_page}).mappings()
+
+    results = []
+    for row in rows:
+        results.append({
+            'kind': row['kind'],
+            'id': row['ref_id'],
+            'title': row['title'],
+            'body': row['body'],
+            'subject_id': row['chapter_subject_id'],
+            'quiz_id': row['question_quiz_id'],
+        })
+    return results, total
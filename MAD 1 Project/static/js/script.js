@@ -35,33 +35,194 @@ document.addEventListener("DOMContentLoaded", () => {
     })
   }
 
-  // Quiz timer
+  // Quiz: the page carries the attempt's question and option order, and the
+  // question text comes from the quiz's JSON payload, which the browser caches
+  // and revalidates by ETag. Changed answers are saved every few seconds, and
+  // the final answers are submitted as one JSON array.
   const timerElement = document.getElementById("quiz-timer")
   const quizForm = document.getElementById("quiz-form")
-  if (timerElement && quizForm) {
-    // Get duration from the timer element text (HH:MM)
-    const durationText = timerElement.textContent.trim()
-    const durationParts = durationText.split(":")
-
-    // Calculate total seconds (hours * 3600 + minutes * 60)
-    let timeLeft = Number.parseInt(durationParts[0]) * 3600 + Number.parseInt(durationParts[1]) * 60
-
-    const timer = setInterval(() => {
-      timeLeft--
-
-      if (timeLeft < 0) {
-        clearInterval(timer)
-        alert("Time's up! Your quiz will be submitted automatically.")
-        quizForm.submit()
-        return
+  if (quizForm) {
+    const layout = JSON.parse(document.getElementById("quiz-layout").textContent)
+    const questionsContainer = document.getElementById("quiz-questions")
+    const submitButton = document.getElementById("quiz-submit")
+    let submitted = false
+    // Seconds until the attempt's deadline; null for quizzes without a time limit
+    let timeLeft = timerElement ? Number.parseInt(timerElement.dataset.secondsLeft) : null
+    // Answers changed since the last save, question id -> option number
+    let changedAnswers = {}
+
+    // Retry after the server's Retry-After delay while it is rate limiting or busy
+    function fetchWithRetry(url, options, retriesLeft = 5) {
+      return fetch(url, options).then((response) => {
+        if ((response.status === 429 || response.status === 503) && retriesLeft > 0) {
+          const delay = (Number(response.headers.get("Retry-After")) || 1) * 1000
+          return new Promise((resolve) => setTimeout(resolve, delay)).then(() =>
+            fetchWithRetry(url, options, retriesLeft - 1),
+          )
+        }
+        if (!response.ok) throw new Error(response.statusText)
+        return response
+      })
+    }
+
+    function renderQuestion(question, number, total, optionOrder) {
+      const [questionId, text, options] = question
+      const card = document.createElement("div")
+      card.className = "card question-card"
+
+      const header = document.createElement("div")
+      header.className = "card-header"
+      const title = document.createElement("h5")
+      title.textContent = `Question ${number}/${total}`
+      header.appendChild(title)
+
+      const body = document.createElement("div")
+      body.className = "card-body"
+      const questionText = document.createElement("p")
+      questionText.className = "card-text"
+      questionText.textContent = text
+      body.appendChild(questionText)
+
+      optionOrder.forEach((optionNumber, index) => {
+        const inputId = `option${optionNumber}_${questionId}`
+        const wrapper = document.createElement("div")
+        wrapper.className = "form-check mb-2"
+        const input = document.createElement("input")
+        input.className = "form-check-input"
+        input.type = "radio"
+        input.name = `question_${questionId}`
+        input.id = inputId
+        input.value = optionNumber
+        input.required = index === 0
+        const label = document.createElement("label")
+        label.className = "form-check-label"
+        label.htmlFor = inputId
+        label.textContent = options[optionNumber - 1]
+        wrapper.append(input, label)
+        body.appendChild(wrapper)
+      })
+
+      card.append(header, body)
+      return card
+    }
+
+    function renderQuestions(payload) {
+      const questionsById = new Map(payload.questions.map((question) => [question[0], question]))
+      // Questions deleted since the attempt started are left out
+      const shown = layout.questions
+        .map((questionId, index) => [questionsById.get(questionId), layout.options[index]])
+        .filter(([question]) => question)
+      const fragment = document.createDocumentFragment()
+      shown.forEach(([question, optionOrder], index) => {
+        fragment.appendChild(renderQuestion(question, index + 1, shown.length, optionOrder))
+      })
+      questionsContainer.replaceChildren(fragment)
+      // Select the answers saved earlier in this attempt
+      Object.entries(layout.answers).forEach(([questionId, optionNumber]) => {
+        const input = quizForm.querySelector(`input[name="question_${questionId}"][value="${optionNumber}"]`)
+        if (input) input.checked = true
+      })
+      submitButton.disabled = false
+    }
+
+    // Send the answers changed since the last save. The server replies with the
+    // time left, which corrects the timer if this device's clock drifted
+    function saveAnswers(keepalive = false) {
+      const answers = changedAnswers
+      if (submitted || !Object.keys(answers).length) return
+      changedAnswers = {}
+      fetch(quizForm.dataset.answersUrl, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ answers }),
+        keepalive,
+      })
+        .then((response) => {
+          if (!response.ok) throw new Error(response.statusText)
+          return response.json()
+        })
+        .then((result) => {
+          if (timeLeft !== null && result.seconds_left !== null) timeLeft = result.seconds_left
+        })
+        .catch(() => {
+          // Try again with the next save, unless the answer changed again since
+          Object.entries(answers).forEach(([questionId, optionNumber]) => {
+            if (!(questionId in changedAnswers)) changedAnswers[questionId] = optionNumber
+          })
+        })
+    }
+
+    quizForm.addEventListener("change", (event) => {
+      if (event.target.name && event.target.name.startsWith("question_")) {
+        changedAnswers[event.target.name.slice("question_".length)] = Number(event.target.value)
       }
+    })
+    setInterval(saveAnswers, Number(quizForm.dataset.autosaveInterval) * 1000)
+    // Save before the tab is hidden or closed
+    document.addEventListener("visibilitychange", () => {
+      if (document.visibilityState === "hidden") saveAnswers(true)
+    })
 
-      const hours = Math.floor(timeLeft / 3600)
-      const minutes = Math.floor((timeLeft % 3600) / 60)
-      const seconds = timeLeft % 60
+    function submitAnswers() {
+      if (submitted) return
+      submitted = true
+      submitButton.disabled = true
+      // One option number per question in the attempt's order, 0 if unanswered
+      const answers = layout.questions.map((questionId) => {
+        const selected = quizForm.querySelector(`input[name="question_${questionId}"]:checked`)
+        return selected ? Number(selected.value) : 0
+      })
+      fetchWithRetry(quizForm.action, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ answers }),
+      })
+        .then((response) => response.json())
+        .then((result) => {
+          window.location.href = result.redirect
+        })
+        .catch(() => {
+          submitted = false
+          submitButton.disabled = false
+          alert("Your answers could not be submitted. Please check your connection and try again.")
+        })
+    }
+
+    quizForm.addEventListener("submit", (event) => {
+      event.preventDefault()
+      if (quizForm.checkValidity()) {
+        submitAnswers()
+      }
+    })
 
-      timerElement.textContent = `${hours.toString().padStart(2, "0")}:${minutes.toString().padStart(2, "0")}:${seconds.toString().padStart(2, "0")}`
-    }, 1000)
+    fetchWithRetry(quizForm.dataset.questionsUrl)
+      .then((response) => response.json())
+      .then(renderQuestions)
+      .catch(() => {
+        questionsContainer.innerHTML =
+          '<div class="alert alert-danger">The questions could not be loaded. Please reload the page.</div>'
+      })
+
+    // Count down to the attempt's deadline, which the server sends in seconds.
+    // Quizzes without a time limit have no timer
+    if (timerElement) {
+      const timer = setInterval(() => {
+        timeLeft--
+
+        if (timeLeft < 0) {
+          clearInterval(timer)
+          alert("Time's up! Your quiz will be submitted automatically.")
+          submitAnswers()
+          return
+        }
+
+        const hours = Math.floor(timeLeft / 3600)
+        const minutes = Math.floor((timeLeft % 3600) / 60)
+        const seconds = timeLeft % 60
+
+        timerElement.textContent = `${hours.toString().padStart(2, "0")}:${minutes.toString().padStart(2, "0")}:${seconds.toString().padStart(2, "0")}`
+      }, 1000)
+    }
   }
 
   // Role selection in registration
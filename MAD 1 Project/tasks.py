@@ -0,0 +1,102 @@
+# tasks.py
+# Background tasks that admin routes and CLI commands can enqueue as jobs
+# Each task takes a JobContext and returns a small JSON-serializable result
+# that is shown on the admin jobs page.
+
+import os
+
+from flask import current_app
+
+import archive
+import backup
+import db_routing
+import exports
+import jobs
+import provisioning
+import rollups
+import search
+
+# Task names and the labels shown when enqueuing them from the admin jobs page
+MAINTENANCE_TASKS = {
+    'rebuild_rollups': 'Rebuild daily rollups',
+    'rebuild_search_index': 'Rebuild search index',
+    'archive_scores': 'Archive old scores',
+    'backup_database': 'Back up the database',
+}
+
+
+@jobs.task('export_scores')
+def export_scores(context):
+    """
+    Write a quiz results export to the exports folder.
+    Params: format, and optional start, end (YYYY-MM-DD) and subject_id filters.
+    """
+    fmt = context.params.get('format', 'csv')
+    filters = exports.parse_filters(context.params)
+    folder = exports.export_folder()
+    os.makedirs(folder, exist_ok=True)
+    filename = exports.export_filename(fmt)
+    # Check for cancellation between chunks; a cancelled export leaves no file behind
+    size = exports.write_export(fmt, filters, os.path.join(folder, filename),
+                                on_chunk=context.check_cancelled)
+    return {'filename': filename, 'size': size}
+
+
+@jobs.task('rebuild_rollups')
+def rebuild_rollups(context):
+    """Recompute the daily attempt rollups from the score table"""
+    with db_routing.primary_engine().begin() as connection:
+        user_days, subject_days, user_chapters = rollups.rebuild_rollups(connection)
+    return {'user_subject_days': user_days, 'subject_days': subject_days, 'user_chapters': user_chapters}
+
+
+@jobs.task('rebuild_search_index')
+def rebuild_search_index(context):
+    """Rebuild the full-text search index"""
+    with db_routing.primary_engine().begin() as connection:
+        search.create_search_index(connection)
+        entries = search.rebuild_search_index(connection)
+    return {'entries': entries}
+
+
+@jobs.task('archive_scores')
+def archive_scores(context):
+    """
+    Move old scores into the archive.
+    Params: optional days (defaults to SCORE_ARCHIVE_AFTER_DAYS).
+    """
+    days = int(context.params.get('days') or current_app.config['SCORE_ARCHIVE_AFTER_DAYS'])
+    cutoff = archive.default_cutoff(days)
+    return {'archived': archive.archive_scores(cutoff), 'cutoff': cutoff.strftime('%Y-%m-%d')}
+
+
+@jobs.task('backup_database')
+def backup_database(context):
+    """Copy the database into the backup folder, verify it and drop old backups"""
+    # A cancelled backup stops between steps and leaves no file behind
+    return backup.create_backup(progress=lambda remaining, total: context.check_cancelled())
+
+
+@jobs.task('provision_users')
+def provision_users(context):
+    """
+    Create users from an uploaded file and write a report to the exports folder.
+    Params: filename (in the provisioning upload folder) and format.
+    The uploaded file holds passwords, so it is deleted however the job ends.
+    """
+    path = os.path.join(provisioning.upload_folder(), context.params['filename'])
+    try:
+        with open(path, 'rb') as f:
+            result = provisioning.provision_users(provisioning.read_rows(f, context.params['format']),
+                                                  on_chunk=context.check_cancelled)
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    folder = exports.export_folder()
+    os.makedirs(folder, exist_ok=True)
+    filename = provisioning.report_filename()
+    provisioning.write_report(result['report'], os.path.join(folder, filename))
+    return {'created': result['created'], 'skipped': result['skipped'], 'report': filename}
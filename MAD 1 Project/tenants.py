@@ -0,0 +1,291 @@
+# tenants.py
+# Per-institution databases
+# Each tenant (an institution or training customer) keeps its users, quizzes
+# and scores in its own database, so one tenant's exam-day write load never
+# waits on another tenant's write lock, and tenants can live on different
+# nodes. Requests without a tenant use the default database as before.
+#
+# - The tenant comes from the host (<slug>.TENANT_HOST_SUFFIX) or a path
+#   prefix (TENANT_PATH_PREFIX/<slug>/...). The prefix is moved into
+#   SCRIPT_NAME, so url_for() keeps generating links inside the tenant.
+# - Tenants are listed in the registry (the Tenant model on the "tenants"
+#   bind, by default a table in the default database) with their database URI.
+# - Each worker keeps a primary and a read-only engine per tenant in an LRU
+#   cache of TENANT_ENGINE_CACHE_SIZE tenants; the least recently used
+#   tenant's engines are disposed when the cache is full.
+# - A login is only valid for the tenant it was made in, and each tenant gets
+#   its own session cookie so users can be signed in to several at once.
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from flask import abort, current_app, g, has_app_context, request, session
+from flask.sessions import SecureCookieSessionInterface
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+
+from extensions import db
+from models import Tenant
+import db_routing
+
+TENANTS_BIND = 'tenants'
+
+# Tenant slugs are used in host names, URL paths and file names
+SLUG_PATTERN = re.compile(r'^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$')
+
+# WSGI environ key the middleware stores the requested tenant slug in
+ENVIRON_KEY = 'quiz_master.tenant'
+
+# slug -> TenantEngines, least recently used first
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+class TenantEngines:
+    """The primary and read-only engines of one tenant database"""
+
+    __slots__ = ('slug', 'primary', 'reader')
+
+    def __init__(self, slug, primary, reader):
+        self.slug = slug
+        self.primary = primary
+        self.reader = reader
+
+    def dispose(self):
+        # Connections checked out by requests still running are closed when returned
+        self.primary.dispose()
+        self.reader.dispose()
+
+
+class TenantMiddleware:
+    """
+    WSGI middleware that finds the tenant in the host or path before Flask sees
+    the request. Tenant path prefixes are moved from PATH_INFO to SCRIPT_NAME.
+    """
+
+    def __init__(self, wsgi_app, host_suffix=None, path_prefix=None):
+        self.wsgi_app = wsgi_app
+        self.host_suffix = host_suffix.lower() if host_suffix else None
+        self.path_prefix = path_prefix.rstrip('/') if path_prefix else None
+
+    def __call__(self, environ, start_response):
+        environ[ENVIRON_KEY] = self.resolve(environ)
+        return self.wsgi_app(environ, start_response)
+
+    def resolve(self, environ):
+        if self.path_prefix:
+            path = environ.get('PATH_INFO', '')
+            if path.startswith(self.path_prefix + '/'):
+                slug, _, rest = path[len(self.path_prefix) + 1:].partition('/')
+                if slug:
+                    environ['SCRIPT_NAME'] = f"{environ.get('SCRIPT_NAME', '')}{self.path_prefix}/{slug}"
+                    environ['PATH_INFO'] = '/' + rest
+                    return slug
+        if self.host_suffix:
+            host = environ.get('HTTP_HOST', '').split(':', 1)[0].lower()
+            if host.endswith(self.host_suffix) and len(host) > len(self.host_suffix):
+                return host[:-len(self.host_suffix)]
+        return None
+
+
+class TenantSessionInterface(SecureCookieSessionInterface):
+    """Signed cookie sessions with a separate cookie per tenant"""
+
+    def get_cookie_name(self, app):
+        name = super().get_cookie_name(app)
+        slug = request.environ.get(ENVIRON_KEY)
+        return f'{name}_{slug}' if slug else name
+
+
+def current():
+    """Slug of the active tenant, or None for the default database"""
+    if not has_app_context():
+        return None
+    return g.get('tenant')
+
+
+def _create_engines(slug, database_uri):
+    options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    primary = create_engine(database_uri, **options)
+    reader = create_engine(database_uri, **options)
+    db_routing.setup_primary(primary)
+    db_routing.setup_reader(reader)
+    return TenantEngines(slug, primary, reader)
+
+
+def get_engines(slug):
+    """
+    Return the engines of a tenant, creating them on first use.
+
+    Args:
+        slug: Tenant slug
+
+    Returns:
+        TenantEngines, or None if no such tenant is registered
+    """
+    with _engines_lock:
+        engines = _engines.get(slug)
+        if engines is not None:
+            _engines.move_to_end(slug)
+            return engines
+
+    if not SLUG_PATTERN.match(slug):
+        return None
+    with db.engines[TENANTS_BIND].connect() as connection:
+        database_uri = connection.execute(
+            select(Tenant.database_uri).where(Tenant.slug == slug)).scalar()
+    if database_uri is None:
+        return None
+
+    engines = _create_engines(slug, database_uri)
+    evicted = []
+    with _engines_lock:
+        if slug in _engines:
+            # Another thread got here first; keep its engines
+            evicted.append(engines)
+            engines = _engines[slug]
+            _engines.move_to_end(slug)
+        else:
+            _engines[slug] = engines
+            while len(_engines) > current_app.config['TENANT_ENGINE_CACHE_SIZE']:
+                evicted.append(_engines.popitem(last=False)[1])
+    for stale in evicted:
+        stale.dispose()
+    return engines
+
+
+def forget_engines(slug=None):
+    """Dispose of the cached engines of one tenant, or of every tenant"""
+    with _engines_lock:
+        if slug is None:
+            evicted = list(_engines.values())
+            _engines.clear()
+        else:
+            evicted = [_engines.pop(slug)] if slug in _engines else []
+    for engines in evicted:
+        engines.dispose()
+
+
+def active_tenants():
+    """Slugs of the tenants whose engines this worker has open"""
+    with _engines_lock:
+        return list(_engines)
+
+
+def activate(slug):
+    """
+    Point db.session and the db_routing engines at a tenant's database for the
+    rest of the current app context. None switches back to the default database.
+
+    Raises:
+        LookupError: If the tenant is not registered
+    """
+    if slug is None:
+        g.pop('tenant', None)
+        g.pop('tenant_engines', None)
+        return
+    engines = get_engines(slug)
+    if engines is None:
+        raise LookupError(f'Unknown tenant: {slug}')
+    g.tenant = slug
+    g.tenant_engines = engines
+
+
+def _activate_request_tenant():
+    slug = request.environ.get(ENVIRON_KEY)
+    if slug is not None:
+        try:
+            activate(slug)
+        except LookupError:
+            abort(404)
+    # Signed cookies are valid for every tenant, so tie each login to its tenant
+    if session.get('tenant') != slug:
+        session.clear()
+        if slug is not None:
+            session['tenant'] = slug
+
+
+def database_uri_for(slug):
+    """Database URI for a new tenant, from the TENANT_DATABASE_URI template"""
+    return current_app.config['TENANT_DATABASE_URI'].format(tenant=slug)
+
+
+def create_registry():
+    """Create the tenant registry table if it doesn't exist yet"""
+    db.create_all(bind_key=TENANTS_BIND)
+
+
+def create_all():
+    """db.create_all() for the active database: the tenant's, or the default one"""
+    engines = g.get('tenant_engines')
+    if engines is None:
+        db.create_all()
+    else:
+        migrate(engines)
+
+
+def migrate(engines):
+    """
+    Create missing tables in a tenant database. Like db.create_all() on the
+    default database this also adds new columns and indexes, builds the
+    search index and backfills the rollups and quiz durations.
+    """
+    db.metadata.create_all(engines.primary)
+
+
+def create_tenant(slug, name, database_uri=None):
+    """
+    Register a tenant and create its database.
+
+    Args:
+        slug: Subdomain / path prefix for the tenant
+        name: Institution name
+        database_uri: Where the tenant's data lives; defaults to TENANT_DATABASE_URI
+
+    Returns:
+        The new Tenant
+
+    Raises:
+        ValueError: If the slug is invalid or already taken
+    """
+    if not SLUG_PATTERN.match(slug):
+        raise ValueError('Tenant slugs may only contain lowercase letters, digits and hyphens.')
+    if db.session.execute(select(Tenant.id).where(Tenant.slug == slug)).first():
+        raise ValueError(f'Tenant {slug} already exists.')
+
+    database_uri = database_uri or database_uri_for(slug)
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite' and url.database:
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+
+    engines = _create_engines(slug, database_uri)
+    try:
+        migrate(engines)
+    finally:
+        engines.dispose()
+
+    tenant = Tenant(slug=slug, name=name, database_uri=database_uri)
+    db.session.add(tenant)
+    db.session.commit()
+    return tenant
+
+
+def configure(app):
+    """Add the tenant registry bind to the app config. Call before db.init_app(app)."""
+    app.config.setdefault('TENANT_ENGINE_CACHE_SIZE', 32)
+    app.config.setdefault('TENANT_DATABASE_URI',
+                          'sqlite:///' + os.path.join(app.instance_path, 'tenants', '{tenant}.db'))
+    registry_uri = app.config.get('TENANT_REGISTRY_URI') or app.config['SQLALCHEMY_DATABASE_URI']
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(TENANTS_BIND, registry_uri)
+
+
+def init_app(app):
+    """Resolve the tenant of every request. Call after db.init_app(app)."""
+    app.wsgi_app = TenantMiddleware(app.wsgi_app,
+                                    host_suffix=app.config.get('TENANT_HOST_SUFFIX'),
+                                    path_prefix=app.config.get('TENANT_PATH_PREFIX'))
+    app.session_interface = TenantSessionInterface()
+    app.before_request(_activate_request_tenant)
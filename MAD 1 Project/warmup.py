@@ -0,0 +1,69 @@
+# warmup.py
+# Faster first requests for new workers
+# Jinja compiles a template to Python the first time it is rendered, so a fresh
+# worker is slow on its first hit of every page. The compiled bytecode is kept
+# in TEMPLATE_CACHE_FOLDER, so only the first worker after a deploy compiles a
+# template and the rest load it from disk. With TEMPLATE_WARMUP set, each worker
+# also loads every template and builds the URL map at startup, before it takes
+# requests. precompile-templates fills the cache at deploy time.
+
+import os
+import time
+
+from flask import url_for
+from jinja2 import FileSystemBytecodeCache, TemplateError
+
+
+def init_app(app):
+    """Set up the bytecode cache and, if enabled, warm the worker up. Call after the routes are registered."""
+    app.config.setdefault('TEMPLATE_CACHE_FOLDER', os.path.join(app.instance_path, 'jinja_cache'))
+    app.config.setdefault('TEMPLATE_WARMUP', False)
+
+    folder = app.config['TEMPLATE_CACHE_FOLDER']
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder)
+
+    if app.config['TEMPLATE_WARMUP']:
+        warm_up(app)
+
+
+def precompile_templates(app):
+    """
+    Load every template, compiling it (or reading its bytecode) into the
+    environment's cache. Templates that fail to compile are logged and skipped
+    so one broken page doesn't stop the worker.
+
+    Returns:
+        Number of templates loaded
+    """
+    loaded = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        try:
+            app.jinja_env.get_template(name)
+            loaded += 1
+        except TemplateError as e:
+            app.logger.error(f"Could not compile template {name}: {str(e)}")
+    return loaded
+
+
+def build_url_map(app):
+    """Build the URL map's matcher now, rather than on the first request"""
+    app.url_map.update()
+    with app.test_request_context():
+        url_for('static', filename='css/style.css')
+
+
+def warm_up(app):
+    """
+    Precompile the templates and build the URL map.
+
+    Returns:
+        Tuple of (templates loaded, seconds taken)
+    """
+    start = time.perf_counter()
+    loaded = precompile_templates(app)
+    build_url_map(app)
+    elapsed = time.perf_counter() - start
+    app.logger.info(f"Warmed up {loaded} templates in {elapsed * 1000:.0f} ms")
+    return loaded, elapsed
@@ -0,0 +1,109 @@
+# conftest.py
+# Fixtures for the tests: the app on a fresh database, an admin and a student,
+# test clients logged in as each, and an open quiz
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MAD 1 Project')
+sys.path.insert(0, PROJECT_DIR)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    The app with its routes, on a database in tmp_path. The job runner,
+    prewarmer and backup threads aren't attached; tests run jobs with
+    jobs.run_pending().
+    """
+    from flask import Flask
+
+    from extensions import db
+    from models import User
+    from routes import register_routes
+    import autosave
+    import coherence
+    import db_routing
+    import ratelimit
+    import rollups  # noqa: F401
+    import schedule  # noqa: F401
+    import schema  # noqa: F401
+    import search  # noqa: F401
+    import tenants
+
+    app = Flask('quiz_master', root_path=PROJECT_DIR, instance_path=str(tmp_path))
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'test'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'quiz_master.db'}"
+    app.config['EXPORT_FOLDER'] = str(tmp_path / 'exports')
+    app.config['PROVISION_FOLDER'] = str(tmp_path / 'provisioning')
+    app.config['PROVISION_WORKERS'] = 0
+    app.config['RATE_LIMIT_ENABLED'] = False
+    db_routing.configure(app)
+    tenants.configure(app)
+    db.init_app(app)
+    db_routing.init_app(app)
+    tenants.init_app(app)
+    coherence.init_app(app)
+    ratelimit.init_app(app)
+    register_routes(app)
+    autosave.init_app(app)
+
+    with app.app_context():
+        db.create_all(bind_key=None)
+        db.session.add_all([
+            User(id=1, email='admin@example.com', password='x', full_name='Admin', qualification='',
+                 dob=datetime(1990, 1, 1), is_admin=True),
+            User(id=2, email='student@example.com', password='x', full_name='Student', qualification='',
+                 dob=datetime(2000, 1, 1), is_admin=False),
+        ])
+        db.session.commit()
+        # The caches are per process: drop whatever an earlier test's database left in them
+        coherence._seen.clear()
+        coherence.invalidate(coherence.EVERYTHING)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def logged_in(app, user_id, is_admin):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['is_admin'] = is_admin
+    return client
+
+
+@pytest.fixture
+def admin(app):
+    """Test client logged in as the admin"""
+    return logged_in(app, 1, True)
+
+
+@pytest.fixture
+def student(app):
+    """Test client logged in as the student"""
+    return logged_in(app, 2, False)
+
+
+@pytest.fixture
+def quiz(app):
+    """ID of a quiz that opened an hour ago and closes in a day, with three questions whose answer is option 1"""
+    from extensions import db
+    from models import Chapter, Question, Quiz, Subject
+
+    with app.app_context():
+        subject = Subject(name='Physics')
+        chapter = Chapter(name='Kinematics', subject=subject)
+        now = datetime.now()
+        quiz = Quiz(chapter=chapter, date=now - timedelta(hours=1), closes_at=now + timedelta(days=1),
+                    duration='01:00', duration_seconds=3600)
+        db.session.add_all([subject, chapter, quiz])
+        db.session.add_all([Question(quiz=quiz, question_text=f'Question {i}', option1='a', option2='b',
+                                     option3='c', option4='d', correct_option=1) for i in range(3)])
+        db.session.commit()
+        return quiz.id
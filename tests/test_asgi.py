@@ -0,0 +1,96 @@
+# test_asgi.py
+# Taking a quiz through the ASGI entry point, with the quiz endpoints on the event loop
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from extensions import db
+from models import QuizAttempt, Score
+import asgi
+import async_db
+import autosave
+
+
+def serve(app, *requests):
+    """Send (method, path, json) requests as the student through the ASGI app; returns the responses"""
+    cookie = app.session_interface.get_signing_serializer(app).dumps({'user_id': 2, 'is_admin': False})
+
+    async def send():
+        application = asgi.create_application(app)
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://quiz.test',
+                                     cookies={'session': cookie}) as client:
+            try:
+                responses = [await client.request(method, path, json=body) for method, path, body in requests]
+                # The queries went through the aiosqlite twin of the app's engine
+                assert {engine.url.drivername for engine in async_db._engines.values()} == {'sqlite+aiosqlite'}
+                # Every request gave back its turn to write
+                free = [slot for slot in async_db._writer_slots.values() if slot.acquire(blocking=False)]
+                for slot in free:
+                    slot.release()
+                assert len(free) == len(async_db._writer_slots)
+                return responses
+            finally:
+                await async_db.dispose()
+
+    return asyncio.run(send())
+
+
+@pytest.fixture(autouse=True)
+def served_on_the_event_loop(monkeypatch):
+    """Fail the test if a quiz endpoint ran on the WSGI adapter's threads"""
+    endpoints = []
+    serve_async = asgi.QuizMasterASGI._serve_async
+
+    async def recording(self, scope, receive, send):
+        endpoints.append(self.endpoint(scope))
+        await serve_async(self, scope, receive, send)
+
+    monkeypatch.setattr(asgi.QuizMasterASGI, '_serve_async', recording)
+    return endpoints
+
+
+def test_take_a_quiz_through_asgi(app, quiz, served_on_the_event_loop):
+    start, questions, save, submit = serve(
+        app,
+        ('GET', f'/user/quiz/{quiz}', None),
+        ('GET', f'/api/quizzes/{quiz}/questions', None),
+        ('POST', f'/api/quizzes/{quiz}/answers', {'answers': {}}),
+        ('POST', f'/user/submit_quiz/{quiz}', {'answers': [1, 1, 2]}),
+    )
+    assert start.status_code == 200
+    assert questions.status_code == 200 and len(questions.json()['questions']) == 3
+    assert save.status_code == 200
+    assert submit.json() == {'redirect': '/user/scores'}
+    assert served_on_the_event_loop == ['start_quiz', 'quiz_questions', 'save_answers', 'submit_quiz']
+    with app.app_context():
+        score = Score.query.one()
+        assert (score.score, score.total_questions) == (2, 3)
+        assert QuizAttempt.query.one().submitted_at is not None
+
+
+def test_saves_in_the_grace_period_are_written_through_asgi(app, quiz):
+    serve(app, ('GET', f'/user/quiz/{quiz}', None))
+    with app.app_context():
+        attempt = QuizAttempt.query.one()
+        question_ids = [str(question_id) for question_id in json.loads(attempt.question_ids)]
+        # Time ran out a few seconds ago, so saves are written at once instead of buffered
+        attempt.deadline = datetime.now() - timedelta(seconds=5)
+        db.session.commit()
+    [save] = serve(app, ('POST', f'/api/quizzes/{quiz}/answers',
+                         {'answers': {question_ids[0]: 1, question_ids[1]: 1}}))
+    assert save.json()['saved'] == 2
+    with app.app_context():
+        assert autosave.stored_answers(QuizAttempt.query.one()) == {question_ids[0]: 1, question_ids[1]: 1}
+
+    [submit] = serve(app, ('POST', f'/user/submit_quiz/{quiz}', {'answers': [1, 1, 2]}))
+    assert submit.json() == {'redirect': '/user/scores'}
+    with app.app_context():
+        assert Score.query.one().score == 2
@@ -0,0 +1,94 @@
+# test_attempts.py
+# Taking a quiz: starting an attempt, submitting it, and taking each quiz once
+
+import json
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from extensions import db
+from models import ArchivedScore, Question, QuizAttempt, Score
+import archive
+import coherence
+import recommendations
+
+from conftest import logged_in
+
+
+def take(student, quiz_id):
+    student.get(f'/user/quiz/{quiz_id}')
+    return student.post(f'/user/submit_quiz/{quiz_id}', json={'answers': [1, 1, 2]})
+
+
+def test_questions_need_an_open_attempt(student, quiz):
+    assert student.get(f'/api/quizzes/{quiz}/questions').status_code == 404
+    student.get(f'/user/quiz/{quiz}')
+    assert student.get(f'/api/quizzes/{quiz}/questions').status_code == 200
+
+
+def test_submit_records_score(app, student, quiz):
+    response = take(student, quiz)
+    assert response.get_json() == {'redirect': '/user/scores'}
+    with app.app_context():
+        score = Score.query.one()
+        assert (score.score, score.total_questions) == (2, 3)
+
+
+def test_archived_score_blocks_retake(app, student, quiz):
+    take(student, quiz)
+    with app.app_context():
+        assert archive.archive_scores(datetime.now() + timedelta(days=1)) == 1
+
+    # The quiz can't be started or submitted again, and isn't offered again
+    response = student.get(f'/user/quiz/{quiz}')
+    assert response.status_code == 302 and response.location.endswith('/user/dashboard')
+    response = student.post(f'/user/submit_quiz/{quiz}', json={'answers': [1, 1, 1]})
+    assert response.get_json() == {'redirect': '/user/dashboard'}
+    with app.app_context():
+        assert Score.query.count() == 0 and ArchivedScore.query.count() == 1
+        assert archive.has_attempted(2, quiz)
+        assert archive.attempted_quiz_ids(2, [quiz]) == {quiz}
+        assert recommendations.unattempted_quiz_ids(2) == []
+
+
+def test_concurrent_submits_record_one_score(app, quiz):
+    logged_in(app, 2, False).get(f'/user/quiz/{quiz}')
+    clients = [logged_in(app, 2, False) for _ in range(4)]
+    barrier = threading.Barrier(len(clients))
+    responses = []
+
+    def submit(client):
+        barrier.wait()
+        responses.append(client.post(f'/user/submit_quiz/{quiz}', json={'answers': [1, 1, 1]}).get_json())
+
+    threads = [threading.Thread(target=submit, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(response['redirect'] for response in responses) == ['/user/dashboard'] * 3 + ['/user/scores']
+    with app.app_context():
+        assert Score.query.count() == 1
+
+
+def test_questions_deleted_during_an_attempt_are_not_graded(app, admin, student, quiz):
+    student.get(f'/user/quiz/{quiz}')
+    with app.app_context():
+        question_id = Question.query.filter_by(quiz_id=quiz).first().id
+    admin.get(f'/admin/question/{question_id}/delete')
+    with app.app_context():
+        assert json.loads(QuizAttempt.query.one().removed_question_ids) == [question_id]
+
+    # Grading reads the attempt alone, even on a worker with nothing cached
+    with app.app_context():
+        coherence.invalidate(coherence.EVERYTHING)
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda connection, cursor, statement, *args: statements.append(statement))
+    student.post(f'/user/submit_quiz/{quiz}', json={'answers': [1, 1, 1]})
+    assert not [statement for statement in statements if re.search(r'FROM question\b', statement)]
+    with app.app_context():
+        score = Score.query.one()
+        assert (score.score, score.total_questions) == (2, 2)
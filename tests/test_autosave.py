@@ -0,0 +1,53 @@
+# test_autosave.py
+# Answers saved while a quiz is taken
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from extensions import db
+from models import QuizAttempt
+import autosave
+
+
+def open_attempt(app, student, quiz):
+    """Start the quiz; returns the attempt id and its question ids as strings"""
+    student.get(f'/user/quiz/{quiz}')
+    with app.app_context():
+        attempt = QuizAttempt.query.one()
+        return attempt.id, [str(question_id) for question_id in json.loads(attempt.question_ids)]
+
+
+def stored(app, attempt_id):
+    with app.app_context():
+        return autosave.stored_answers(db.session.get(QuizAttempt, attempt_id))
+
+
+def test_saves_are_buffered_until_flushed(app, student, quiz):
+    attempt_id, question_ids = open_attempt(app, student, quiz)
+    response = student.post(f'/api/quizzes/{quiz}/answers', json={'answers': {question_ids[0]: 2}})
+    assert response.get_json()['saved'] == 1
+    assert stored(app, attempt_id) == {}
+    app.extensions['autosave'].flush_all()
+    assert stored(app, attempt_id) == {question_ids[0]: 2}
+
+
+def test_saves_after_the_deadline_are_written_at_once(app, student, quiz):
+    attempt_id, question_ids = open_attempt(app, student, quiz)
+    with app.app_context():
+        # The attempt's time ran out a few seconds ago, within the grace period
+        db.session.get(QuizAttempt, attempt_id).deadline = datetime.now() - timedelta(seconds=5)
+        db.session.commit()
+    response = student.post(f'/api/quizzes/{quiz}/answers', json={'answers': {question_ids[0]: 3}})
+    assert response.status_code == 200
+    assert stored(app, attempt_id) == {question_ids[0]: 3}
+
+
+def test_flush_interval_must_be_shorter_than_grace_period():
+    app = Flask(__name__)
+    app.config['AUTOSAVE_FLUSH_SECONDS'] = 60
+    app.config['QUIZ_SUBMIT_GRACE_SECONDS'] = 30
+    with pytest.raises(ValueError):
+        autosave.init_app(app)
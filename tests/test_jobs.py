@@ -0,0 +1,121 @@
+# test_jobs.py
+# Background jobs: running, retrying and recovering jobs lost with their process
+
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Job
+import jobs
+
+
+@jobs.task('test_echo')
+def echo(context):
+    return context.params
+
+
+def running_job(app, attempts, max_attempts=3, heartbeat_age=600, cancel_requested=False):
+    """A job left running by a process that stopped heartbeat_age seconds ago"""
+    then = datetime.now() - timedelta(seconds=heartbeat_age)
+    with app.app_context():
+        job = Job(kind='test_echo', params='{"n": 1}', status='running', attempts=attempts,
+                  max_attempts=max_attempts, started_at=then, heartbeat_at=then,
+                  cancel_requested=cancel_requested)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def test_run_pending_runs_queued_job(app):
+    with app.app_context():
+        job = jobs.enqueue('test_echo', {'n': 1})
+        assert jobs.run_pending() == 1
+        db.session.refresh(job)
+        assert (job.status, job.result) == ('succeeded', '{"n": 1}')
+        assert job.heartbeat_at is not None
+
+
+def test_heartbeat_is_refreshed_while_running(app):
+    @jobs.task('test_slow')
+    def slow(context):
+        time.sleep(0.5)
+        return {}
+
+    app.config['JOB_LEASE_SECONDS'] = 0.2
+    with app.app_context():
+        job = jobs.enqueue('test_slow')
+        jobs.run_pending()
+        db.session.refresh(job)
+        assert job.status == 'succeeded'
+        assert job.heartbeat_at - job.started_at >= timedelta(seconds=0.3)
+
+
+def test_stale_running_job_is_requeued_and_run(app):
+    job_id = running_job(app, attempts=1)
+    with app.app_context():
+        assert jobs.run_pending() == 1
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.attempts) == ('succeeded', 2)
+
+
+def test_stale_job_out_of_attempts_fails(app):
+    job_id = running_job(app, attempts=3)
+    cancelled_id = running_job(app, attempts=1, cancel_requested=True)
+    with app.app_context():
+        assert jobs.requeue_stale() == 2
+        assert db.session.get(Job, job_id).status == 'failed'
+        assert db.session.get(Job, job_id).error == jobs.LOST_ERROR
+        assert db.session.get(Job, cancelled_id).status == 'cancelled'
+
+
+def test_job_with_recent_heartbeat_is_left_running(app):
+    job_id = running_job(app, attempts=1, heartbeat_age=10)
+    with app.app_context():
+        assert jobs.requeue_stale() == 0
+        assert db.session.get(Job, job_id).status == 'running'
+
+
+def test_run_taken_over_does_not_record_its_outcome(app):
+    @jobs.task('test_taken_over')
+    def taken_over(context):
+        # Meanwhile the job was found stale, requeued and claimed by another process
+        db.session.execute(db.update(Job).where(Job.id == context.job_id).values(attempts=Job.attempts + 1))
+        db.session.commit()
+        return {}
+
+    with app.app_context():
+        job = jobs.enqueue('test_taken_over')
+        jobs.run_pending()
+        db.session.refresh(job)
+        assert (job.status, job.attempts, job.result) == ('running', 2, None)
+
+
+def test_scheduled_task_only_looked_up_when_due(app):
+    statements = []
+    jobs.schedule('test_echo', 3600)
+    try:
+        with app.app_context():
+            @event.listens_for(db.engine, 'before_cursor_execute')
+            def count(connection, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            now = datetime.now()
+            assert jobs.queue_scheduled(now) == 1
+            statements.clear()
+            # Queued, so nothing to look up until the run could be due again
+            assert jobs.queue_scheduled(now + timedelta(minutes=5)) == 0
+            assert statements == []
+
+            # The queued run was lost with its process; it doesn't hold up the next one
+            job = Job.query.filter_by(kind='test_echo').one()
+            job.status, job.started_at, job.heartbeat_at = 'running', now, now
+            db.session.commit()
+            later = now + timedelta(hours=2)
+            assert jobs.queue_scheduled(later) == 1
+            assert Job.query.filter_by(kind='test_echo', status='queued').one().run_after == now + timedelta(hours=1)
+            event.remove(db.engine, 'before_cursor_execute', count)
+    finally:
+        del jobs._schedules['test_echo']
+        jobs._next_due.clear()
@@ -0,0 +1,47 @@
+# test_prewarm.py
+# Warming up the caches before a quiz opens
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from extensions import db
+from models import CacheWarmup, Quiz
+import coherence
+import prewarm
+
+
+@pytest.fixture
+def upcoming(app, quiz):
+    """The quiz, moved to open in five minutes"""
+    app.config['PREWARM_LEAD_MINUTES'] = 10
+    app.config['PREWARM_CHECK_SECONDS'] = 30
+    with app.app_context():
+        db.session.get(Quiz, quiz).date = datetime.now() + timedelta(minutes=5)
+        db.session.commit()
+        coherence.invalidate(coherence.EVERYTHING)
+    return quiz
+
+
+def test_old_records_are_pruned_when_nothing_is_due(app, quiz):
+    app.config['PREWARM_LEAD_MINUTES'] = 10
+    with app.app_context():
+        db.session.add(CacheWarmup(worker='other:1', quiz_id=quiz, warmed_at=datetime.now() - timedelta(days=2),
+                                   seconds=0.1))
+        db.session.commit()
+        assert prewarm.warm_due(app) == []
+        assert CacheWarmup.query.count() == 0
+
+
+def test_records_of_workers_that_stopped_checking_are_stale(app, upcoming):
+    with app.app_context():
+        now = datetime.now()
+        db.session.add(CacheWarmup(worker='other:1', quiz_id=upcoming, warmed_at=now - timedelta(minutes=4),
+                                   checked_at=now - timedelta(minutes=2), seconds=0.1))
+        db.session.commit()
+        assert prewarm.warm_due(app) == [upcoming]
+        # A later check finds the quiz cached and only stamps this worker's record
+        assert prewarm.warm_due(app, now + timedelta(minutes=1)) == []
+        [entry] = prewarm.status(now + timedelta(minutes=1))
+        assert [record.worker for record in entry['records']] == sorted(['other:1', prewarm.worker_name()])
+        assert entry['stale'] == {'other:1'}
@@ -0,0 +1,34 @@
+# test_provisioning.py
+# Bulk provisioning of student accounts from an uploaded file
+
+import io
+import os
+
+import jobs
+import provisioning
+import tasks  # noqa: F401
+from models import Job, User
+
+
+def upload(admin, content, filename):
+    return admin.post('/admin/users/provision', data={'file': (io.BytesIO(content), filename)},
+                      content_type='multipart/form-data')
+
+
+def test_import_creates_users_and_deletes_upload(app, admin):
+    upload(admin, b'email,full_name,password\nnew@example.com,New Student,secret\n', 'students.csv')
+    with app.app_context():
+        assert jobs.run_pending() == 1
+        assert Job.query.one().status == 'succeeded'
+        assert User.query.filter_by(email='new@example.com').count() == 1
+        assert os.listdir(provisioning.upload_folder()) == []
+
+
+def test_failed_import_deletes_upload(app, admin):
+    # Not valid JSON, so reading the rows fails
+    upload(admin, b'{"users": [', 'students.json')
+    with app.app_context():
+        assert os.listdir(provisioning.upload_folder()) != []
+        jobs.run_pending()
+        assert Job.query.one().status == 'failed'
+        assert os.listdir(provisioning.upload_folder()) == []
@@ -0,0 +1,29 @@
+# test_ratelimit.py
+# Token buckets kept in worker memory
+
+import ratelimit
+
+
+def test_memory_buckets_stay_within_the_limit(monkeypatch):
+    monkeypatch.setattr(ratelimit, 'MEMORY_BUCKET_LIMIT', 3)
+    buckets = ratelimit.MemoryBuckets()
+    for number in range(10):
+        assert buckets.take(f'user:{number}', 5, 0.001, 0)[0]
+    # The most recently used buckets are kept, still refilling
+    assert list(buckets._buckets) == ['user:7', 'user:8', 'user:9']
+
+
+def test_refilled_buckets_are_dropped(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: clock[0])
+    buckets = ratelimit.MemoryBuckets()
+    buckets.take('user:1', 5, 1, 0)
+    buckets.take('user:2', 5, 1, 0)
+    clock[0] += 2
+    buckets.take('user:3', 5, 1, 0)
+    assert list(buckets._buckets) == ['user:3']
+    # A user's bucket keeps its place while it is in use
+    clock[0] += 0.5
+    buckets.take('user:4', 5, 1, 0)
+    buckets.take('user:3', 5, 1, 0)
+    assert list(buckets._buckets) == ['user:4', 'user:3']
@@ -0,0 +1,47 @@
+# test_rollups.py
+# Running totals kept as scores are saved
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+from extensions import db
+from models import Chapter, Quiz, Score
+import db_routing
+import rollups
+
+
+def save_score(quiz_id, score, total_questions):
+    quiz = db.session.get(Quiz, quiz_id)
+    row = Score(user_id=2, quiz_id=quiz_id, score=score, total_questions=total_questions, timestamp=datetime.now())
+    db.session.add(row)
+    rollups.record_score(row, db.session.get(Chapter, quiz.chapter_id))
+    db.session.commit()
+
+
+def test_average_leaves_out_scores_without_questions(app, student, quiz):
+    with app.app_context():
+        save_score(quiz, 2, 3)
+        # A quiz whose questions were all removed is graded 0/0
+        save_score(quiz, 0, 0)
+        stats = rollups.user_stats(2)
+        assert (stats.attempts, stats.graded_attempts) == (2, 1)
+        assert round(stats.mean_percentage, 1) == 66.7
+        assert rollups.repair_user_stats() == 0
+
+        with db_routing.primary_engine().begin() as connection:
+            rollups.rebuild_rollups(connection)
+        db.session.expire_all()
+        assert rollups.user_stats(2).graded_attempts == 1
+    assert '67%' in student.get('/user/dashboard').get_data(as_text=True)
+
+
+def test_graded_attempts_are_counted_on_upgrade(app, quiz):
+    with app.app_context():
+        save_score(quiz, 1, 3)
+        save_score(quiz, 0, 0)
+        # user_stats as it was before graded attempts were counted
+        db.session.execute(text("ALTER TABLE user_stats DROP COLUMN graded_attempts"))
+        db.session.commit()
+        db.create_all(bind_key=None)
+        assert rollups.user_stats(2).graded_attempts == 1
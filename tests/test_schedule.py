@@ -0,0 +1,43 @@
+# test_schedule.py
+# Quiz windows on databases created before quizzes had closing times
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from extensions import db
+from models import Quiz
+import schedule
+
+
+def test_quizzes_from_before_closing_times_are_closed_on_upgrade(app):
+    # Quizzes used to be stored by date alone, so they open at midnight
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    past, upcoming = today - timedelta(days=30), today + timedelta(days=3)
+    with app.app_context():
+        # The quiz table as it was before closes_at was added
+        db.session.execute(text("DROP INDEX ix_quiz_window"))
+        db.session.execute(text("ALTER TABLE quiz DROP COLUMN closes_at"))
+        db.session.execute(text("INSERT INTO subject (id, name) VALUES (1, 'Subject')"))
+        db.session.execute(text("INSERT INTO chapter (id, name, subject_id) VALUES (1, 'Chapter', 1)"))
+        db.session.execute(text(
+            "INSERT INTO quiz (id, chapter_id, date, duration, duration_seconds) VALUES "
+            "(1, 1, :past, '01:30', 5400), (2, 1, :past, '', 0), "
+            "(3, 1, :upcoming, '00:10', 600), (4, 1, :upcoming, '30:00', 108000)"),
+            {'past': past.strftime('%Y-%m-%d'), 'upcoming': upcoming.strftime('%Y-%m-%d')})
+        db.session.commit()
+
+        db.create_all(bind_key=None)
+        # Open for the whole opening day, however short the time allowed per attempt
+        assert db.session.get(Quiz, 1).closes_at == past + timedelta(days=1)
+        assert db.session.get(Quiz, 2).closes_at == past + timedelta(days=1)
+        assert db.session.get(Quiz, 3).closes_at == upcoming + timedelta(days=1)
+        # Unless an attempt started at the opening would run past the end of the day
+        assert db.session.get(Quiz, 4).closes_at == upcoming + timedelta(hours=30)
+        assert schedule.current_quiz_ids() == [3, 4]
+
+        # Once the column exists, a quiz left open on purpose stays open
+        db.session.execute(text("UPDATE quiz SET closes_at = NULL WHERE id = 1"))
+        db.session.commit()
+        db.create_all(bind_key=None)
+        assert db.session.get(Quiz, 1).closes_at is None